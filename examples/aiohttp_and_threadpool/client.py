@@ -1,20 +1,37 @@
 # python client.py plus & python client.py save
+# load with the same requests for endpoints (one session, shared connector):
+# RATE=500 CONCURRENCY=32 python client.py load plus mult
 
 import asyncio
+import json
+import os
 import random
 import sys
 import typing
+from collections import Counter
 from time import monotonic
 
 import aiohttp
 import aiohttp.web
 
+from offload import Histogram
+
 REQUEST_COUNT = 1000
 DELAY = 0
 WORKER = 6
+DEBUG: bool = os.environ.get("DEBUG", "0") == "1"
 
 TARGET = "http://127.0.0.1:8080"
 
+# load mode: requests for each endpoint, requests/sec for all endpoints
+# (0 - without limit), requests at the same time, connections of connector
+LOAD_REQUESTS: int = int(os.environ.get("REQUESTS", REQUEST_COUNT))
+LOAD_RATE: float = float(os.environ.get("RATE", 0))
+LOAD_CONCURRENCY: int = int(os.environ.get("CONCURRENCY", 16))
+LOAD_CONNECTIONS: int = int(os.environ.get("CONNECTIONS", 16))
+LOAD_TIMEOUT: float = float(os.environ.get("TIMEOUT", 10))
+LOAD_SEED: int = int(os.environ.get("SEED", 1))
+
 
 async def run_requests(index: int, url: str):
     """Client requests.
@@ -49,11 +66,147 @@ async def run_requests(index: int, url: str):
     )
 
 
+class LoadStat:
+    """Latency of requests and errors by classes for one endpoint.
+    """
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.latencies: typing.List[float] = []
+        self.errors: typing.Counter[str] = Counter()
+        self.count = 0
+
+    def add(self, latency: float, error: str = None):
+        self.count += 1
+        if error:
+            self.errors[error] += 1
+        else:
+            self.latency.observe(latency)
+            self.latencies.append(latency)
+
+    def as_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+        last = len(latencies) - 1
+        percentiles = {
+            f"p{rate}": (
+                latencies[min(len(latencies) * rate // 100, last)]
+                if latencies else 0
+            )
+            for rate in (50, 90, 99)
+        }
+        return {
+            "count": self.count,
+            "ok": len(latencies),
+            "errors": dict(self.errors),
+            "latency": {**self.latency.as_dict(), **percentiles},
+        }
+
+
+def load_plan(
+    endpoints: typing.List[str], count: int, seed: int
+) -> typing.List[typing.Tuple[str, typing.Dict[str, str]]]:
+    """The same requests for each run with seed,
+    endpoints are interleaved.
+    """
+    rnd = random.Random(seed)
+    return [
+        (endpoint, {"x": str(rnd.random()), "y": str(rnd.random())})
+        for _ in range(count)
+        for endpoint in endpoints
+    ]
+
+
+async def send_request(
+    session: aiohttp.ClientSession,
+    url: str,
+    params: typing.Dict[str, str]
+) -> typing.Optional[str]:
+    """Error class of request (None for correct result).
+    """
+    try:
+        async with session.post(url, json=params) as resp:
+            if resp.status != aiohttp.web.HTTPOk.status_code:
+                await resp.read()
+                return f"http_{resp.status}"
+
+            new_data = await resp.json()
+            if "result" not in new_data:
+                return "bad_result"
+
+    except asyncio.TimeoutError:
+        return "timeout"
+    except aiohttp.ClientError as err:
+        return type(err).__name__
+
+    return None
+
+
+async def run_load(
+    endpoints: typing.List[str],
+    count: int = LOAD_REQUESTS,
+    rate: float = LOAD_RATE,
+    concurrency: int = LOAD_CONCURRENCY,
+    connections: int = LOAD_CONNECTIONS,
+    seed: int = LOAD_SEED,
+    target: str = TARGET
+) -> typing.Dict[str, dict]:
+    """Requests of load_plan by concurrency tasks with one session,
+    start of request i is not earlier than i / rate sec from start
+    and its latency is counted from this time.
+    """
+    plan = load_plan(endpoints, count, seed)
+    stats = {endpoint: LoadStat() for endpoint in endpoints}
+    position = 0
+    connector = aiohttp.TCPConnector(limit=connections)
+    timeout = aiohttp.ClientTimeout(total=LOAD_TIMEOUT)
+    start = monotonic()
+
+    async def worker(session: aiohttp.ClientSession):
+        nonlocal position
+        while position < len(plan):
+            index = position
+            position += 1
+            request_start = monotonic()
+            if rate:
+                # latency from scheduled start (with wait of free task)
+                request_start = start + index / rate
+                delay = request_start - monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            endpoint, params = plan[index]
+            error = await send_request(
+                session, f"{target}/{endpoint}", params
+            )
+            stats[endpoint].add(monotonic() - request_start, error)
+
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout
+    ) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+
+    spent = monotonic() - start
+    result = {
+        endpoint: stat.as_dict() for endpoint, stat in stats.items()
+    }
+    result["total"] = {
+        "requests": len(plan),
+        "time": spent,
+        "rate": len(plan) / spent if spent else 0,
+    }
+    return result
+
+
 async def main():
     """
     """
     loop = asyncio.get_running_loop()
-    loop.set_debug(True)
+    loop.set_debug(DEBUG)
+
+    if sys.argv[1:2] == ["load"]:
+        result = await run_load(sys.argv[2:] or ["plus", "mult"])
+        print(json.dumps(result, indent=2))
+        return
 
     coroutines: list = []
     *_, method = sys.argv
@@ -66,4 +219,5 @@ async def main():
     await asyncio.gather(*coroutines)
 
 
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
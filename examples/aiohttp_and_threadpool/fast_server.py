@@ -1,15 +1,23 @@
 # python -m aiohttp.web -H localhost -P 8080 fast_server:run
+# WORKER=4 PROCESSES=2 MAX_QUEUE=64 \
+#     python -m aiohttp.web -H localhost -P 8080 fast_server:run
+# curl localhost:8080/metrics
 
-import asyncio
+import math
 import os
 import time
 import typing
-from concurrent.futures import ThreadPoolExecutor
 
 from aiohttp import web
 
-WITH_DELAY: bool = True
-WORKER: int = 4
+from offload import Offload, Overloaded
+
+WITH_DELAY: bool = os.environ.get("WITH_DELAY", "1") == "1"
+# threads and processes of offload (processes by default - count of cores)
+WORKER: int = int(os.environ.get("WORKER", 4))
+PROCESSES: int = int(os.environ.get("PROCESSES", 0))
+# tasks in queue of pool before response 503
+MAX_QUEUE: int = int(os.environ.get("MAX_QUEUE", 64))
 
 
 def mult_sync_data(data: typing.Dict[str, str]) -> float:
@@ -37,44 +45,53 @@ class PlusDataView(web.View):
 
 
 class MultDataView(web.View):
-    """Handler with execution in thread.
+    """Handler with execution by offload (inline, in thread or process).
     """
 
-    loop = None
-    executor = None
-
     async def post(self):
         request = self.request
-        if self.loop is None:
-            self.loop = asyncio.get_running_loop()
-
-        executor: ThreadPoolExecutor = request.app["thread_executor"]
-        result = await self.loop.run_in_executor(
-            executor, mult_sync_data, dict(await request.json())
-        )
+        offload: Offload = request.app["offload"]
+        try:
+            result = await offload.run(
+                mult_sync_data, dict(await request.json())
+            )
+        except Overloaded as err:
+            raise web.HTTPServiceUnavailable(
+                headers={"Retry-After": str(math.ceil(err.retry_after))},
+                text=str(err)
+            )
 
         return web.json_response({"result": result})
 
 
+class MetricsView(web.View):
+    """Histograms of queue wait and execution by pools.
+    """
+
+    async def get(self):
+        return web.json_response(self.request.app["offload"].metrics())
+
+
 async def on_start(app):
     pid = os.getpid()
     print(f"server {pid}")
 
 
 async def on_down(app):
-    executor: ThreadPoolExecutor = app["thread_executor"]
-    executor.shutdown()
+    offload: Offload = app["offload"]
+    offload.shutdown()
 
 
 def run(argv):
     app = web.Application()
-    app["thread_executor"] = ThreadPoolExecutor(
-        max_workers=WORKER, thread_name_prefix="support_"
+    app["offload"] = Offload(
+        threads=WORKER, processes=PROCESSES or None, max_queue=MAX_QUEUE
     )
 
     app.router.add_routes([
         web.view("/plus", PlusDataView),
         web.view("/mult", MultDataView),
+        web.view("/metrics", MetricsView),
     ])
     app.on_startup.append(on_start)
     app.on_cleanup.append(on_down)
@@ -0,0 +1,248 @@
+"""Offload of sync handlers work: inline, thread pool or process pool
+by measured time of work, with limit of queue for each pool.
+
+In [1]: offload = Offload(threads=4, processes=2)
+
+In [2]: await offload.run(mult_sync_data, {"x": "2", "y": "3"})
+Out[2]: 6.0
+
+In [3]: offload.metrics()["pools"]["thread"]["execution"]["count"]
+Out[3]: 1
+"""
+import asyncio
+import bisect
+import os
+import time
+import typing
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+AUTO = "auto"
+
+# seconds, the last bucket is for all other values
+HISTOGRAM_BOUNDS: typing.Tuple[float, ...] = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5
+)
+
+
+class Overloaded(Exception):
+    """Queue of pool is full, request should be repeated later.
+    """
+
+    def __init__(self, pool: str, retry_after: float):
+        super().__init__(f"Pool {pool} is overloaded")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class Histogram:
+    """Counts of values by HISTOGRAM_BOUNDS.
+    """
+
+    def __init__(self, bounds: typing.Sequence[float] = HISTOGRAM_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def as_dict(self) -> dict:
+        return {
+            "buckets": {
+                **{
+                    f"le_{bound}": count
+                    for bound, count in zip(self.bounds, self.counts)
+                },
+                "le_inf": self.counts[-1],
+            },
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+        }
+
+
+def timed_call(
+    func: typing.Callable, args: tuple
+) -> typing.Tuple[typing.Any, float, float, float]:
+    """Result, start time, execution time and CPU time of func
+    (in thread or process of pool).
+    """
+    start = time.monotonic()
+    cpu_start = time.thread_time()
+    result = func(*args)
+    cpu = time.thread_time() - cpu_start
+    return result, start, time.monotonic() - start, cpu
+
+
+class Pool:
+    """Executor with count of tasks in work and histograms.
+    """
+
+    def __init__(self, name: str, executor: Executor, workers: int):
+        self.name = name
+        self.executor = executor
+        self.workers = workers
+        self.in_flight = 0
+        self.rejected = 0
+        self.queue_wait = Histogram()
+        self.execution = Histogram()
+
+    @property
+    def queue_size(self) -> int:
+        return max(self.in_flight - self.workers, 0)
+
+    def as_dict(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_size": self.queue_size,
+            "rejected": self.rejected,
+            "queue_wait": self.queue_wait.as_dict(),
+            "execution": self.execution.as_dict(),
+        }
+
+
+class HandlerStat:
+    """Moving averages of execution time and CPU share of one function.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.execution = 0.0
+        self.cpu_share = 0.0
+        self.modes: typing.Dict[str, int] = {}
+
+    def update(self, mode: str, execution: float, cpu: float, rate: float):
+        share = min(cpu / execution, 1.0) if execution > 0 else 0.0
+        if self.calls:
+            self.execution += rate * (execution - self.execution)
+            self.cpu_share += rate * (share - self.cpu_share)
+        else:
+            self.execution = execution
+            self.cpu_share = share
+
+        self.calls += 1
+        self.modes[mode] = self.modes.get(mode, 0) + 1
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "execution": self.execution,
+            "cpu_share": self.cpu_share,
+            "modes": dict(self.modes),
+        }
+
+
+class Offload:
+    """Run sync functions of handlers:
+    quick work (mean time under inline_limit) in event loop,
+    work with CPU share over cpu_limit in process pool,
+    other work (blocking I/O) in thread pool.
+    The first warmup calls of function are measured in thread pool,
+    Overloaded is raised if queue of pool is over max_queue.
+    """
+
+    def __init__(
+        self,
+        threads: int = 4,
+        processes: int = None,
+        max_queue: int = 64,
+        inline_limit: float = 0.0005,
+        cpu_limit: float = 0.5,
+        warmup: int = 5,
+        rate: float = 0.1
+    ):
+        processes = processes or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.inline_limit = inline_limit
+        self.cpu_limit = cpu_limit
+        self.warmup = warmup
+        self.rate = rate
+        self.pools: typing.Dict[str, Pool] = {
+            INLINE: Pool(INLINE, None, 1),
+            THREAD: Pool(
+                THREAD,
+                ThreadPoolExecutor(
+                    max_workers=threads, thread_name_prefix="support_"
+                ),
+                threads
+            ),
+            PROCESS: Pool(
+                PROCESS, ProcessPoolExecutor(max_workers=processes), processes
+            ),
+        }
+        self.stats: typing.Dict[str, HandlerStat] = {}
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            if pool.executor is not None:
+                pool.executor.shutdown()
+
+    def choose(self, name: str) -> str:
+        stat = self.stats.get(name)
+        if stat is None or stat.calls < self.warmup:
+            return THREAD
+
+        if stat.execution < self.inline_limit:
+            return INLINE
+
+        if stat.cpu_share > self.cpu_limit:
+            return PROCESS
+
+        return THREAD
+
+    async def run(
+        self, func: typing.Callable, *args, mode: str = AUTO
+    ) -> typing.Any:
+        """Result of func(*args) by mode (AUTO - by measured time).
+        """
+        name = f"{func.__module__}.{func.__qualname__}"
+        if mode == AUTO:
+            mode = self.choose(name)
+
+        pool = self.pools[mode]
+        if pool.executor is not None and pool.queue_size >= self.max_queue:
+            pool.rejected += 1
+            stat = self.stats.get(name)
+            raise Overloaded(
+                mode,
+                stat.execution * pool.queue_size / pool.workers if stat else 1
+            )
+
+        submit_time = time.monotonic()
+        pool.in_flight += 1
+        try:
+            if pool.executor is None:
+                result, start, execution, cpu = timed_call(func, args)
+            else:
+                loop = asyncio.get_running_loop()
+                result, start, execution, cpu = await loop.run_in_executor(
+                    pool.executor, timed_call, func, args
+                )
+        finally:
+            pool.in_flight -= 1
+
+        pool.queue_wait.observe(max(start - submit_time, 0))
+        pool.execution.observe(execution)
+        self.stats.setdefault(name, HandlerStat()).update(
+            mode, execution, cpu, self.rate
+        )
+        return result
+
+    def metrics(self) -> dict:
+        return {
+            "pools": {
+                name: pool.as_dict() for name, pool in self.pools.items()
+            },
+            "handlers": {
+                name: {**stat.as_dict(), "mode": self.choose(name)}
+                for name, stat in self.stats.items()
+            },
+        }
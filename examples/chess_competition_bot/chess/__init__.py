@@ -31,3 +31,4 @@
 #1   ♔♖ ♗♘♖
 
 from .game import Game
+from .replay import replay_games
@@ -0,0 +1,88 @@
+"""Bounded cache of positions by Zobrist hash (see Game.position_hash).
+
+In [1]: from chess.cache import PositionCache
+
+In [2]: cache = PositionCache(max_size=100000)
+
+In [3]: @cache.memoize
+   ...: def evaluate(game):
+   ...:     return len(game.legal_moves())
+
+In [4]: evaluate(game), cache
+Out[4]: (20, PositionCache size: 1/100000 hits: 0 misses: 1)
+"""
+import functools
+import typing
+from collections import OrderedDict
+
+_EMPTY = object()
+
+
+class PositionCache:
+    """LRU cache for values of positions, can be shared between games.
+    """
+
+    max_size: int
+    hits: int
+    misses: int
+    data: typing.MutableMapping[typing.Hashable, typing.Any]
+
+    def __init__(self, max_size: int = 2 ** 16):
+        assert max_size > 0
+        self.max_size = max_size
+        self.hits = self.misses = 0
+        self.data = OrderedDict()
+
+    def __repr__(self) -> str:
+        return (
+            f"PositionCache size: {len(self)}/{self.max_size} "
+            f"hits: {self.hits} misses: {self.misses}"
+        )
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        return key in self.data
+
+    def get(
+        self, key: typing.Hashable, default: typing.Any = None
+    ) -> typing.Any:
+        """Value of position, it becomes the latest used.
+        """
+        value = self.data.get(key, _EMPTY)
+        if value is _EMPTY:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.data.move_to_end(key)
+        return value
+
+    def set(self, key: typing.Hashable, value: typing.Any):
+        """Save value of position, the oldest used is removed on overflow.
+        """
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+        self.hits = self.misses = 0
+
+    def memoize(self, method: typing.Callable) -> typing.Callable:
+        """Decorator for evaluation functions of game position.
+        """
+
+        @functools.wraps(method)
+        def wrapper(game, *args):
+            key = (game.position_hash, *args)
+            value = self.get(key, _EMPTY)
+            if value is _EMPTY:
+                value = method(game, *args)
+                self.set(key, value)
+
+            return value
+
+        return wrapper
@@ -1,5 +1,6 @@
+import functools
+import random
 import typing
-from copy import deepcopy
 from enum import Enum
 from enum import IntEnum
 
@@ -18,6 +19,13 @@ X_NANES = {
 
 NAME_X_INDEX = {key: val for val, key in X_NANES.items()}
 
+
+def cell_name(x: int, y: int) -> str:
+    """Name of cell by location (0, 0) -> "a1".
+    """
+    return f"{NAME_X_INDEX.get(x)}{y + 1}"
+
+
 CODES: typing.Dict[typing.Tuple[str, ColorEnum], str] = {
     ("queen", ColorEnum.RED): "♛",
     ("queen", ColorEnum.WHITE): "♕",
@@ -88,9 +96,7 @@ class BasePiece:
         return True
 
     def __repr__(self) -> str:
-        x, y = self.location
-        x_name = NAME_X_INDEX.get(x)
-        loc = f"{x_name}{y + 1}"
+        loc = cell_name(*self.location)
         return f"{self.name} - {self.code} {loc}"
 
     def __hash__(self) -> int:
@@ -134,6 +140,47 @@ class BasePiece:
 
         return way
 
+    def get_rays(
+        self, strike: bool = False
+    ) -> typing.Tuple[typing.Tuple[typing.Tuple[int, int], ...], ...]:
+        """Cells for each direction of piece (without start location),
+        limited by board only.
+        """
+        return piece_rays(self.__class__, self.color, self.location, strike)
+
+
+@functools.lru_cache(maxsize=None)
+def piece_rays(
+    piece_class: type,
+    color: ColorEnum,
+    location: typing.Tuple[int, int],
+    strike: bool
+) -> typing.Tuple[typing.Tuple[typing.Tuple[int, int], ...], ...]:
+    """Rays of BasePiece.get_rays, the same for each piece class,
+    color and location.
+    """
+    directions = piece_class.strike if strike else piece_class.step
+    rays = []
+    for direction, max_steps in directions.items():
+        delta_x, delta_y = direction.value
+        if color != ColorEnum.WHITE:
+            delta_x, delta_y = -delta_x, -delta_y
+
+        cur_x, cur_y = location
+        ray = []
+        for _ in range(max_steps):
+            cur_x += delta_x
+            cur_y += delta_y
+            if cur_y < 0 or cur_x < 0 or cur_y >= SIZE or cur_x >= SIZE:
+                break
+
+            ray.append((cur_x, cur_y))
+
+        if ray:
+            rays.append(tuple(ray))
+
+    return tuple(rays)
+
 
 class Pawn(BasePiece):
     """Pawns
@@ -223,14 +270,36 @@ class Knight(BasePiece):
     }
 
 
+# same keys in all processes, hashes can be stored and compared between runs
+ZOBRIST_SEED: int = 1024
+_zobrist_random = random.Random(ZOBRIST_SEED)
+ZOBRIST_KEYS: typing.Dict[typing.Tuple[str, ColorEnum], typing.List[int]] = {
+    key: [_zobrist_random.getrandbits(64) for _ in range(SIZE * SIZE)]
+    for key in CODES
+}
+ZOBRIST_RED_MOVES: int = _zobrist_random.getrandbits(64)
+
+
+def zobrist_key(piece: BasePiece) -> int:
+    """Random key for piece in its location.
+    """
+    x, y = piece.location
+    return ZOBRIST_KEYS[piece.name, piece.color][x * SIZE + y]
+
+
 class PieceSet:
     """Container for pieces access.
+    Pieces should be moved via the set to keep index and position hash.
     """
 
     content: typing.List[BasePiece]
+    index: typing.Dict[typing.Tuple[int, int], BasePiece]
+    zobrist: int
 
     def __init__(self, data: list = []):
         self.content = []
+        self.index = {}
+        self.zobrist = 0
         for piece in data:
             self.append(piece)
 
@@ -251,32 +320,54 @@ class PieceSet:
 
     def copy(self):
         data = self.__class__(data=[])
-        data.content = deepcopy(self.content)
+        # pieces have no state except location
+        data.content = [
+            piece.__class__(piece.color, *piece.location)
+            for piece in self.content
+        ]
+        data.index = {piece.location: piece for piece in data.content}
+        data.zobrist = self.zobrist
         return data
 
     def append(self, piece: BasePiece):
-        assert hash(piece) not in (hash(item) for item in self.content)
+        assert piece.location not in self.index
         self.content.append(piece)
+        self.index[piece.location] = piece
+        self.zobrist ^= zobrist_key(piece)
+
+    def insert(self, position: int, piece: BasePiece):
+        """Return removed piece to its position in content.
+        """
+        assert piece.location not in self.index
+        self.content.insert(position, piece)
+        self.index[piece.location] = piece
+        self.zobrist ^= zobrist_key(piece)
+
+    def move(self, piece: BasePiece, x: int, y: int) -> bool:
+        """Move piece to free location.
+        """
+        loc = piece.location
+        key = zobrist_key(piece)
+        if not piece.move(x, y):
+            return False
+
+        del self.index[loc]
+        self.index[piece.location] = piece
+        self.zobrist ^= key ^ zobrist_key(piece)
+        return True
 
     def remove(self, x: int, y: int):
         """Delete piece by location.
         """
-        loc = (x, y)
-        target = None
-        for piece in self.content:
-            if loc == piece.location:
-                target = piece
-
+        target = self.index.pop((x, y), None)
         if target:
             self.content.remove(target)
+            self.zobrist ^= zobrist_key(target)
 
     def get_piece(self, x: int, y: int) -> typing.Optional[BasePiece]:
         """Get piece by location.
         """
-        loc = (x, y)
-        for piece in self.content:
-            if loc == piece.location:
-                return piece
+        return self.index.get((x, y))
 
     def get_teams(
         self
@@ -1,9 +1,11 @@
 import typing
 import uuid
+from collections import Counter
 from datetime import datetime
 
 from .common import NAME_X_INDEX
 from .common import SIZE
+from .common import ZOBRIST_RED_MOVES
 from .common import BasePiece
 from .common import Bishop
 from .common import ColorEnum
@@ -13,6 +15,7 @@ from .common import Pawn
 from .common import PieceSet
 from .common import Queen
 from .common import Rook
+from .common import cell_name
 
 default_pieces = PieceSet([
     Rook(ColorEnum.WHITE, 0, 0), Rook(ColorEnum.WHITE, 7, 0),
@@ -105,8 +108,8 @@ class Rule:
                 for t_x, t_y in way if t_x != x and t_x != r_x
             ))
             if not check and result:
-                king.move(x - 2, y)
-                rook.move(x - 1, y)
+                self.pieces.move(king, x - 2, y)
+                self.pieces.move(rook, x - 1, y)
 
         return result
 
@@ -123,11 +126,124 @@ class Rule:
                 for t_x, t_y in way if t_x != x and t_x != r_x
             ))
             if not check and result:
-                king.move(x + 2, y)
-                rook.move(x + 1, y)
+                self.pieces.move(king, x + 2, y)
+                self.pieces.move(rook, x + 1, y)
 
         return result
 
+    def piece_strikes(
+        self, piece: BasePiece
+    ) -> typing.Iterator[typing.Tuple[int, int]]:
+        """Locations of enemies available for strike of piece.
+        """
+        occupied = self.pieces.index
+        for ray in piece.get_rays(strike=True):
+            for location in ray:
+                target = occupied.get(location)
+                if target is None:
+                    continue
+
+                if target.color != piece.color:
+                    yield location
+
+                break
+
+    def piece_targets(
+        self, piece: BasePiece
+    ) -> typing.Iterator[typing.Tuple[int, int]]:
+        """Locations available for piece by same rules as in move.
+        """
+        occupied = self.pieces.index
+        for ray in piece.get_rays():
+            for location in ray:
+                if location in occupied:
+                    break
+
+                yield location
+
+        yield from self.piece_strikes(piece)
+
+    def is_attacked(self, color: ColorEnum) -> bool:
+        """King with color is in strikes of enemies
+        (ways are closed by other pieces).
+        """
+        white, red = self.pieces.get_teams()
+        team, enemies = (
+            (white, red) if color == ColorEnum.WHITE else (red, white)
+        )
+        king = next((item for item in team if item.name == "king"), None)
+        if king is None:
+            return True
+
+        return any(
+            king.location in self.piece_strikes(piece) for piece in enemies
+        )
+
+    def is_safe_step(
+        self,
+        color: ColorEnum,
+        from_location: typing.Tuple[int, int],
+        to_location: typing.Tuple[int, int]
+    ) -> bool:
+        """King with color is not attacked after step
+        (step is made and reverted in pieces).
+        """
+        pieces = self.pieces
+        piece = pieces.get_piece(*from_location)
+        target = pieces.get_piece(*to_location)
+        if target is not None:
+            position = pieces.content.index(target)
+            pieces.remove(*to_location)
+
+        pieces.move(piece, *to_location)
+        try:
+            return not self.is_attacked(color)
+        finally:
+            pieces.move(piece, *from_location)
+            if target is not None:
+                pieces.insert(position, target)
+
+    def is_safe_castling(self, color: ColorEnum, short: bool) -> bool:
+        rule = Rule()
+        rule.pieces = self.pieces.copy()
+        if short:
+            rule.castling_short(color)
+        else:
+            rule.castling_long(color)
+
+        return not rule.is_attacked(color)
+
+    def legal_moves(
+        self, color: ColorEnum
+    ) -> typing.Iterator[typing.Tuple[str, str]]:
+        """Available steps for team with color as pairs of cells,
+        castling is a pair ("castling", "short" | "long").
+        Steps with strike of king and steps leaving own king in strike
+        are skipped.
+        """
+        white, red = self.pieces.get_teams()
+        team = white if color == ColorEnum.WHITE else red
+        occupied = self.pieces.index
+        for piece in team:
+            from_cell = cell_name(*piece.location)
+            for x, y in list(self.piece_targets(piece)):
+                target = occupied.get((x, y))
+                if target is not None and target.name == "king":
+                    continue
+
+                if self.is_safe_step(color, piece.location, (x, y)):
+                    yield from_cell, cell_name(x, y)
+
+        if self.castling_short(color, True) and self.is_safe_castling(
+            color, True
+        ):
+            yield "castling", "short"
+
+        if self.castling_long(color, True) and self.is_safe_castling(
+            color, False
+        ):
+            yield "castling", "long"
+
     def move(self, from_cell: str, to_cell: str) -> bool:
         """Moving of piece to new position.
         """
@@ -163,7 +279,7 @@ class Rule:
         if in_strike:
             self.pieces.remove(to_x, to_y)
 
-        piece.move(to_x, to_y)
+        self.pieces.move(piece, to_x, to_y)
 
         return True
 
@@ -202,6 +318,7 @@ class Game:
     board: GameBoard
     history: typing.List[typing.Tuple[ColorEnum, str, str, datetime]]
     in_check: bool
+    positions: typing.Counter[int]
     rules = Rule()
 
     def __init__(self):
@@ -209,10 +326,28 @@ class Game:
         self.board = GameBoard()
         self.history = []
         self.in_check = True
+        self.positions = Counter((self.position_hash,))
 
     def __hash__(self) -> int:
         return hash(self.code)
 
+    @property
+    def position_hash(self) -> int:
+        """Zobrist hash of pieces and team for next step,
+        equal for identical positions in any games.
+        """
+        value = self.board.pieces.zobrist
+        if self.current_color == ColorEnum.RED:
+            value ^= ZOBRIST_RED_MOVES
+
+        return value
+
+    @property
+    def repeats(self) -> int:
+        """Count of current position in the game.
+        """
+        return self.positions[self.position_hash]
+
     def __repr__(self) -> str:
         if self.history:
             *_, (color, f_cell, t_cell, _) = self.history
@@ -261,6 +396,23 @@ class Game:
 
         return game
 
+    @property
+    def current_color(self) -> ColorEnum:
+        """Team for current step.
+        """
+        if self.history:
+            *_, (color, *_) = self.history
+            return (
+                ColorEnum.WHITE if color == ColorEnum.RED else ColorEnum.RED
+            )
+
+        return ColorEnum.WHITE
+
+    def legal_moves(self) -> typing.List[typing.Tuple[str, str]]:
+        """Available steps for current team.
+        """
+        return list(self.rules.legal_moves(self.current_color))
+
     def castling(self, short: typing.Optional[bool] = None) -> str:
         """Make available castling for current step.
         """
@@ -285,6 +437,7 @@ class Game:
             self.history.append(
                 (color, "castling", castling_name, datetime.now())
             )
+            self.positions[self.position_hash] += 1
             next_color = (
                 ColorEnum.WHITE if color == ColorEnum.RED else ColorEnum.RED
             )
@@ -315,6 +468,7 @@ class Game:
             return f"Not available step {from_cell}-{to_cell}"
         else:
             self.history.append((color, from_cell, to_cell, datetime.now()))
+            self.positions[self.position_hash] += 1
 
         if self.rules.is_check_state(color):
             if self.in_check:
@@ -0,0 +1,172 @@
+"""Batch replay and validation of games history in a pool of processes.
+
+In [1]: from chess.replay import ReplayStats, replay_games
+
+In [2]: stats = ReplayStats()
+
+In [3]: invalid = [
+   ...:     res for res in replay_games(archive.items(), stats=stats)
+   ...:     if not res.valid
+   ...: ]
+
+In [4]: stats
+Out[4]: games: 32 moves: 1716 time: 0.41s (77.4 games/s 4148.4 moves/s)
+"""
+import concurrent.futures
+import os
+import time
+import typing
+from datetime import datetime
+from itertools import islice
+
+from .common import ColorEnum
+from .game import Game
+
+HistoryType = typing.List[
+    typing.Tuple[
+        typing.Union[ColorEnum, int],
+        str,
+        str,
+        typing.Optional[datetime]
+    ]
+]
+
+
+class ReplayResult:
+    """Result of validation for one game.
+    """
+
+    code: str
+    moves: int
+    error: str
+
+    def __init__(self, code: str, moves: int, error: str = ""):
+        self.code = code
+        self.moves = moves
+        self.error = error
+
+    @property
+    def valid(self) -> bool:
+        return not self.error
+
+    def __repr__(self) -> str:
+        state = "valid" if self.valid else f"invalid: {self.error}"
+        return f"Game {self.code} moves: {self.moves} {state}"
+
+
+class ReplayStats:
+    """Counters of batch replay.
+    """
+
+    games: int
+    invalid: int
+    moves: int
+    started: float
+    finished: float
+
+    def __init__(self):
+        self.games = self.invalid = self.moves = 0
+        self.started = self.finished = time.monotonic()
+
+    def add(self, result: ReplayResult):
+        self.games += 1
+        self.moves += result.moves
+        if not result.valid:
+            self.invalid += 1
+
+        self.finished = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return self.finished - self.started
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def moves_per_second(self) -> float:
+        return self.moves / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"games: {self.games} moves: {self.moves} "
+            f"time: {self.elapsed:.2f}s "
+            f"({self.games_per_second:.1f} games/s "
+            f"{self.moves_per_second:.1f} moves/s)"
+        )
+
+
+def replay_game(code: str, history: HistoryType) -> ReplayResult:
+    """Replay history of game and stop on first wrong step.
+    """
+    game = Game()
+    if code:
+        game.code = code
+
+    for index, (color, from_cell, to_cell, _) in enumerate(history):
+        if ColorEnum(color) != game.current_color:
+            return ReplayResult(
+                code, index, f"step {index + 1}: other team moves"
+            )
+
+        steps = len(game.history)
+        try:
+            if from_cell == "castling":
+                message = game.castling(short=to_cell == "short")
+            else:
+                message = game.step(from_cell, to_cell)
+        except Exception as err:
+            return ReplayResult(code, index, f"step {index + 1}: {err!r}")
+
+        if len(game.history) == steps:
+            return ReplayResult(code, index, f"step {index + 1}: {message}")
+
+    return ReplayResult(code, len(history))
+
+
+def replay_chunk(
+    games: typing.List[typing.Tuple[str, HistoryType]]
+) -> typing.List[ReplayResult]:
+    """Worker task: validation of a part of games.
+    """
+    return [replay_game(code, history) for code, history in games]
+
+
+def replay_games(
+    games: typing.Iterable[typing.Tuple[str, HistoryType]],
+    workers: typing.Optional[int] = None,
+    chunk_size: int = 64,
+    stats: typing.Optional[ReplayStats] = None,
+) -> typing.Iterator[ReplayResult]:
+    """Validate games (pairs of code and history) in pool of processes,
+    results are returned as soon as a chunk of games is done
+    (order of games is not kept).
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = stats if stats is not None else ReplayStats()
+    stats.started = time.monotonic()
+    games = iter(games)
+    pool = concurrent.futures.ProcessPoolExecutor
+    with pool(max_workers=workers) as executor:
+        pending = set()
+        active = True
+        while active or pending:
+            # limit of chunks in work, source of games can be lazy
+            while active and len(pending) < workers * 2:
+                chunk = list(islice(games, chunk_size))
+                if chunk:
+                    pending.add(executor.submit(replay_chunk, chunk))
+                else:
+                    active = False
+
+            if not pending:
+                continue
+
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                for result in future.result():
+                    stats.add(result)
+                    yield result
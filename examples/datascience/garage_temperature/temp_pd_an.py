@@ -1,8 +1,11 @@
 # run exaple:
 # MPLBACKEND=Qt5Agg LOG=~/tpm/content_18.log ipython --matplotlib -m temp_pd_an
+# with saved state (STATE=~/tpm/content_18.npz HOURS=720) only new lines
+# are parsed
 
 import re
 import os
+import typing
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -89,12 +92,217 @@ def create_chart_data(
     return minute_temp
 
 
+def parse_lines(
+    lines: typing.Iterable[bytes]
+) -> typing.Tuple[np.array, np.array]:
+    """Minutes (from epoch) and values of temperature lines,
+    lines of known format are parsed without regex.
+    """
+    minutes = []
+    values = []
+    for line in lines:
+        # 2018-09-23 10:25:15,740 INFO - 24.310000
+        try:
+            if line[4:5] != b"-" or line[16:17] != b":":
+                raise ValueError(line)
+
+            value = float(line.rsplit(None, 1)[-1])
+            dt = line[:19].decode()
+        except (ValueError, IndexError, UnicodeDecodeError):
+            match = line_regx.match(line.decode(errors="replace"))
+            if not match:
+                continue
+
+            dt, value = match.groups()
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+
+        minutes.append(dt)
+        values.append(value)
+
+    try:
+        minutes = np.array(minutes, dtype="datetime64[m]")
+    except ValueError:
+        minutes = np.array(
+            [pd.Timestamp(dt).floor("min") for dt in minutes],
+            dtype="datetime64[m]"
+        )
+
+    return minutes.astype(np.int64), np.array(values, dtype=np.float64)
+
+
+class MinutesLog:
+    """Per-minute aggregates of temperature log in ring buffer,
+    only appended bytes of log are parsed on update.
+    State (offset in log and buffer) is saved to state_path.
+    In [1]: log = MinutesLog("/tpm/content.log", "/tpm/content.npz")
+
+    In [2]: log.update()
+    Out[2]: 1440
+
+    In [3]: chart_data = create_chart_data(log.minutes_data(hours=24 * 3))
+    """
+
+    path: str
+    state_path: str
+    capacity: int
+    offset: int
+    inode: int
+    last_minute: int
+    minute: np.array
+    total: np.array
+    count: np.array
+    low: np.array
+    high: np.array
+
+    def __init__(
+        self,
+        path: str,
+        state_path: str = None,
+        capacity: int = 60 * 24 * 62  # 2 months
+    ):
+        self.path = path
+        self.state_path = state_path
+        self.capacity = capacity
+        self.reset()
+        if state_path and os.path.exists(state_path):
+            self.load()
+
+    def reset(self):
+        self.offset = self.inode = 0
+        self.last_minute = -1
+        self.minute = np.full(self.capacity, -1, dtype=np.int64)
+        self.total = np.zeros(self.capacity)
+        self.count = np.zeros(self.capacity, dtype=np.int32)
+        self.low = np.full(self.capacity, np.inf, dtype=np.float32)
+        self.high = np.full(self.capacity, -np.inf, dtype=np.float32)
+
+    def load(self):
+        with np.load(self.state_path) as state:
+            if int(state["capacity"]) != self.capacity:
+                print("Other capacity of saved state, log is read again")
+                return
+
+            self.offset, self.inode, self.last_minute = (
+                int(state["position"][i]) for i in range(3)
+            )
+            for name in ("minute", "total", "count", "low", "high"):
+                setattr(self, name, state[name])
+
+    def save(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "wb") as state_file:
+            np.savez(
+                state_file,
+                capacity=self.capacity,
+                position=np.array(
+                    [self.offset, self.inode, self.last_minute]
+                ),
+                minute=self.minute,
+                total=self.total,
+                count=self.count,
+                low=self.low,
+                high=self.high,
+            )
+
+        os.replace(tmp_path, self.state_path)
+
+    def add(self, minutes: np.array, values: np.array):
+        """Add measurements to aggregates of minutes,
+        minutes older than the buffer are skipped.
+        """
+        if not len(minutes):
+            return
+
+        self.last_minute = max(self.last_minute, int(minutes.max()))
+        actual = minutes > self.last_minute - self.capacity
+        minutes, values = minutes[actual], values[actual]
+        slots = minutes % self.capacity
+        # slots of old minutes are used again
+        renew = slots[self.minute[slots] != minutes]
+        self.minute[renew] = -1
+        self.minute[slots] = minutes
+        self.total[renew] = 0
+        self.count[renew] = 0
+        self.low[renew] = np.inf
+        self.high[renew] = -np.inf
+        np.add.at(self.total, slots, values)
+        np.add.at(self.count, slots, 1)
+        np.minimum.at(self.low, slots, values)
+        np.maximum.at(self.high, slots, values)
+
+    def update(self, block_size: int = 1 << 22) -> int:
+        """Parse new lines of log, return count of measurements.
+        Log is read from the start after rotation (other inode or size).
+        """
+        stat = os.stat(self.path)
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.reset()
+            self.inode = stat.st_ino
+
+        added = 0
+        with open(self.path, "rb") as log_file:
+            log_file.seek(self.offset)
+            rest = b""
+            while True:
+                block = log_file.read(block_size)
+                if not block:
+                    break
+
+                *lines, rest = (rest + block).split(b"\n")
+                self.offset += sum(len(line) + 1 for line in lines)
+                minutes, values = parse_lines(line for line in lines if line)
+                self.add(minutes, values)
+                added += len(values)
+
+        if self.state_path:
+            self.save()
+
+        return added
+
+    def minutes_data(self, hours: int = 24) -> pd.DataFrame:
+        """Temperature per minute (mean) of last hours as
+        get_minutes_temp_data, minutes without values are interpolated.
+        """
+        first_minute = self.last_minute - min(hours * 60, self.capacity) + 1
+        minutes = np.arange(first_minute, self.last_minute + 1)
+        slots = minutes % self.capacity
+        with np.errstate(invalid="ignore", divide="ignore"):
+            temp = np.where(
+                self.minute[slots] == minutes,
+                self.total[slots] / self.count[slots],
+                np.nan
+            )
+
+        minute_result = pd.DataFrame(
+            {"temp": temp},
+            index=pd.to_datetime(minutes.astype("datetime64[m]"))
+        )
+        minute_result = minute_result.loc[
+            minute_result.temp.first_valid_index():
+        ]
+        minute_result.interpolate(method="quadratic", inplace=True)
+        return minute_result
+
+
 log_path = os.environ.get("LOG")
+# saved state of MinutesLog, only new lines of log are read
+state_path = os.environ.get("STATE")
 params = {}
 if log_path:
     params["path"] = log_path
 
-chart_data = create_chart_data(get_minutes_temp_data(**params))
+if state_path:
+    minutes_log = MinutesLog(
+        params.get("path", "/tpm/content.log"), state_path
+    )
+    print("New measurements:", minutes_log.update())
+    hours = int(os.environ.get("HOURS", 24 * 30))
+    chart_data = create_chart_data(minutes_log.minutes_data(hours=hours))
+else:
+    chart_data = create_chart_data(get_minutes_temp_data(**params))
 
 chart_data.plot(kind="line")
 plt.show(block=True)
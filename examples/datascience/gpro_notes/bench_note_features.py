@@ -0,0 +1,158 @@
+# # #
+#
+# Benchmark of notes extraction (song_parts) by note and by batch of notes
+# of track (track_rows, notes_values), files are parsed before measurement.
+# Fixture corpus (12 songs and a song shorter than one row, 240 rows):
+# by note ~0.14 sec, batch ~0.10 sec (about 1.4x, the rest is attribute
+# access of guitarpro objects).
+# Fixture corpus of generated songs (without path of GuitarPro files):
+# $ python bench_note_features.py
+# $ python bench_note_features.py /<full path>/gp_files/
+#
+# # #
+import os
+import random
+import sys
+import tempfile
+import time
+import typing
+
+import guitarpro
+import numpy as np
+from guitarpro import models
+
+from create_notes_data import search_gpro_files
+from create_notes_data import song_parts
+
+FIXTURE_SONGS: int = 12
+FIXTURE_MEASURES: int = 60
+# measures of song with tracks shorter than one row
+FIXTURE_SHORT_MEASURES: int = 4
+
+
+def fixture_song(seed: int, measures: int = FIXTURE_MEASURES) -> models.Song:
+    """Song with random notes and effects of notes.
+    """
+    rnd = random.Random(seed)
+    song = models.Song()
+    song.title = f"Song {seed} (fixture)"
+    song.artist = f"Artist {seed % 3}"
+    song.tempo = rnd.choice((90, 120, 140))
+    song.tracks = []
+    song.measureHeaders = []
+    for index in range(measures):
+        header = models.MeasureHeader()
+        header.number = index + 1
+        header.start = 960 + index * 3840
+        song.addMeasureHeader(header)
+
+    for number, name in enumerate(("Guitar", "Bass", "Lead", "Vocal")):
+        track = models.Track(song, number=number + 1, name=name)
+        track.channel.instrument = rnd.randint(0, 100)
+        track.channel.volume = rnd.randint(0, 127)
+        track.channel.balance = rnd.randint(0, 127)
+        track.measures = []
+        for header in song.measureHeaders:
+            measure = models.Measure(track, header)
+            for v_index, voice in enumerate(measure.voices):
+                if v_index and rnd.random() < 0.7:
+                    continue
+
+                for _ in range(rnd.randint(1, 8)):
+                    voice.beats.append(fixture_beat(rnd, voice))
+
+            track.measures.append(measure)
+
+        song.tracks.append(track)
+
+    return song
+
+
+def fixture_beat(rnd: random.Random, voice: models.Voice) -> models.Beat:
+    beat = models.Beat(voice)
+    beat.duration = models.Duration(value=rnd.choice((4, 8, 16)))
+    beat.status = models.BeatStatus.normal
+    for string in rnd.sample(range(1, 7), rnd.randint(0, 5)):
+        note = models.Note(beat)
+        note.string = string
+        note.value = rnd.randint(0, 20)
+        note.type = rnd.choice(
+            (models.NoteType.normal, models.NoteType.tie, models.NoteType.dead)
+        )
+        note.swapAccidentals = rnd.random() < 0.05
+        effect = note.effect
+        effect.hammer = rnd.random() < 0.2
+        effect.vibrato = rnd.random() < 0.2
+        if rnd.random() < 0.1:
+            effect.slides = [rnd.choice(list(models.SlideType))]
+        if rnd.random() < 0.1:
+            effect.harmonic = models.NaturalHarmonic()
+        if rnd.random() < 0.1:
+            effect.trill = models.TrillEffect(
+                fret=rnd.randint(1, 15), duration=models.Duration(value=16)
+            )
+        if rnd.random() < 0.1:
+            effect.grace = models.GraceEffect(fret=2)
+        if rnd.random() < 0.1:
+            effect.tremoloPicking = models.TremoloPickingEffect(
+                duration=models.Duration(value=8)
+            )
+        beat.notes.append(note)
+
+    return beat
+
+
+def fixture_corpus(path: str, count: int = FIXTURE_SONGS) -> typing.List[str]:
+    files = []
+    for seed in range(count):
+        file_path = os.path.join(path, f"song_{seed}.gp5")
+        guitarpro.write(fixture_song(seed), file_path)
+        files.append(file_path)
+
+    file_path = os.path.join(path, "song_short.gp5")
+    guitarpro.write(fixture_song(count, FIXTURE_SHORT_MEASURES), file_path)
+    files.append(file_path)
+    return files
+
+
+def run_bench(files: typing.List[str], repeat: int = 3):
+    songs = []
+    for file_path in files:
+        try:
+            songs.append(guitarpro.parse(file_path))
+        except Exception as err:
+            print(f"File '{file_path}' error: {err}")
+
+    results = {}
+    times = {}
+    for batch in (False, True):
+        best = None
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            rows = [row for song in songs for row in song_parts(song, batch)]
+            spent = time.perf_counter() - start_time
+            best = spent if best is None else min(best, spent)
+
+        results[batch] = rows
+        times[batch] = best
+        print(
+            f"{'batch' if batch else 'by note'}: {best:.3f} sec "
+            f"rows: {len(rows)} ({len(rows) / best:.1f} rows/sec)"
+        )
+
+    by_note, batch = results[False], results[True]
+    assert len(by_note) == len(batch)
+    for row, other in zip(by_note, batch):
+        assert row[:8] == other[:8]
+        assert np.array_equal(row[8:], other[8:])
+
+    print("The same rows")
+    print(f"Speedup: {times[False] / times[True]:.2f}x")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run_bench(list(search_gpro_files(sys.argv[1])))
+    else:
+        with tempfile.TemporaryDirectory() as tmp_path:
+            run_bench(fixture_corpus(tmp_path))
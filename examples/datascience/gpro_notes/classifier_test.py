@@ -1,5 +1,6 @@
 # classification of instruments by notes from dataset
 import gc
+import os
 import re
 import typing
 
@@ -8,6 +9,8 @@ import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import roc_auc_score
 
+from notes_dataset import NotesDataset
+
 regexp_note_field = re.compile(r"b([0-9]+)_n([0-9]+)_([\w]+)")
 
 
@@ -43,13 +46,62 @@ def roc_auc_score_all(
         other_cls.clear()
 
 
+def open_notes_dataset(
+    path: str,
+    with_names: bool = False,
+    note_fields: typing.Sequence[str] = None
+) -> typing.Tuple[pd.DataFrame, typing.List[str]]:
+    """Notes and volume from directory of binary dataset (notes_dataset),
+    note_fields - fields of each note (all in order of dataset by default).
+    Only selected notes are copied from memory map (float32, in random
+    order of rows), common fields are converted to numbers.
+    """
+    dataset = NotesDataset(path)
+    n = len(dataset)
+    print(f"Dataset size {n}")
+
+    order = np.random.permutation(n)
+    values, main_fields = dataset.columns(
+        note_fields or dataset.note_fields, order
+    )
+    result = pd.DataFrame(values, columns=main_fields, copy=False)
+    common_fields = [
+        "instrument",
+        "tempo",
+        "volume",
+        "balance",
+        "ppqn_duration",
+        "measure_index",
+    ]
+    if with_names:
+        common_fields.insert(0, "name")
+        common_fields.insert(0, "artist")
+
+    for position, field in enumerate(common_fields):
+        column = dataset.common[field].values[order]
+        if field == "instrument":
+            column = column.astype(int)
+        elif field not in ("artist", "name"):
+            try:
+                column = column.astype(float)
+            except Exception as err:
+                raise TypeError(f"In field {field}: {err}")
+
+        result.insert(position, field, column)
+
+    return result, [*common_fields, *main_fields]
+
+
 def open_dataset(
     path: str,
     relevance_limit_percent: float = 0.5,
     with_names: bool = False
 ) -> typing.Tuple[pd.DataFrame, typing.List[str]]:
-    """Notes and volume.
+    """Notes and volume (path of csv or directory of binary dataset).
     """
+    if os.path.isdir(path):
+        return open_notes_dataset(path, with_names)
+
     data = pd.read_csv(path, sep=";", error_bad_lines=False)
     main_fields = []
     data.insert(0, "rand", np.random.random(len(data)))
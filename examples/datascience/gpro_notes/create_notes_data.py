@@ -9,17 +9,21 @@
 
 import asyncio
 import gc
+import operator
 import os
 import re
 import sys
 import time
 import numpy as np
 import typing
+from concurrent.futures import ProcessPoolExecutor
 
 import guitarpro
 import pandas as pd
 from guitarpro.models import Measure, Voice, NoteEffect, SlideType, NoteType
 
+from notes_dataset import NotesDatasetWriter
+
 word_re = re.compile(r"\s+")
 # MIDI accuracy?
 GROUP_PPQN_DURATION: int = 960 * 4 * 30
@@ -27,6 +31,9 @@ GROUP_PPQN_DURATION: int = 960 * 4 * 30
 NOTE_IN_BEAT_COUNT: int = 8
 BEAT_COUNT: int = 32  # 128
 DEBUG: bool = False  # to see asyncio mode
+# files in progress (and blocks not saved) for each process of pool
+PARALLEL_QUEUE_RATE: int = 2
+STATS_INTERVAL: float = 10
 
 NOTE_MAX_STRING: int = 7
 NOTE_TYPE_SIZE: int = max(
@@ -120,6 +127,37 @@ NOTE_FIELDS: tuple = (
     "slides",
 )
 
+# columns of note values for NOTE_PROPERTY (after base values of note):
+# getter of effect property, columns with constant 1 (only is use effect)
+# and columns with extract function
+NOTE_BASE_COUNT: int = len(NOTE_FIELDS) - len(NOTE_PROPERTY)
+NOTE_EFFECT_COLUMNS: tuple = tuple(
+    (
+        operator.attrgetter(prop),
+        [
+            NOTE_BASE_COUNT + index
+            for index, (other, extract) in enumerate(NOTE_PROPERTY)
+            if other == prop and extract is extract_is_exists_effect
+        ],
+        tuple(
+            (NOTE_BASE_COUNT + index, extract)
+            for index, (other, extract) in enumerate(NOTE_PROPERTY)
+            if other == prop and extract is not extract_is_exists_effect
+        )
+    )
+    for prop in dict.fromkeys(prop for prop, _ in NOTE_PROPERTY)
+)
+NOTE_TYPE_VALUES: dict = {note_type: note_type.value for note_type in NoteType}
+# base values of note (columns before NOTE_EFFECT_COLUMNS)
+NOTE_BASE_GETTERS: tuple = (
+    operator.attrgetter("value"),
+    operator.attrgetter("string"),
+    lambda note: NOTE_TYPE_VALUES[note.type],
+    operator.attrgetter("durationPercent"),
+    operator.attrgetter("swapAccidentals"),
+)
+note_effect = operator.attrgetter("effect")
+
 COMMON_FIELDS: tuple = (
     "artist",
     "name",
@@ -188,6 +226,95 @@ def note_features(
     )
 
 
+def notes_values(notes: typing.List[guitarpro.Note]) -> np.array:
+    """Values "notes X NOTE_FIELDS" (as note_features) of all notes,
+    each column is filled at once, extract functions of effects are called
+    only for notes with the effect.
+    """
+    count = len(notes)
+    values = np.zeros((count, len(NOTE_FIELDS)))
+    if not count:
+        return values
+
+    for column, getter in enumerate(NOTE_BASE_GETTERS):
+        values[:, column] = np.fromiter(map(getter, notes), float, count)
+
+    effects = list(map(note_effect, notes))
+    for getter, flag_columns, extract_columns in NOTE_EFFECT_COLUMNS:
+        index = np.flatnonzero(
+            np.fromiter(map(bool, map(getter, effects)), bool, count)
+        )
+        if not len(index):
+            continue
+
+        values[index[:, np.newaxis], flag_columns] = 1
+        if extract_columns:
+            with_effect = [effects[i] for i in index.tolist()]
+            for column, extract in extract_columns:
+                values[index, column] = list(map(extract, with_effect))
+
+    return values
+
+
+def track_rows(
+    measures: typing.List[Measure]
+) -> typing.Tuple[typing.List[tuple], np.array]:
+    """Notes of track as rows in one batch: (duration, measure index)
+    of rows and tensor "rows X BEAT_COUNT X NOTE_IN_BEAT_COUNT X NOTE_FIELDS"
+    (the same rows as in song_parts by note).
+    """
+    rows = []
+    notes = []
+    row_ids = []
+    beat_ids = []
+    note_ids = []
+    beat_index = measure_index = 0
+    # notes of completed rows
+    done_notes = 0
+    for measure in measures:
+        voice = get_main_voice(measure)
+        if voice is None:
+            continue
+
+        empty_measure = True
+        for beat in voice.beats:
+            if beat_index >= BEAT_COUNT:
+                break
+
+            beat_notes = beat.notes
+            if not beat_notes:
+                continue
+
+            count = len(beat_notes)
+            if count >= NOTE_IN_BEAT_COUNT:
+                print("many notes in beat", count)
+                continue
+
+            notes.extend(beat_notes)
+            row_ids.extend([len(rows)] * count)
+            beat_ids.extend([beat_index] * count)
+            note_ids.extend(range(count))
+            beat_index += 1
+            empty_measure = False
+
+        if not empty_measure:
+            measure_index += 1
+
+        if beat_index >= BEAT_COUNT:
+            rows.append((measure.header.length, measure_index))
+            beat_index = 0
+            done_notes = len(notes)
+
+    values = notes_values(notes[:done_notes])
+    tensor = np.zeros(
+        (len(rows), BEAT_COUNT, NOTE_IN_BEAT_COUNT, len(NOTE_FIELDS))
+    )
+    tensor[
+        row_ids[:done_notes], beat_ids[:done_notes], note_ids[:done_notes]
+    ] = values
+    return rows, tensor
+
+
 def get_main_voice(measure: Measure) -> Voice:
     """Voice with max notes count.
     """
@@ -213,7 +340,9 @@ def setup_fields(fields: typing.List[str]):
             )
 
 
-def track_part(file_path: str) -> typing.Generator[tuple, None, None]:
+def track_part(
+    file_path: str, batch: bool = True
+) -> typing.Generator[tuple, None, None]:
     """Notes by parts as rows.
     """
     try:
@@ -221,78 +350,113 @@ def track_part(file_path: str) -> typing.Generator[tuple, None, None]:
     except Exception as err:
         print(f"File '{file_path}' error: {err}")
     else:
-        artist = title_format(gpro.artist)
-        name = title_format(gpro.title)
+        yield from song_parts(gpro, batch)
 
-        for track in gpro.tracks:
-            if track.isMute:
-                continue
 
-            track_name = track.name.lower()
+def song_tracks(
+    gpro: guitarpro.Song
+) -> typing.Generator[typing.Tuple[tuple, guitarpro.Track], None, None]:
+    """Tracks of song with notes (without muted and vocal tracks)
+    and their common fields before duration and measure index.
+    """
+    artist = title_format(gpro.artist)
+    name = title_format(gpro.title)
+
+    for track in gpro.tracks:
+        if track.isMute:
+            continue
+
+        track_name = track.name.lower()
+
+        if "vocal" in track_name or "voice" in track_name:
+            continue
+
+        instrument = track.channel.instrument
+        volume = track.channel.volume
+        balance = track.channel.balance
+        measure_count = len(track.measures)
+        if measure_count < 1:
+            continue
+
+        fields = (
+            artist,
+            name,
+            gpro.tempo,
+            instrument,
+            int(volume or 0),
+            balance,
+        )
+        yield fields, track
 
-            if "vocal" in track_name or "voice" in track_name:
-                continue
 
-            instrument = track.channel.instrument
-            volume = track.channel.volume
-            balance = track.channel.balance
-            measure_count = len(track.measures)
-            if measure_count < 1:
+def song_parts(
+    gpro: guitarpro.Song, batch: bool = True
+) -> typing.Generator[tuple, None, None]:
+    """Notes of song by parts as rows,
+    batch - notes of track together (see track_rows).
+    """
+    for fields, track in song_tracks(gpro):
+        if batch:
+            rows, tensor = track_rows(track.measures)
+            for (duration, measure_index), notes_row in zip(
+                rows,
+                tensor.reshape(
+                    len(rows),
+                    BEAT_COUNT * NOTE_IN_BEAT_COUNT * len(NOTE_FIELDS)
+                ).tolist()
+            ):
+                yield (*fields, duration, measure_index, *notes_row)
+
+            continue
+
+        duration = 0
+        beat_index = measure_index = 0
+        shape = (BEAT_COUNT, NOTE_IN_BEAT_COUNT, len(NOTE_FIELDS))
+        note_sapce: np.array = np.zeros(shape)
+
+        for measure in track.measures:
+            duration = measure.header.length
+
+            voice = get_main_voice(measure)
+            if voice is None:
                 continue
 
-            duration = 0
-            beat_index = measure_index = 0
-            shape = (BEAT_COUNT, NOTE_IN_BEAT_COUNT, len(NOTE_FIELDS))
-            note_sapce: np.array = np.zeros(shape)
+            empty_measure = True
 
-            for measure in track.measures:
-                duration = measure.header.length
-
-                voice = get_main_voice(measure)
-                if voice is None:
+            for beat in voice.beats:
+                if beat_index >= BEAT_COUNT:
                     continue
 
-                empty_measure = True
+                beat_notes = beat.notes
+                if beat_notes:
 
-                for beat in voice.beats:
-                    if beat_index >= BEAT_COUNT:
+                    if len(beat_notes) >= NOTE_IN_BEAT_COUNT:
+                        print("many notes in beat", len(beat_notes))
                         continue
 
-                    beat_notes = beat.notes
-                    if beat_notes:
-
-                        if len(beat_notes) >= NOTE_IN_BEAT_COUNT:
-                            print("many notes in beat", len(beat_notes))
-                            continue
-
-                        for n_index, note in enumerate(beat_notes):
-                            notes_ch = note_features(note)
-                            empty_measure = False
+                    for n_index, note in enumerate(beat_notes):
+                        notes_ch = note_features(note)
+                        empty_measure = False
 
-                            if beat_index < BEAT_COUNT:
-                                note_sapce[beat_index, n_index, :] = notes_ch  # noqa
+                        if beat_index < BEAT_COUNT:
+                            note_sapce[beat_index, n_index, :] = notes_ch  # noqa
 
-                        beat_index += 1
+                    beat_index += 1
 
-                if not empty_measure:
-                    # not empty measure
-                    measure_index += 1
+            if not empty_measure:
+                # not empty measure
+                measure_index += 1
 
-                if beat_index >= BEAT_COUNT:
-                    yield (
-                        artist,
-                        name,
-                        gpro.tempo,
-                        instrument,
-                        int(volume or 0),
-                        balance,
-                        duration,
-                        measure_index,
-                        *(note_sapce.ravel()),
-                    )
-                    # next
-                    beat_index = 0
-                    note_sapce: np.array = np.zeros(shape)
+            if beat_index >= BEAT_COUNT:
+                yield (
+                    *fields,
+                    duration,
+                    measure_index,
+                    *note_sapce.ravel().tolist(),
+                )
+                # next
+                beat_index = 0
+                note_sapce: np.array = np.zeros(shape)
 
 
 def read_notes_create(
@@ -409,7 +573,7 @@ async def input_files_queue(
             break
 
     for _ in range(workers):
-        queue.put_nowait(False)
+        await queue.put(False)
 
     print("Search files count:", count)
 
@@ -432,6 +596,174 @@ async def run_async_create_csv(
     await asyncio.gather(*tasks)
 
 
+def track_block(
+    file_path: str
+) -> typing.Tuple[str, typing.List[tuple], np.array]:
+    """Rows of file as common fields and block of notes
+    (float32 array "rows X notes values") by batches of tracks
+    (see track_rows), to run in process pool.
+    """
+    size = BEAT_COUNT * NOTE_IN_BEAT_COUNT * len(NOTE_FIELDS)
+    common = []
+    blocks = [np.zeros((0, size), dtype=np.float32)]
+    try:
+        gpro = guitarpro.parse(file_path)
+    except Exception as err:
+        print(f"File '{file_path}' error: {err}")
+    else:
+        for fields, track in song_tracks(gpro):
+            rows, tensor = track_rows(track.measures)
+            common.extend((*fields, *row) for row in rows)
+            blocks.append(
+                tensor.reshape(len(rows), size).astype(np.float32)
+            )
+
+    return file_path, common, np.concatenate(blocks)
+
+
+def block_lines(common: typing.List[tuple], block: np.array) -> str:
+    """CSV lines of rows block.
+    """
+    return "".join(
+        f"{';'.join(map(str, (*fields, *values.tolist())))}\n"
+        for fields, values in zip(common, block)
+    )
+
+
+def parse_stats(file_count: int, count: int, spent: float) -> str:
+    spent = max(spent, 1e-9)
+    return (
+        f"Files: {file_count} ({file_count / spent:.2f} files/sec) "
+        f"rows: {count} ({count / spent:.2f} rows/sec)"
+    )
+
+
+async def record_blocks(
+    save_block: typing.Callable[[typing.List[tuple], np.array], None],
+    result_queue: asyncio.Queue,
+    workers: int
+) -> int:
+    """Save blocks of rows from queue, with files/sec and rows/sec.
+    """
+    start_time = last_time = time.monotonic()
+    file_count = count = 0
+    done_worker = 0
+    while done_worker < workers:
+        result = await result_queue.get()
+        if result:
+            file_path, common, block = result
+            save_block(common, block)
+            file_count += 1
+            count += len(block)
+            if DEBUG:
+                print(f"from {file_path} rows: {len(block)}")
+
+        else:
+            done_worker += 1
+
+        result_queue.task_done()
+
+        now = time.monotonic()
+        if now - last_time > STATS_INTERVAL:
+            last_time = now
+            print(parse_stats(file_count, count, now - start_time))
+
+    print(parse_stats(file_count, count, time.monotonic() - start_time))
+    return count
+
+
+async def record_csv_blocks(
+    csv_file: str, result_queue: asyncio.Queue, workers: int
+):
+    """Save blocks of rows from queue to csv.
+    """
+    fields = list(COMMON_FIELDS)
+    setup_fields(fields)
+    print("Fields count:", len(fields))
+
+    with open(csv_file, "a") as out_file:
+        out_file.write(f"{';'.join(fields)}\n")
+        count = await record_blocks(
+            lambda common, block: out_file.write(block_lines(common, block)),
+            result_queue,
+            workers
+        )
+
+    print(f"In file {count} lines")
+
+
+async def record_dataset_blocks(
+    dataset_path: str, result_queue: asyncio.Queue, workers: int
+):
+    """Save blocks of rows from queue to binary dataset (see notes_dataset).
+    """
+    shape = (-1, BEAT_COUNT, NOTE_IN_BEAT_COUNT, len(NOTE_FIELDS))
+    with NotesDatasetWriter(
+        dataset_path, COMMON_FIELDS, NOTE_FIELDS
+    ) as writer:
+        count = await record_blocks(
+            lambda common, block: writer.add(common, block.reshape(shape)),
+            result_queue,
+            workers
+        )
+
+    print(f"In dataset {count} rows")
+
+
+async def read_gp_process_worker(
+    index: int,
+    executor: ProcessPoolExecutor,
+    queue: asyncio.Queue,
+    result_queue: asyncio.Queue
+):
+    """Send files to process pool, blocks of rows to result queue.
+    """
+    loop = asyncio.get_running_loop()
+    file_path = await queue.get()
+    part_total = 0
+    while file_path:
+        result = await loop.run_in_executor(executor, track_block, file_path)
+        part_total += len(result[-1])
+        queue.task_done()
+        await result_queue.put(result)
+        file_path = await queue.get()
+
+    if DEBUG:
+        print(f"worker {index} parts processed {part_total}")
+
+    await result_queue.put(False)
+
+
+async def run_parallel_create_csv(
+    base_path: str,
+    csv_file: str,
+    file_count_limit: int = 0,
+    workers: int = None,
+    record: typing.Callable = record_csv_blocks
+):
+    """Read (in process pool) and create csv
+    (or binary dataset with record=record_dataset_blocks),
+    queues are bounded by count of processes.
+    """
+    workers = workers or os.cpu_count()
+    size = workers * PARALLEL_QUEUE_RATE
+    in_queue = asyncio.Queue(size)
+    out_queue = asyncio.Queue(size)
+    with ProcessPoolExecutor(workers) as executor:
+        tasks = [record(csv_file, out_queue, workers)]
+        for i in range(workers):
+            tasks.append(
+                read_gp_process_worker(i + 1, executor, in_queue, out_queue)
+            )
+
+        tasks.append(
+            input_files_queue(
+                base_path, in_queue, workers, limit=file_count_limit
+            )
+        )
+        await asyncio.gather(*tasks)
+
+
 # # to use this methods in ipython (python) # #
 
 
@@ -454,23 +786,72 @@ def create_csv_file(
     print("Time: ", time.monotonic() - start_time)
 
 
-def async_create_csv(base_path: str, csv_file: str, file_count_limit: int = 0):
+def async_create_csv(
+    base_path: str,
+    csv_file: str,
+    file_count_limit: int = 0,
+    processes: int = 0
+):
     """Main files processing method:
     from create_notes_data import async_create_csv
     async_create_csv("/gp_files/", "/tmp/notes_set_120_10_1.csv", 100)
     base_path - guitar pro files
     csv_file - new data set file (possible a huge file)
+    processes - parse files in process pool (0 - in event loop)
     """
     start_time = time.monotonic()
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(
-        run_async_create_csv(base_path, csv_file, file_count_limit)
+    if processes:
+        coro = run_parallel_create_csv(
+            base_path, csv_file, file_count_limit, processes
+        )
+    else:
+        coro = run_async_create_csv(base_path, csv_file, file_count_limit)
+
+    asyncio.run(coro)
+    print("Time: ", time.monotonic() - start_time)
+
+
+def create_dataset(
+    base_path: str,
+    dataset_path: str,
+    file_count_limit: int = 0,
+    processes: int = None
+):
+    """Binary dataset (directory) instead of csv, see notes_dataset:
+    from create_notes_data import create_dataset
+    create_dataset("/gp_files/", "/tmp/notes_set", 100)
+    """
+    start_time = time.monotonic()
+    asyncio.run(
+        run_parallel_create_csv(
+            base_path,
+            dataset_path,
+            file_count_limit,
+            processes,
+            record=record_dataset_blocks
+        )
     )
     print("Time: ", time.monotonic() - start_time)
 
 
+def csv_to_dataset(csv_file: str, dataset_path: str, chunk_size: int = 1024):
+    """Convert csv from create_csv_file to binary dataset.
+    """
+    fields = []
+    setup_fields(fields)
+    shape = (-1, BEAT_COUNT, NOTE_IN_BEAT_COUNT, len(NOTE_FIELDS))
+    with NotesDatasetWriter(
+        dataset_path, COMMON_FIELDS, NOTE_FIELDS, chunk_size
+    ) as writer:
+        for data in pd.read_csv(csv_file, sep=";", chunksize=chunk_size):
+            writer.add(
+                list(data[list(COMMON_FIELDS)].itertuples(index=False)),
+                data[fields].values.reshape(shape)
+            )
+
+
 def run():
-    """Run from shell.
+    """Run from shell (files are parsed by all cores).
     python -c "from create_notes_data import run; run()" data/gp_files/ dataset/notes.csv
     """
     *_, path, csv_file_path = sys.argv
@@ -478,4 +859,4 @@ def run():
         "Search files from", path, "\n"
         "Save to file", csv_file_path,
     )
-    async_create_csv(path, csv_file_path)
+    async_create_csv(path, csv_file_path, processes=os.cpu_count())
@@ -0,0 +1,179 @@
+# # #
+#
+# Binary dataset of notes: one float32 file with tensor
+# "rows X beats X notes X note fields" (read as memory map),
+# small CSV table with common fields of rows and index with shape.
+#
+# In [1]: from notes_dataset import NotesDataset
+#
+# In [2]: dataset = NotesDataset("dataset/notes")
+#
+# In [3]: dataset.notes.shape, dataset.field("duration").shape
+# Out[3]: ((1474, 32, 8, 15), (1474, 32, 8))
+#
+# # #
+import csv
+import json
+import os
+import typing
+
+import numpy as np
+import pandas as pd
+
+NOTES_FILE: str = "notes.f32"
+COMMON_FILE: str = "common.csv"
+INDEX_FILE: str = "index.json"
+
+
+class NotesDatasetWriter:
+    """Chunked writer of dataset, files are replaced on close only
+    (abort or exception in context removes new files).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        common_fields: typing.Sequence[str],
+        note_fields: typing.Sequence[str],
+        chunk_size: int = 1024
+    ):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.common_fields = list(common_fields)
+        self.note_fields = list(note_fields)
+        self.chunk_size = chunk_size
+        self.shape = None
+        self.rows = 0
+        self.common = []
+        self.blocks = []
+        self.pending = 0
+        self.notes_file = open(self.tmp_path(NOTES_FILE), "wb")
+        self.common_file = open(self.tmp_path(COMMON_FILE), "w", newline="")
+        self.common_writer = csv.writer(self.common_file)
+        self.common_writer.writerow(self.common_fields)
+
+    def tmp_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.tmp")
+
+    def add(self, common: typing.Sequence[tuple], block: np.array):
+        """Rows with common fields and notes block
+        "rows X beats X notes X note fields".
+        """
+        block = np.asarray(block, dtype=np.float32)
+        if self.shape is None:
+            if block.shape[-1] != len(self.note_fields):
+                raise ValueError(f"Wrong count of note fields {block.shape}")
+            self.shape = block.shape[1:]
+        elif block.shape[1:] != self.shape:
+            raise ValueError(f"Wrong block shape {block.shape}")
+
+        if len(common) != len(block):
+            raise ValueError("Different count of rows in common and notes")
+
+        self.common.extend(common)
+        self.blocks.append(block)
+        self.pending += len(block)
+        if self.pending >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.blocks:
+            return
+
+        np.concatenate(self.blocks).tofile(self.notes_file)
+        self.common_writer.writerows(self.common)
+        self.rows += self.pending
+        self.common.clear()
+        self.blocks.clear()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.notes_file.close()
+        self.common_file.close()
+        index = dict(
+            rows=self.rows,
+            shape=[self.rows, *(self.shape or (0, 0, len(self.note_fields)))],
+            dtype="float32",
+            common_fields=self.common_fields,
+            note_fields=self.note_fields,
+        )
+        with open(self.tmp_path(INDEX_FILE), "w") as index_file:
+            json.dump(index, index_file, indent=2)
+
+        for name in (NOTES_FILE, COMMON_FILE, INDEX_FILE):
+            os.replace(self.tmp_path(name), os.path.join(self.path, name))
+
+    def abort(self):
+        """Remove new files, previous dataset is not changed.
+        """
+        self.notes_file.close()
+        self.common_file.close()
+        for name in (NOTES_FILE, COMMON_FILE, INDEX_FILE):
+            if os.path.exists(self.tmp_path(name)):
+                os.remove(self.tmp_path(name))
+
+    def __enter__(self) -> "NotesDatasetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class NotesDataset:
+    """Dataset from NotesDatasetWriter, notes are memory map.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, INDEX_FILE)) as index_file:
+            self.index = json.load(index_file)
+
+        self.path = path
+        self.note_fields = tuple(self.index["note_fields"])
+        self.common = pd.read_csv(
+            os.path.join(path, COMMON_FILE), keep_default_na=False
+        )
+        shape = tuple(self.index["shape"])
+        if self.index["rows"]:
+            self.notes = np.memmap(
+                os.path.join(path, NOTES_FILE),
+                dtype=self.index["dtype"],
+                mode="r",
+                shape=shape
+            )
+        else:
+            self.notes = np.zeros(shape, dtype=self.index["dtype"])
+
+    def __len__(self) -> int:
+        return len(self.notes)
+
+    def field(self, name: str) -> np.array:
+        """Values of one note field "rows X beats X notes" (view).
+        """
+        return self.notes[..., self.note_fields.index(name)]
+
+    def columns(
+        self, fields: typing.Sequence[str] = None, rows: np.array = None
+    ) -> typing.Tuple[np.array, typing.List[str]]:
+        """Notes as flat rows with columns "b{beat}_n{note}_{field}",
+        by default fields are sorted by name in each note,
+        rows - indexes of rows (all rows by default).
+        Fields in order of dataset and all rows are a view of memory map.
+        """
+        fields = sorted(self.note_fields) if fields is None else fields
+        order = [self.note_fields.index(name) for name in fields]
+        _, beats, notes, _ = self.notes.shape
+        names = [
+            f"b{b_index}_n{n_index}_{name}"
+            for b_index in range(beats)
+            for n_index in range(notes)
+            for name in fields
+        ]
+        values = self.notes if rows is None else self.notes[rows]
+        if order != list(range(len(self.note_fields))):
+            values = values[..., order]
+
+        return values.reshape(len(values), -1), names
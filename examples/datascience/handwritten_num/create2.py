@@ -1,6 +1,10 @@
+import concurrent.futures
+import json
 import os
+import uuid
 from collections import defaultdict
 from collections.abc import Iterable
+from itertools import islice
 from time import monotonic
 
 import matplotlib.pyplot as plt
@@ -10,7 +14,10 @@ from PIL import Image
 
 from num_tpl_base.image_tpl import create_templates
 from num_tpl_base.image_tpl import base_tpl_points
+from num_tpl_base.image_tpl import batch_templates_scores
+from num_tpl_base.image_tpl import cached_sparse_templates
 from num_tpl_base.image_tpl import prepare_image
+from num_tpl_base.image_tpl import prepare_images
 from num_tpl_base.image_tpl import templates_scores
 
 
@@ -54,6 +61,30 @@ def images(
     return result
 
 
+def image_features(
+    img_m: np.array,
+    num: int,
+    tpls: list,
+    fearure_size: int,
+    show: bool = False
+) -> np.array:
+    """Scores of all templates for prepared image and number as last value.
+    """
+    features = np.zeros((fearure_size + 1, ))
+    features[fearure_size] = num
+    i = 0
+    for tpl_num, tpl in tpls:
+        num_fearure = templates_scores(img_m, tpl)
+        for val in num_fearure:
+            features[i] = val
+            i += 1
+        if show:
+            print(f"{tpl_num}>{num_fearure}")
+
+    assert fearure_size == i
+    return features
+
+
 def create_dataset(
     base_dir: str = "numbers",
     limit_group_size: int = 1000,
@@ -68,7 +99,6 @@ def create_dataset(
 
     # new templates
     tpls, fearure_size = create_templates(show, tpl_points)
-    i = 0
 
     for num, images_list in images(base_dir, limit_group_size).items():
         if only and num not in only:
@@ -90,21 +120,8 @@ def create_dataset(
                     )
                     plt.show(block=True)
 
-            features = np.zeros((fearure_size + 1, ))
-            features[fearure_size] = num
-            i = 0
-            for tpl_num, tpl in tpls:
-                num_fearure = templates_scores(img_m, tpl)
-                for val in num_fearure:
-                    features[i] = val
-                    i += 1
-                if show:
-                    print(f"{tpl_num}>{num_fearure}")
-
-            assert fearure_size == i
-
             good_values += 1
-            yield features
+            yield image_features(img_m, num, tpls, fearure_size, show)
 
     exec_time = monotonic() - start_time
     exec_min = exec_time // 60
@@ -117,15 +134,10 @@ def create_dataset(
     )
 
 
-def create_df(
-    base_dir: str = "numbers",
-    limit_group_size: int = 1000,
-    show: bool = False,
-    random_sort: bool = True,
-    only: list = [],
-    tpl_points: dict = base_tpl_points
-) -> pd.DataFrame:
-    """Create features as DataFreame.
+def dataset_fields(
+    only: list = [], tpl_points: dict = base_tpl_points
+) -> (dict, list):
+    """Actual templates points and names of features.
     """
     actual_tpl_points = {}
     tpl_fields = []
@@ -144,7 +156,20 @@ def create_df(
                 fields.append(f"feature_{num}_{index + 1}_{f_index + 1}")
 
     fields.append("number")
+    return actual_tpl_points, fields
 
+
+def create_df(
+    base_dir: str = "numbers",
+    limit_group_size: int = 1000,
+    show: bool = False,
+    random_sort: bool = True,
+    only: list = [],
+    tpl_points: dict = base_tpl_points
+) -> pd.DataFrame:
+    """Create features as DataFreame.
+    """
+    actual_tpl_points, fields = dataset_fields(only, tpl_points)
     data_set = pd.DataFrame(
         data=create_dataset(
             base_dir=base_dir,
@@ -170,3 +195,191 @@ def create_df(
         )
 
     return data_set
+
+
+MANIFEST_NAME = "manifest.jsonl"
+# templates of process in pool
+worker_tpls = None
+
+
+def init_worker(sparse_tpls: dict):
+    global worker_tpls
+    worker_tpls = sparse_tpls
+
+
+def build_chunk(out_dir: str, chunk: list) -> dict:
+    """Features of images in chunk saved to new part of dataset.
+    """
+    start_time = monotonic()
+    nums = []
+    paths = []
+    sources = []
+    bad = []
+    for num, img_path in chunk:
+        try:
+            img = Image.open(img_path).convert("L")
+        except (TypeError, OSError) as err:
+            print(f"Image format problem '{err}' in '{img_path}'")
+            bad.append(img_path)
+            continue
+
+        nums.append(num)
+        paths.append(img_path)
+        sources.append(img)
+
+    imgs = []
+    if sources:
+        imgs, _, good = prepare_images(sources)
+        for img_path in np.array(paths)[~good]:
+            print(f"Image format problem 'Image size problem' in '{img_path}'")
+            bad.append(str(img_path))
+
+        nums = np.array(nums)[good]
+
+    part = None
+    if len(imgs):
+        rows = np.column_stack((
+            batch_templates_scores(imgs, worker_tpls), nums
+        ))
+        part = f"part_{uuid.uuid4().hex[:12]}.npy"
+        tmp_path = os.path.join(out_dir, f"{part}.tmp")
+        with open(tmp_path, "wb") as part_file:
+            np.save(part_file, rows)
+
+        os.replace(tmp_path, os.path.join(out_dir, part))
+
+    return {
+        "part": part,
+        "files": [img_path for _, img_path in chunk],
+        "bad": bad,
+        "rows": len(imgs),
+        "worker": os.getpid(),
+        "time": monotonic() - start_time,
+    }
+
+
+def read_manifest(out_dir: str) -> list:
+    """Finished chunks of dataset.
+    """
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return []
+
+    result = []
+    with open(path) as manifest:
+        for line in manifest:
+            try:
+                result.append(json.loads(line))
+            except ValueError:
+                # a line from interrupted writing
+                continue
+
+    return result
+
+
+def build_dataset(
+    out_dir: str,
+    base_dir: str = "numbers",
+    limit_group_size: int = 1000,
+    only: list = [],
+    tpl_points: dict = base_tpl_points,
+    workers: int = None,
+    chunk_size: int = 100,
+) -> int:
+    """Create features in pool of processes as parts of dataset (.npy)
+    in out_dir, finished parts are listed in manifest and
+    processed files are skipped after restart.
+    Return count of new rows.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    actual_tpl_points, _ = dataset_fields(only, tpl_points)
+    done = {
+        img_path
+        for item in read_manifest(out_dir)
+        for img_path in item["files"]
+    }
+    files = (
+        (num, img_path)
+        for num, images_list in images(base_dir, limit_group_size).items()
+        if num in actual_tpl_points
+        for img_path in images_list
+        if img_path not in done
+    )
+    start_time = monotonic()
+    worker_stat = defaultdict(lambda: [0, 0.0])
+    total_rows = total_bad = 0
+    pool = concurrent.futures.ProcessPoolExecutor
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    with pool(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(cached_sparse_templates(actual_tpl_points),)
+    ) as executor, open(manifest_path, "a") as manifest:
+        pending = set()
+        active = True
+        while active or pending:
+            while active and len(pending) < workers * 2:
+                chunk = list(islice(files, chunk_size))
+                if chunk:
+                    pending.add(executor.submit(build_chunk, out_dir, chunk))
+                else:
+                    active = False
+
+            if not pending:
+                continue
+
+            finished, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                item = future.result()
+                manifest.write(json.dumps(item) + "\n")
+                manifest.flush()
+                os.fsync(manifest.fileno())
+
+                total_rows += item["rows"]
+                total_bad += len(item["bad"])
+                stat = worker_stat[item["worker"]]
+                stat[0] += len(item["files"])
+                stat[1] += item["time"]
+                print(
+                    f"Worker {item['worker']}:",
+                    round(stat[0] / stat[1], 2) if stat[1] else 0,
+                    "images/sec",
+                    "Good:", total_rows,
+                    "Bad:", total_bad,
+                )
+
+    exec_time = monotonic() - start_time
+    print(
+        "Good:", total_rows,
+        "Bad:", total_bad,
+        "Skipped:", len(done),
+        "exec time", round(exec_time, 2), "sec",
+        "images/sec",
+        round((total_rows + total_bad) / exec_time, 2) if exec_time else 0,
+    )
+    return total_rows
+
+
+def open_dataset(
+    out_dir: str,
+    only: list = [],
+    tpl_points: dict = base_tpl_points,
+    random_sort: bool = True,
+) -> pd.DataFrame:
+    """Open dataset created by build_dataset as DataFrame.
+    """
+    _, fields = dataset_fields(only, tpl_points)
+    parts = [
+        np.load(os.path.join(out_dir, item["part"]), mmap_mode="r")
+        for item in read_manifest(out_dir)
+        if item["part"]
+    ]
+    data = np.concatenate(parts) if parts else np.zeros((0, len(fields)))
+    data_set = pd.DataFrame(data=data, columns=fields)
+    if random_sort:
+        data_set = data_set.sample(frac=1).reset_index(drop=True)
+
+    return data_set
@@ -9,7 +9,7 @@ try:
     from num_path_opti.num_path_dataset import find_angle_features
 except ImportError as err:
     print("Not available cython implementation:", err)
-    from num_path_base.num_path_dataset import find_angle_features
+    from num_path_base.num_path_vec import find_angle_features
     from num_path_base.num_path_dataset import prepare_image
 else:
     from num_path_opti.num_path_dataset import prepare_image
@@ -3,8 +3,10 @@ from collections.abc import Iterable
 
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image, ImageOps
-from scipy.ndimage.filters import gaussian_filter
+from PIL import Image
+
+from num_prepare import image_prepare
+from num_prepare.image_prepare import find_content_rect  # noqa
 
 SPACE_SIZE = 64
 LIGHTNESS_LIMIT = 0.365
@@ -13,84 +15,27 @@ ONE_FEATURE_COUNT = 7
 SCALE_RATIO = 1000.0
 
 
-def find_content_rect(img: np.array) -> np.array:
-    """Search submatrix with content.
-    """
-    w, h = img.shape
-    x1 = y1 = x2 = y2 = 0
-    for i in range(w):
-        if img[i, :h].max() > LIGHTNESS_LIMIT:
-            x1 = i
-            break
-
-    for i in range(h):
-        if img[:w, i].max() > LIGHTNESS_LIMIT:
-            y1 = i
-            break
-
-    for i in range(w):
-        j = w - i - 1
-        if img[j, :h].max() > LIGHTNESS_LIMIT:
-            x2 = j
-            break
-
-    for i in range(h):
-        j = h - i - 1
-        if img[:w, j].max() > LIGHTNESS_LIMIT:
-            y2 = j
-            break
-
-    return img[x1: x2, y1: y2]
-
-
 def img_resize(img: np.array, size: int = SPACE_SIZE) -> np.array:
     """Resize source image to base image with "size X size".
     Source image in position center after scaling.
     """
-    w, h = img.shape
-    if w >= MIN_SIZE_VALUE and h >= MIN_SIZE_VALUE:
-        if w > h:
-            t_size = (int(size * h / w), size)
-        else:
-            t_size = (size, int(size * w / h))
-
-        new_img = np.array(
-            Image.fromarray(img * 256).resize(t_size, Image.ANTIALIAS)
-        )
-        new_img = new_img / new_img.max()
-        w, h = new_img.shape
-
-        result_img = np.zeros((size, size))
-        delta_i = (size - w) // 2
-        delta_j = (size - h) // 2
-        for i in range(w):
-            for j in range(h):
-                result_img[i + delta_i, j + delta_j] = new_img[i, j]
-
-        return result_img
-    else:
-        return None
+    return image_prepare.img_resize(img, size, MIN_SIZE_VALUE)
 
 
 def prepare_image(img: Image, blur_sigma: int = 3) -> np.array:
     """Create matrix with content.
     """
-    # ImageEnhance.Contrast(img
-    img_m = np.array(
-        ImageOps.invert(img).resize(
-            (SPACE_SIZE, SPACE_SIZE), Image.BICUBIC
-        )
-    ) / 256
-    img_m = img_resize(find_content_rect(img_m))
-    if img_m is None:
-        raise TypeError("Image size problem")
+    return image_prepare.prepare_image(img, SPACE_SIZE, blur_sigma=blur_sigma)
 
-    img_m = gaussian_filter(img_m, sigma=blur_sigma)
-    val_mean = img_m.mean()
-    img_m = img_m - val_mean
-    img_m *= img_m > 0
-    val_max = img_m.max()
-    return img_m / val_max
+
+def prepare_images(
+    imgs: Iterable, blur_sigma: int = 3
+) -> (np.array, np.array):
+    """Prepared images as stack and mask of good images.
+    """
+    return image_prepare.prepare_images(
+        imgs, SPACE_SIZE, blur_sigma=blur_sigma
+    )
 
 
 def line_eq(x1, y1, x2, y2) -> Iterable:
@@ -235,8 +180,6 @@ def find_angle_features(
     ]
     """
     w, h = img.shape
-    center_x = w // 2
-    center_y = h // 2
     points = {}
     step_half = step // 2
 
@@ -259,17 +202,9 @@ def find_angle_features(
             if cur_direc < direc:
                 points[p] = cur_direc, i, j
 
-    if show:
-        img_area = np.zeros((w, h))
-
     path_points = sorted((x, y) for _, x, y in points.values())
     n = len(path_points)
-    if show:
-        for x, y in path_points:
-            img_area[x, y] = 0.3
-
     distance_mx = np.zeros((n, n))
-    lines = {}
     for i in range(n):
         x1, y1 = path_points[i]
         for j in range(n):
@@ -283,7 +218,6 @@ def find_angle_features(
 
                 if line and all(img[x, y] > 0 for x, y in line):
                     # direct
-                    lines[x1, y1, x2, y2] = lines[x2, y2, x1, y1] = line
                     distance_mx[i, j] = distance_mx[j, i] = distance
                 else:
                     # not direct
@@ -305,6 +239,40 @@ def find_angle_features(
     next_path_step(
         result_size * 2, path_points, distance_mx.copy(), result_points
     )
+    return path_features(
+        img,
+        path_points,
+        distance_mx,
+        max_direction,
+        result_points,
+        result_size=result_size,
+        dispersion_center_limit=dispersion_center_limit,
+        show=show,
+        with_label=with_label
+    )
+
+
+def path_features(
+    img: np.array,
+    path_points: list,
+    distance_mx: np.array,
+    max_direction: float,
+    result_points: list,
+    result_size: int = 6,
+    dispersion_center_limit: float = 0.215,
+    show: bool = False,
+    with_label: int = None
+) -> np.array:
+    """Features of angles in path (see find_angle_features).
+    """
+    w, h = img.shape
+    center_x = w // 2
+    center_y = h // 2
+    if show:
+        img_area = np.zeros((w, h))
+        for x, y in path_points:
+            img_area[x, y] = 0.3
+
     angles = []
     for index, x, y in result_points:
         if not angles:
@@ -358,9 +326,9 @@ def find_angle_features(
 
         if show:
             result_tmp = img_area.copy()
-            for x, y in lines[x1, y1, x2, y2]:
+            for x, y in line_eq(x1, y1, x2, y2):
                 result_tmp[x, y] = 1
-            for x, y in lines[x3, y3, x1, y1]:
+            for x, y in line_eq(x3, y3, x1, y1):
                 result_tmp[x, y] = 1
 
             plt.imshow(result_tmp, interpolation="nearest", cmap="gray")
@@ -374,10 +342,10 @@ def find_angle_features(
         return None
 
     try:
-        estimation_distance_incenter = np.abs(np.stack(
+        estimation_distance_incenter = np.abs(np.stack([
             distance_mx[p_index1, p_index2]
             for p_index1, p_index2 in itertools.combinations(center_points, 2)
-        )).std()
+        ])).std()
     except (ValueError, IndexError):
         return None
 
@@ -0,0 +1,183 @@
+# Vectorized implementation of find_angle_features with the same result
+# as num_path_dataset.find_angle_features (numpy only, without cython).
+import numpy as np
+
+from .num_path_dataset import ONE_FEATURE_COUNT  # noqa
+from .num_path_dataset import SCALE_RATIO
+from .num_path_dataset import SPACE_SIZE
+from .num_path_dataset import path_features
+from .num_path_dataset import prepare_image  # noqa
+from .num_path_dataset import triangle_sq
+
+
+def find_path_points(img: np.array, step: int = 6) -> list:
+    """Points of path, one point in each cell "step X step" with content.
+    Image is viewed as blocks of cells, pixels of all cells are checked
+    together in the order of the base method (rows of cell).
+    """
+    w, h = img.shape
+    n_x, n_y = -(-w // step), -(-h // step)
+    area = np.zeros((n_x * step, n_y * step))
+    area[:w, :h] = img
+    cells = area.reshape(n_x, step, n_y, step).transpose(0, 2, 1, 3)
+    cells = cells.reshape(n_x, n_y, step * step)
+
+    cell_i = (np.arange(n_x) * step)[:, np.newaxis]
+    cell_j = (np.arange(n_y) * step)[np.newaxis, :]
+    direc = np.full((n_x, n_y), SPACE_SIZE * 2.0)
+    x = np.ones((n_x, n_y), dtype=int)
+    y = np.ones((n_x, n_y), dtype=int)
+    found = np.zeros((n_x, n_y), dtype=bool)
+    for k in range(step * step):
+        d_i, d_j = divmod(k, step)
+        i = cell_i + d_i
+        j = cell_j + d_j
+        cur_direc = np.sqrt((y - j) ** 2 + (x - i) ** 2)
+        update = (cells[:, :, k] != 0) & (cur_direc < direc)
+        direc = np.where(update, cur_direc, direc)
+        x = np.where(update, i, x)
+        y = np.where(update, j, y)
+        found |= update
+
+    return sorted(zip(x[found].tolist(), y[found].tolist()))
+
+
+def line_of_sight(
+    img: np.array,
+    x1: np.array,
+    y1: np.array,
+    x2: np.array,
+    y2: np.array
+) -> np.array:
+    """Check of content on lines between pairs of points as in line_eq,
+    all lines are checked by one lookup into the image.
+    """
+    dx, dy = x2 - x1, y2 - y1
+    hori = np.abs(dx) > np.abs(dy)
+    # main axis of line and other axis
+    a1 = np.where(hori, x1, y1)
+    b1 = np.where(hori, y1, x1)
+    da = np.where(hori, dx, dy)
+    db = np.where(hori, dy, dx)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = db / da * SCALE_RATIO
+
+    size = np.abs(da)
+    line_steps = np.arange(max(int(size.max(initial=0)), 1))
+    valid = line_steps[np.newaxis, :] < size[:, np.newaxis]
+    a = np.minimum(a1, a1 + da)[:, np.newaxis] + line_steps[np.newaxis, :]
+    with np.errstate(invalid="ignore"):
+        b = np.round((a - a1[:, np.newaxis]) * k[:, np.newaxis])
+        b = np.where(valid, b // SCALE_RATIO, 0).astype(int)
+
+    b += b1[:, np.newaxis]
+    a = np.where(valid, a, 0)
+    b = np.where(valid, b, 0)
+    x = np.where(hori[:, np.newaxis], a, b)
+    y = np.where(hori[:, np.newaxis], b, a)
+    return (size > 0) & np.all((img[x, y] > 0) | ~valid, axis=1)
+
+
+def distance_matrix(img: np.array, path_points: list) -> np.array:
+    """Distances between all points,
+    negative value if a line between points is not direct.
+    """
+    points = np.array(path_points, dtype=int).reshape(-1, 2)
+    n = len(points)
+    index_1, index_2 = np.triu_indices(n, k=1)
+    x1, y1 = points[index_1].T
+    x2, y2 = points[index_2].T
+    distance = np.sqrt((y1 - y2) ** 2 + (x1 - x2) ** 2)
+    direct = line_of_sight(img, x1, y1, x2, y2)
+    distance = np.where(direct, distance, -distance)
+    distance_mx = np.zeros((n, n))
+    distance_mx[index_1, index_2] = distance
+    distance_mx[index_2, index_1] = distance
+    return distance_mx
+
+
+def next_path_steps(
+    step_limit: int,
+    all_points: list,
+    distance_mx: np.array,
+    result_points: list
+):
+    """Bypass points with maximization of area of triangles
+    (see num_path_dataset.next_path_step), candidates of step are
+    checked together.
+    """
+    points = np.array(all_points, dtype=int).reshape(-1, 2)
+    left = False
+    while len(result_points) <= step_limit:
+        if left:
+            (p0, x1, y1), (p1, x2, y2), *_ = result_points
+        else:
+            *_, (p1, x2, y2), (p0, x1, y1) = result_points
+
+        distance_mx[p0, p1] = 0
+        distance_mx[p1, p0] = 0
+        other_x_distace = distance_mx[p0, :]
+        # for equal distances only the first point is a candidate
+        values, candidates = np.unique(other_x_distace, return_index=True)
+        candidates = np.sort(candidates[values > 0])
+        candidates = candidates[
+            ~np.isin(candidates, [index for index, *_ in result_points])
+        ]
+        if not len(candidates):
+            return
+
+        x3, y3 = points[candidates].T
+        with np.errstate(invalid="ignore"):
+            sq = np.nan_to_num(triangle_sq(x1, y1, x2, y2, x3, y3), nan=0)
+
+        best = int(np.argmax(sq))
+        if sq[best] <= 0:
+            return
+
+        next_point = int(candidates[best]), int(x3[best]), int(y3[best])
+        if left:
+            result_points.insert(0, next_point)
+        else:
+            result_points.append(next_point)
+
+        left = not left
+
+
+def find_angle_features(
+    img: np.array,
+    step: int = 6,
+    result_size: int = 6,
+    dispersion_center_limit: float = 0.215,
+    show: bool = False,
+    with_label: int = None
+) -> np.array:
+    """Create features from image with the same layout as
+    num_path_dataset.find_angle_features.
+    """
+    path_points = find_path_points(img, step)
+    distance_mx = distance_matrix(img, path_points)
+
+    # max line as first step in path
+    (i, *_), (j, *_) = np.where(distance_mx == np.amax(distance_mx))
+
+    max_direction = max(np.abs(distance_mx.min()), distance_mx.max())
+    # normalization with space size
+    distance_mx = np.round(distance_mx / max_direction, 4)
+
+    x1, y1 = path_points[i]
+    x2, y2 = path_points[j]
+    result_points = [(i, x1, y1), (j, x2, y2)]
+    next_path_steps(
+        result_size * 2, path_points, distance_mx.copy(), result_points
+    )
+    return path_features(
+        img,
+        path_points,
+        distance_mx,
+        max_direction,
+        result_points,
+        result_size=result_size,
+        dispersion_center_limit=dispersion_center_limit,
+        show=show,
+        with_label=with_label
+    )
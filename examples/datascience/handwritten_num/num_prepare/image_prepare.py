@@ -0,0 +1,147 @@
+# Preprocessing of images with numbers (common for num_path_base,
+# num_tpl_base, ann_numbers and recognumbers), one image or stack of images.
+import typing
+
+import numpy as np
+from PIL import Image, ImageOps
+from scipy.ndimage import gaussian_filter
+
+LIGHTNESS_LIMIT = 0.365
+MIN_SIZE_VALUE = 3
+SPARSE_SEED = 1024
+
+
+def content_bounds(
+    imgs: np.array, limit: typing.Union[float, np.array] = LIGHTNESS_LIMIT
+) -> np.array:
+    """Bounds of content (x1, x2, y1, y2) for stack of images
+    (first and last row and column with value over limit, 0 without).
+    """
+    content = imgs > np.reshape(limit, (-1, 1, 1))
+    bounds = []
+    for axis in (2, 1):
+        lines = content.any(axis=axis)
+        found = lines.any(axis=1)
+        first = np.argmax(lines, axis=1)
+        last = lines.shape[1] - 1 - np.argmax(lines[:, ::-1], axis=1)
+        bounds.append(np.where(found, first, 0))
+        bounds.append(np.where(found, last, 0))
+
+    return np.stack(bounds, axis=1)
+
+
+def find_content_rect(
+    img: np.array, limit: float = LIGHTNESS_LIMIT
+) -> np.array:
+    """Search submatrix with content.
+    """
+    (x1, x2, y1, y2), = content_bounds(img[np.newaxis], limit)
+    return img[x1: x2, y1: y2]
+
+
+def center_image(img: np.array, size: int) -> np.array:
+    """Image in center of empty image "size X size".
+    """
+    w, h = img.shape
+    result_img = np.zeros((size, size))
+    delta_i = (size - w) // 2
+    delta_j = (size - h) // 2
+    result_img[delta_i:delta_i + w, delta_j:delta_j + h] = img
+    return result_img
+
+
+def img_resize(
+    img: np.array, size: int, min_size: int = MIN_SIZE_VALUE
+) -> np.array:
+    """Resize source image to base image with "size X size".
+    Source image in position center after scaling.
+    """
+    w, h = img.shape
+    if w < max(min_size, 1) or h < max(min_size, 1):
+        return None
+
+    if w > h:
+        t_size = (int(size * h / w), size)
+    else:
+        t_size = (size, int(size * w / h))
+
+    new_img = np.array(
+        Image.fromarray(img * 256).resize(t_size, Image.LANCZOS)
+    )
+    return center_image(new_img / new_img.max(), size)
+
+
+def normalize(imgs: np.array, blur_sigma: float) -> np.array:
+    """Blur, values over mean of image only, scale to 0-1
+    (for stack of images).
+    """
+    imgs = gaussian_filter(imgs, sigma=(0, blur_sigma, blur_sigma))
+    imgs = imgs - imgs.mean(axis=(1, 2), keepdims=True)
+    imgs *= imgs > 0
+    return imgs / imgs.max(axis=(1, 2), keepdims=True)
+
+
+def sparsify(
+    img: np.array, ratio: float, seed: int = SPARSE_SEED
+) -> typing.Tuple[np.array, int]:
+    """Keep ratio of points with content, points are selected
+    with fixed seed (the same result for the same image).
+    """
+    points = np.flatnonzero(img > 0)
+    volume = int(len(points) * ratio)
+    order = np.random.default_rng(seed).permutation(len(points))
+    result = np.zeros(img.size)
+    keep = points[order[:volume]]
+    result[keep] = img.flat[keep]
+    return result.reshape(img.shape), volume
+
+
+def source_matrix(img: Image, source_size: int) -> np.array:
+    return np.array(
+        ImageOps.invert(img).resize(
+            (source_size, source_size), Image.BICUBIC
+        )
+    ) / 256
+
+
+def prepare_images(
+    imgs: typing.Iterable[Image],
+    size: int,
+    source_size: int = None,
+    blur_sigma: float = 3
+) -> typing.Tuple[np.array, np.array]:
+    """Stack of prepared images and mask of images with content
+    (stack has only good images).
+    """
+    source_size = source_size or size
+    sources = np.stack([source_matrix(img, source_size) for img in imgs])
+    bounds = content_bounds(sources)
+    resized = [
+        img_resize(img[x1: x2, y1: y2], size)
+        for img, (x1, x2, y1, y2) in zip(sources, bounds)
+    ]
+    good = np.array([img is not None for img in resized], dtype=bool)
+    if not good.any():
+        return np.zeros((0, size, size)), good
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = normalize(
+            np.stack([img for img in resized if img is not None]), blur_sigma
+        )
+
+    return result, good
+
+
+def prepare_image(
+    img: Image,
+    size: int,
+    source_size: int = None,
+    blur_sigma: float = 3
+) -> np.array:
+    """Create matrix with content.
+    """
+    result, good = prepare_images([img], size, source_size, blur_sigma)
+    if not good.all():
+        raise TypeError("Image size problem")
+
+    return result[0]
@@ -1,8 +1,14 @@
 
+import hashlib
+import json
+import os
+
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image, ImageOps
-from scipy.ndimage.filters import gaussian_filter
+from PIL import Image
+
+from num_prepare import image_prepare
+from num_prepare.image_prepare import find_content_rect  # noqa
 
 SPACE_SIZE = 64
 LIGHTNESS_LIMIT = 0.365
@@ -87,94 +93,39 @@ def create_templates(
     return tpls, fearure_size
 
 
-def find_content_rect(img: np.array) -> np.array:
-    """Search submatrix with content.
-    """
-    w, h = img.shape
-    x1 = y1 = x2 = y2 = 0
-    for i in range(w):
-        if img[i, :h].max() > LIGHTNESS_LIMIT:
-            x1 = i
-            break
-
-    for i in range(h):
-        if img[:w, i].max() > LIGHTNESS_LIMIT:
-            y1 = i
-            break
-
-    for i in range(w):
-        j = w - i - 1
-        if img[j, :h].max() > LIGHTNESS_LIMIT:
-            x2 = j
-            break
-
-    for i in range(h):
-        j = h - i - 1
-        if img[:w, j].max() > LIGHTNESS_LIMIT:
-            y2 = j
-            break
-
-    return img[x1: x2, y1: y2]
-
-
 def img_resize(img: np.array, size: int = SPACE_SIZE) -> np.array:
     """Resize source image to base image with "size X size".
     Source image in position center after scaling.
     """
-    w, h = img.shape
-    if w >= MIN_SIZE_VALUE and h >= MIN_SIZE_VALUE:
-        if w > h:
-            t_size = (int(size * h / w), size)
-        else:
-            t_size = (size, int(size * w / h))
-
-        new_img = np.array(
-            Image.fromarray(img * 256).resize(t_size, Image.ANTIALIAS)
-        )
-        new_img = new_img / new_img.max()
-        w, h = new_img.shape
-
-        result_img = np.zeros((size, size))
-        delta_i = (size - w) // 2
-        delta_j = (size - h) // 2
-        for i in range(w):
-            for j in range(h):
-                result_img[i + delta_i, j + delta_j] = new_img[i, j]
-
-        return result_img
-    else:
-        return None
+    return image_prepare.img_resize(img, size, MIN_SIZE_VALUE)
 
 
 def prepare_image(
     img: Image, blur_sigma: int = 2, discharge_ratio: float = 0.15
 ) -> (np.array, int):
-    """Create matrix with content.
+    """Create matrix with content and part of points
+    (discharge_ratio, the same points for the same image).
     """
-    # ImageEnhance.Contrast(img
-    img_m = np.array(
-        ImageOps.invert(img).resize(
-            (SPACE_SIZE, SPACE_SIZE), Image.BICUBIC
-        )
-    ) / 256
-    img_m = img_resize(find_content_rect(img_m))
-    if img_m is None:
-        raise TypeError("Image size problem")
-
-    img_m = gaussian_filter(img_m, sigma=blur_sigma)
-    val_mean = img_m.mean()
-    img_m = img_m - val_mean
-    img_m *= img_m > 0
-    val_max = img_m.max()
-    img_m = img_m / val_max
-    volume = (img_m > 0).sum()
-    limit = volume * discharge_ratio
-    while volume > limit:
-        nose = np.random.rand(*img_m.shape) > 0.5
-        img_m = img_m * nose
-        volume = (img_m > 0).sum()
-
-    return img_m, volume
+    img_m = image_prepare.prepare_image(
+        img, SPACE_SIZE, blur_sigma=blur_sigma
+    )
+    return image_prepare.sparsify(img_m, discharge_ratio)
+
+
+def prepare_images(
+    imgs: list, blur_sigma: int = 2, discharge_ratio: float = 0.15
+) -> (np.array, np.array, np.array):
+    """Stack of prepared images (as prepare_image), volumes
+    and mask of good images.
+    """
+    imgs_m, good = image_prepare.prepare_images(
+        imgs, SPACE_SIZE, blur_sigma=blur_sigma
+    )
+    volumes = np.zeros(len(imgs_m), dtype=int)
+    for i, img_m in enumerate(imgs_m):
+        imgs_m[i], volumes[i] = image_prepare.sparsify(img_m, discharge_ratio)
+
+    return imgs_m, volumes, good
 
 
 def create_tpl(img: np.array, radius_ratio: float = 0.08) -> np.array:
@@ -231,3 +182,126 @@ def templates_scores(
         ),
         precision
     )
+
+
+def sparse_templates(tpls: list) -> dict:
+    """All masks of templates (from create_templates) as one array
+    of pixel indexes and weights (T * P masks, max pixels in mask):
+        indexes, weights - pixels of masks (weight 0 in free places),
+        tpl_sizes - count of masks (points) in each template.
+    """
+    masks = [mask for _, tpl in tpls for mask in tpl]
+    size = masks[0].shape[0] if masks else SPACE_SIZE
+    pixels = [np.flatnonzero(mask) for mask in masks]
+    width = max((len(item) for item in pixels), default=0)
+    indexes = np.zeros((len(masks), width), dtype=np.int32)
+    weights = np.zeros((len(masks), width))
+    for i, mask in enumerate(masks):
+        count = len(pixels[i])
+        indexes[i, :count] = pixels[i]
+        weights[i, :count] = mask.flat[pixels[i]]
+
+    return {
+        "nums": np.array([num for num, _ in tpls], dtype=np.int32),
+        "tpl_sizes": np.array([len(tpl) for _, tpl in tpls], dtype=np.int32),
+        "indexes": indexes,
+        "weights": weights,
+        "size": np.array(size),
+    }
+
+
+def cached_sparse_templates(
+    tpl_points: dict = base_tpl_points,
+    cache_dir: str = os.path.join(
+        os.path.expanduser("~"), ".cache", "num_tpl"
+    )
+) -> dict:
+    """Sparse templates (see sparse_templates) from cache file,
+    the file is created for new points of templates.
+    """
+    key = hashlib.md5(json.dumps(
+        [SPACE_SIZE, sorted(tpl_points.items())]
+    ).encode()).hexdigest()
+    path = os.path.join(cache_dir, f"tpl_{key}.npz")
+    if os.path.exists(path):
+        with np.load(path) as data:
+            return dict(data)
+
+    tpls, _ = create_templates(False, tpl_points)
+    result = sparse_templates(tpls)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as cache_file:
+        np.savez(cache_file, **result)
+
+    os.replace(tmp_path, path)
+    return result
+
+
+def _hit_share_table(sizes: np.array) -> dict:
+    """Sum of 1 / n for k points as in templates_scores.
+    """
+    table = {}
+    for n in set(sizes.tolist()):
+        values = np.zeros(n + 1)
+        for k in range(n):
+            values[k + 1] = values[k] + 1 / n
+
+        table[n] = values
+
+    return table
+
+
+def batch_templates_scores(
+    imgs: np.array, sparse_tpls: dict, precision: int = 4
+) -> np.array:
+    """Scores of all templates for batch of images (B, size, size)
+    in one pass, row of result is the same as concatenation of
+    templates_scores for each template.
+    """
+    imgs = np.asarray(imgs)
+    count, size, _ = imgs.shape
+    flat_imgs = imgs.reshape(count, -1)
+    total_points = (flat_imgs > 0).sum(axis=1)
+    close_imgs = np.where(flat_imgs > 0, 1 - flat_imgs, 0)
+
+    # (B, T * P, pixels in mask)
+    distances = close_imgs[:, sparse_tpls["indexes"]] * sparse_tpls["weights"]
+    in_points = distances > 0
+    point_count = in_points.sum(axis=2)
+    hits = point_count > 0
+    safe_count = np.maximum(point_count, 1)
+
+    share = np.where(
+        hits, point_count / np.maximum(total_points, 1)[:, np.newaxis], 0
+    )
+    mean = np.where(hits, distances.sum(axis=2) / safe_count / size, 0)
+    # median of points in mask, other values are moved to end
+    ordered = np.sort(np.where(in_points, distances, np.inf), axis=2)
+    low = np.take_along_axis(
+        ordered, ((safe_count - 1) // 2)[:, :, np.newaxis], axis=2
+    )[:, :, 0]
+    high = np.take_along_axis(
+        ordered, (safe_count // 2)[:, :, np.newaxis], axis=2
+    )[:, :, 0]
+    median = np.where(hits, (low + high) / 2 / size, 0)
+    # rows in C order: means of template masks are summed in the same
+    # order as 1-D means of templates_scores (the same rounding)
+    share, mean, median = (
+        np.ascontiguousarray(item) for item in (share, mean, median)
+    )
+
+    tpl_sizes = sparse_tpls["tpl_sizes"]
+    hit_share = _hit_share_table(tpl_sizes)
+    result = np.zeros((count, len(tpl_sizes) * 5))
+    begin = 0
+    for t, n in enumerate(tpl_sizes.tolist()):
+        end = begin + n
+        result[:, t * 5] = share[:, begin:end].mean(axis=1)
+        result[:, t * 5 + 1] = mean[:, begin:end].mean(axis=1)
+        result[:, t * 5 + 2] = np.median(mean[:, begin:end], axis=1)
+        result[:, t * 5 + 3] = median[:, begin:end].mean(axis=1)
+        result[:, t * 5 + 4] = hit_share[n][hits[:, begin:end].sum(axis=1)]
+        begin = end
+
+    return np.round(result, precision)
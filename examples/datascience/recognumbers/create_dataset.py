@@ -1,16 +1,24 @@
+import concurrent.futures
+import functools
+import json
 import os
 import sys
 import random
+import uuid
 import numpy as np
 import matplotlib.pyplot as plt
-from collections import Iterable, defaultdict
+from collections import defaultdict
+from collections.abc import Iterable
 import math
+from time import monotonic
 from PIL import Image, ImageOps
 
-from recognumbers.numimg import (
+from recognumbers.numimg_vec import (
     fill_by_surr, find_content_rect, base_points, slope_rank, resize
 )
 
+MANIFEST_NAME = "manifest.jsonl"
+
 
 def numbers_data_files(base_dir: str):
     """Images and numbers.
@@ -32,32 +40,208 @@ def numbers_data_files(base_dir: str):
             yield from numbers_data_files(sub_dir)
 
 
+def image_features(img_path: str, size: int = 64) -> np.array:
+    """Ranks of image (see slope_rank).
+    """
+    img = np.array(ImageOps.invert(Image.open(img_path).convert("L")))
+    img = img / img.max()
+    img = find_content_rect(img)
+    w_img = fill_by_surr(resize(img, size))
+    w_img = w_img / w_img.max()
+    points = base_points(w_img)
+    return np.asarray(list(slope_rank(w_img, points)))
+
+
+def build_chunk(out_dir: str, chunk: list, size: int = 64) -> dict:
+    """Features of images in chunk saved to new part of dataset:
+    float32 matrix of features and vector of numbers (.npy).
+    """
+    nums = []
+    rows = []
+    bad = []
+    for num, img_path in chunk:
+        try:
+            rows.append(image_features(img_path, size))
+        except Exception as err:
+            print("Error", err, "in", img_path)
+            bad.append(img_path)
+            continue
+
+        nums.append(num)
+
+    part = None
+    if rows:
+        part = f"part_{uuid.uuid4().hex[:12]}"
+        for name, data in (
+            ("x", np.array(rows, dtype=np.float32)),
+            ("y", np.array(nums, dtype=np.int8)),
+        ):
+            tmp_path = os.path.join(out_dir, f"{part}_{name}.npy.tmp")
+            with open(tmp_path, "wb") as part_file:
+                np.save(part_file, data)
+
+            os.replace(tmp_path, os.path.join(out_dir, f"{part}_{name}.npy"))
+
+    return {
+        "part": part,
+        "files": [img_path for _, img_path in chunk],
+        "bad": bad,
+        "rows": len(rows),
+    }
+
+
+def read_manifest(out_dir: str) -> list:
+    """Finished chunks of dataset.
+    """
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return []
+
+    result = []
+    with open(path) as manifest:
+        for line in manifest:
+            try:
+                result.append(json.loads(line))
+            except ValueError:
+                # a line from interrupted writing
+                continue
+
+    return result
+
+
+def build_dataset(
+    base_dir: str,
+    out_dir: str,
+    size: int = 64,
+    workers: int = None,
+    chunk_size: int = 100,
+) -> int:
+    """Create features in pool of processes as parts of dataset (.npy)
+    in out_dir, finished parts are listed in manifest and
+    processed files are skipped after restart.
+    Return count of new rows.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    done = {
+        img_path
+        for item in read_manifest(out_dir)
+        for img_path in item["files"]
+    }
+    numbers = sorted((
+        (random.random(), num, img_path)
+        for num, img_path in numbers_data_files(base_dir)
+        if img_path not in done
+    ))
+    files = [(num, img_path) for _, num, img_path in numbers]
+    chunks = [
+        files[start: start + chunk_size]
+        for start in range(0, len(files), chunk_size)
+    ]
+
+    start_time = monotonic()
+    total_rows = total_bad = 0
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers
+    ) as executor, open(
+        os.path.join(out_dir, MANIFEST_NAME), "a"
+    ) as manifest:
+        for item in executor.map(
+            functools.partial(build_chunk, out_dir, size=size), chunks
+        ):
+            manifest.write(json.dumps(item) + "\n")
+            manifest.flush()
+            os.fsync(manifest.fileno())
+            total_rows += item["rows"]
+            total_bad += len(item["bad"])
+            print("Good:", total_rows, "Bad:", total_bad)
+
+    print(
+        "Good:", total_rows,
+        "Bad:", total_bad,
+        "Skipped:", len(done),
+        "exec time", round(monotonic() - start_time, 2), "sec",
+    )
+    return total_rows
+
+
+def open_dataset(out_dir: str) -> (np.array, np.array):
+    """Features (float32 matrix) and numbers of dataset from build_dataset,
+    parts are read by memory map directly into the matrix.
+    """
+    parts = [
+        tuple(
+            np.load(
+                os.path.join(out_dir, f"{item['part']}_{name}.npy"),
+                mmap_mode="r"
+            )
+            for name in ("x", "y")
+        )
+        for item in read_manifest(out_dir)
+        if item["part"]
+    ]
+    if not parts:
+        return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int8)
+
+    features = np.empty(
+        (sum(len(x) for x, _ in parts), parts[0][0].shape[1]),
+        dtype=np.float32
+    )
+    np.concatenate([x for x, _ in parts], out=features)
+    return features, np.concatenate([y for _, y in parts])
+
+
+def json_to_dataset(json_path: str, out_dir: str, chunk_size: int = 10000):
+    """Convert dataset of run (JSON) to parts of build_dataset.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with open(json_path) as data_file:
+        data = [item for item in json.load(data_file) if item]
+
+    with open(os.path.join(out_dir, MANIFEST_NAME), "a") as manifest:
+        for start in range(0, len(data), chunk_size):
+            rows = np.array(data[start: start + chunk_size])
+            part = f"part_{uuid.uuid4().hex[:12]}"
+            np.save(
+                os.path.join(out_dir, f"{part}_x.npy"),
+                rows[:, 1:].astype(np.float32)
+            )
+            np.save(
+                os.path.join(out_dir, f"{part}_y.npy"),
+                rows[:, 0].astype(np.int8)
+            )
+            item = {
+                "part": part,
+                "files": [],
+                "bad": [],
+                "rows": len(rows),
+            }
+            manifest.write(json.dumps(item) + "\n")
+
+
 def run(size: int=64):
     path = sys.argv[1]
+    out_path = sys.argv[2]
+    if not out_path.endswith(".json"):
+        # directory with parts of dataset (.npy)
+        build_dataset(path, out_path, size)
+        return
+
     # #
     numbers = sorted((
         (random.random(), num, img_path)
         for num, img_path in numbers_data_files(path)
     ))
 
-    out_path = sys.argv[2]
-
     with open(out_path, "w") as out_file:
         out_file.write("[\n")
         for _, num, img_path in numbers:
             try:
-                img = np.array(ImageOps.invert(Image.open(img_path).convert("L")))
-                img = img / img.max()
-                img = find_content_rect(img)
-                w_img = fill_by_surr(resize(img, size))
+                rank_list = image_features(img_path, size)
             except Exception as err:
                 print("Error", err, "in", img_path)
                 continue
 
-            w_img = w_img / w_img.max()
-            points = base_points(w_img)
-            rank_list = list(slope_rank(w_img, points))
-
             out_file.write(
                 "[{},{}],\n".format(num, ",".join(map(str, rank_list)))
             )
@@ -65,4 +249,5 @@ def run(size: int=64):
         out_file.write("[]\n]\n")
 
 
-run()
+if __name__ == "__main__":
+    run()
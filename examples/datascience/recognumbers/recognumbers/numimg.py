@@ -1,13 +1,29 @@
 import gc
+import importlib.util
 import os
 import ujson
 import sys
 import numpy as np
 import matplotlib.pyplot as plt
-from collections import Iterable, defaultdict
+from collections import defaultdict
+from collections.abc import Iterable
 import math
 import random
-from PIL import Image, ImageOps
+
+try:
+    from num_prepare import image_prepare
+except ImportError:
+    # common preprocessing with handwritten_num (module by file path)
+    _spec = importlib.util.spec_from_file_location(
+        "num_prepare.image_prepare",
+        os.path.join(
+            os.path.dirname(__file__), "..", "..", "handwritten_num",
+            "num_prepare", "image_prepare.py"
+        )
+    )
+    image_prepare = importlib.util.module_from_spec(_spec)
+    sys.modules[_spec.name] = image_prepare
+    _spec.loader.exec_module(image_prepare)
 
 
 BASE_POINTS_COUNT = 40
@@ -23,32 +39,7 @@ def sort_random(item) -> float:
 def find_content_rect(img: np.array, intensity: float=0.6) -> np.array:
     """Search submatrix with content.
     """
-    w, h = img.shape
-    mid = img.max() * intensity
-    x1 = y1 = x2 = y2 = 0
-    for i in range(w):
-        if img[i, :h].max() > mid:
-            x1 = i
-            break
-
-    for i in range(h):
-        if img[:w, i].max() > mid:
-            y1 = i
-            break
-
-    for i in range(w):
-        j = w - i - 1
-        if img[j, :h].max() > mid:
-            x2 = j
-            break
-
-    for i in range(h):
-        j = h - i - 1
-        if img[:w, j].max() > mid:
-            y2 = j
-            break
-
-    return img[x1: x2, y1: y2]
+    return image_prepare.find_content_rect(img, img.max() * intensity)
 
 
 def fill_by_surr(img: np.array, surr_rate: float=0.02) -> np.array:
@@ -202,23 +193,4 @@ def resize(img: np.array, size: int=64) -> np.array:
     """Resize source image to base image with "size X size".
     Source image in position center after scaling.
     """
-    w, h = img.shape
-    if w > h:
-        t_size = (int(size * h / w), size)
-    else:
-        t_size = (size, int(size * w / h))
-
-    new_img = np.array(
-        Image.fromarray(img * 256).resize(t_size, Image.ANTIALIAS)
-    )
-    new_img = new_img / new_img.max()
-    w, h = new_img.shape
-
-    result_img = np.zeros((size, size))
-    delta_i = (size - w) // 2
-    delta_j = (size - h) // 2
-    for i in range(w):
-        for j in range(h):
-            result_img[i + delta_i, j + delta_j] = new_img[i, j]
-
-    return result_img
+    return image_prepare.img_resize(img, size, min_size=1)
@@ -0,0 +1,195 @@
+# Vectorized implementation of fill_by_surr, base_points and slope_rank
+# with the same result as numimg (numpy and scipy, without python loops
+# by pixels).
+import math
+import random
+import typing
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .numimg import BASE_POINTS_COUNT
+from .numimg import SLOPE_STEP
+from .numimg import find_content_rect  # noqa
+from .numimg import resize  # noqa
+from .numimg import sort_random
+
+
+def fill_by_surr(img: np.array, surr_rate: float = 0.02) -> np.array:
+    """Filter. Points by surrounded points, sums of windows
+    "[i - dx, i + dx) X [j - dy, j + dy)" by integral image.
+    """
+    w, h = img.shape
+    m_limit = img.max()
+    l_limit = m_limit * 0.4
+    h_limit = m_limit * 0.8
+    dx = int(np.round(w * surr_rate))
+    dy = int(np.round(h * surr_rate))
+    weights = np.where(img > h_limit, 2, np.where(img > l_limit, 1, 0))
+
+    integral = np.zeros((w + 1, h + 1), dtype=np.int64)
+    integral[1:, 1:] = weights.cumsum(axis=0).cumsum(axis=1)
+    x1 = np.clip(np.arange(w) - dx, 0, w)
+    x2 = np.clip(np.arange(w) + dx, 0, w)
+    y1 = np.clip(np.arange(h) - dy, 0, h)
+    y2 = np.clip(np.arange(h) + dy, 0, h)
+    w_arr = (
+        integral[np.ix_(x2, y2)]
+        - integral[np.ix_(x1, y2)]
+        - integral[np.ix_(x2, y1)]
+        + integral[np.ix_(x1, y1)]
+    ).astype(float)
+    return w_arr / w_arr.max()
+
+
+def local_max(
+    img: np.array, i: int, j: int, surr_x: int, surr_y: int
+) -> typing.Tuple[int, int]:
+    """The last point (by rows) with max value in window
+    "[i - surr_x, i + surr_x) X [j - surr_y, j + surr_y)"
+    if it is not less than value of point [i, j].
+    """
+    w, h = img.shape
+    x1, x2 = max(i - surr_x, 0), min(i + surr_x, w)
+    y1, y2 = max(j - surr_y, 0), min(j + surr_y, h)
+    window = img[x1: x2, y1: y2]
+    if not window.size or not window.max() >= img[i, j]:
+        return i, j
+
+    flat = window.ravel()
+    index = flat.size - 1 - int(np.argmax(flat[::-1]))
+    d_x, d_y = divmod(index, window.shape[1])
+    return x1 + d_x, y1 + d_y
+
+
+def scan_points(
+    img: np.array, step: int, surr_x: int, surr_y: int
+) -> typing.Set[typing.Tuple[int, int]]:
+    """Points of local max as in scan of numimg.base_points,
+    only points with value over mean are checked (next point of scan
+    is found for all of them at once).
+    """
+    w, h = img.shape
+    candidates = np.flatnonzero(~(img < img.mean()))
+    cand_x, cand_y = np.divmod(candidates, h)
+    step_sq = step ** 2
+
+    last_x = last_y = 0
+    points = set()
+    pos = 0
+    while pos < len(candidates):
+        far = (
+            (cand_x[pos:] - last_x) ** 2 + (cand_y[pos:] - last_y) ** 2
+        ) >= step_sq
+        shift = int(np.argmax(far))
+        if not far[shift]:
+            break
+
+        pos += shift
+        last_x, last_y = local_max(
+            img, int(cand_x[pos]), int(cand_y[pos]), surr_x, surr_y
+        )
+        points.add((last_x, last_y))
+        pos += 1
+
+    return points
+
+
+def remove_lumps(
+    points: typing.Set[typing.Tuple[int, int]], step: int
+) -> typing.List[typing.Tuple[int, int]]:
+    """Points without close points (distance less than step) with
+    the same choice as numimg.base_points: for each point in order of set
+    all close points after it are removed, pairs are found by KD-tree.
+    """
+    ordered = list(points)
+    if len(ordered) < 2 or step <= 0:
+        return ordered
+
+    # integer distances: dist < step <=> dist ** 2 <= step ** 2 - 1
+    pairs = cKDTree(np.array(ordered)).query_pairs(
+        math.sqrt(step ** 2 - 0.5), output_type="ndarray"
+    )
+    neighbours = [[] for _ in ordered]
+    for index_1, index_2 in pairs.tolist():
+        neighbours[index_1].append(index_2)
+        neighbours[index_2].append(index_1)
+
+    alive = [True] * len(ordered)
+    for index, others in enumerate(neighbours):
+        if alive[index]:
+            for other in others:
+                alive[other] = False
+
+    return [point for point, keep in zip(ordered, alive) if keep]
+
+
+def base_points(
+    img: np.array,
+    step_rate: float = 0.05,
+    center_rate: float = 0.03
+) -> list:
+    """Base points and distances between those.
+    """
+    w, h = img.shape
+    step = max(int(np.round(step_rate * w)), int(np.round(step_rate * h)))
+    surr_x = int(np.round(center_rate * w))
+    surr_y = int(np.round(center_rate * h))
+
+    points = remove_lumps(scan_points(img, step, surr_x, surr_y), step)
+    points = sorted(points, key=sort_random)
+    count_points = len(points)
+    if count_points < BASE_POINTS_COUNT:
+        for _ in range(BASE_POINTS_COUNT - count_points):
+            points.append(random.choice(points))
+
+    return points[:BASE_POINTS_COUNT]
+
+
+def slope_rank(
+    src_area: np.array,
+    points: list,
+    step: int = SLOPE_STEP
+) -> np.array:
+    """Distance from center to points as groups of valuses:
+        For each circle sector with step N degrees [min, mean, median, max]
+    """
+    w, h = src_area.shape
+    dx, dy = w - w // 2, h - h // 2
+    m_dist = math.sqrt(dx ** 2 + dy ** 2)
+    n = 360 // step
+    result = np.zeros((n, 4))
+    if not len(points):
+        return result.ravel()
+
+    x, y = np.array(points, dtype=int).reshape(-1, 2).T
+    x1, y1 = x - dx, y - dy
+    angle = np.degrees(np.arctan2(x1, y1))
+    angle[angle < 0] += 360
+    index = np.minimum(np.round(angle / step).astype(int), n - 1)
+    dist = np.sqrt(x1 ** 2 + y1 ** 2) / m_dist
+
+    # groups of sectors: values in order of points (for mean as np.mean)
+    # and sorted values in each sector
+    counts = np.bincount(index, minlength=n)
+    sectors = np.flatnonzero(counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[sectors]
+    sizes = counts[sectors]
+    in_order = dist[np.argsort(index, kind="stable")]
+    in_sort = dist[np.lexsort((dist, index))]
+    middle_1 = in_sort[starts + (sizes - 1) // 2]
+    middle_2 = in_sort[starts + sizes // 2]
+    # sectors with the same size are summed as rows (the same order of
+    # additions as in np.mean of sector)
+    sums = np.zeros(len(sectors))
+    for size in np.unique(sizes):
+        same = sizes == size
+        sums[same] = in_order[starts[same, np.newaxis] + np.arange(size)].sum(
+            axis=1
+        )
+
+    result[sectors, 0] = in_sort[starts]
+    result[sectors, 1] = sums / sizes
+    result[sectors, 2] = (middle_1 + middle_2) / 2
+    result[sectors, 3] = in_sort[starts + sizes - 1]
+    return result.ravel()
@@ -7,7 +7,7 @@ from collections import Iterable, defaultdict
 import math
 from PIL import Image, ImageOps
 
-from recognumbers.numimg import (
+from recognumbers.numimg_vec import (
     fill_by_surr, find_content_rect, base_points, slope_rank, resize
 )
 
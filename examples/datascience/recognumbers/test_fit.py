@@ -1,8 +1,11 @@
+import os
 import sys
 import ujson
 import numpy as np
 from sklearn.svm import SVC
 
+from create_dataset import open_dataset
+
 size = int(sys.argv[1])
 
 assert 12 <= size <= 512
@@ -11,26 +14,29 @@ assert size % 2 == 0
 dataset_path = sys.argv[2]
 
 
-with open(dataset_path) as datafile:
-    data = [
-        item for item in ujson.loads(datafile.read())
-        if len(item) == size + 1
-    ]
+if os.path.isdir(dataset_path):
+    # parts of dataset from create_dataset.build_dataset
+    features, labels = open_dataset(dataset_path)
+    assert features.shape[1] == size
+else:
+    with open(dataset_path) as datafile:
+        data = np.array([
+            item for item in ujson.loads(datafile.read())
+            if len(item) == size + 1
+        ])
+
+    features, labels = data[:, 1:], data[:, 0].astype(int)
 
-n = len(data)
+n = len(features)
 
 m = int(n * 0.99)
 
 print("Dataset size:", n)
 print("Fit by rows:", m)
 
-numbers = [data[i][0] for i in range(m)]
-
-data_set = np.zeros((m, size))
+numbers = labels[:m]
 
-for i in range(m):
-    for j in range(size):
-        data_set[i, j] = data[i][j + 1]
+data_set = features[:m]
 
 
 model = SVC(
@@ -46,18 +52,18 @@ model.fit(data_set, numbers)
 
 k = 100
 test_index = m + 10
-test = np.zeros((k, size))
+test = features[test_index: test_index + k]
+expected = labels[test_index: test_index + k]
 errors = 0
 
-for i in range(size):
-    for j in range(k):
-        test[j, i] = data[test_index + j][i + 1]
-
 res = model.predict(test)
 
-for j in range(k):
-    print(res[j], "=", data[test_index + j][0], "?")
-    if res[j] != data[test_index + j][0]:
+for j in range(len(test)):
+    print(res[j], "=", expected[j], "?")
+    if res[j] != expected[j]:
         errors += 1
 
-print("Errors:", errors, "({}%)".format(np.round(100 * errors / k)))
+print(
+    "Errors:", errors,
+    "({}%)".format(np.round(100 * errors / max(len(test), 1)))
+)
@@ -6,7 +6,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from PIL import Image, ImageOps
 
-from recognumbers.numimg import (
+from recognumbers.numimg_vec import (
     fill_by_surr, find_content_rect, base_points, slope_rank, resize
 )
 
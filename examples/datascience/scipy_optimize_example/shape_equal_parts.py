@@ -1,11 +1,15 @@
 # howto use (with example image):
 # img = open_img("examples/3.png")
 # create_gif(img, "examples/3_res.gif")
+# many images in pool of processes:
+# results = div_images(open_img(path) for path in paths)
 #    Optimization terminated successfully.
 #         Current function value: 30.000000
 #         Iterations: 18
 #         Function evaluations: 40
 
+import concurrent.futures
+import os
 import typing
 from collections.abc import Iterable
 
@@ -86,6 +90,55 @@ def img_halfs(
     return part_left, part_right
 
 
+def line_columns(
+    h: int, w: int, a_index: float, b_index: float
+) -> np.array:
+    """Column of line (as in img_halfs) for each row of image,
+    points of line_eq are calculated together.
+    """
+    x1, x2 = int(w * a_index), int(w * b_index)
+    dx, dy = x2 - x1, h
+    if abs(dx) > abs(dy):
+        k = dy / dx * SCALE_RATIO
+        x = np.arange(min(x1, x2), max(x1, x2))
+        y = np.round((x - x1) * k) // SCALE_RATIO
+        # the last point of line in row as in dict of img_halfs
+        columns = np.full(h + 1, -1)
+        np.maximum.at(columns, y.astype(int), x)
+        return columns[:h]
+
+    k = dx / dy * SCALE_RATIO
+    y = np.arange(h)
+    return (np.round(y * k) // SCALE_RATIO).astype(int) + x1
+
+
+def row_prefix_counts(img: np.array) -> np.array:
+    """Count of shape pixels in each row before each column.
+    """
+    h, _ = img.shape
+    counts = np.zeros((h, img.shape[1] + 1), dtype=np.int64)
+    np.cumsum(img > 0, axis=1, out=counts[:, 1:])
+    return counts
+
+
+def calc_halfs_diff_prefix(
+    x0: np.array, counts: np.array, way: list
+) -> float:
+    """Shape area diff as calc_halfs_diff with prefix counts of rows
+    (see row_prefix_counts), without images of parts.
+    """
+    x, y = x0
+    if not(0 <= x <= 1 and 0 <= y <= 1):
+        return np.inf
+
+    h, w = counts.shape
+    columns = line_columns(h, w - 1, x, y)
+    left = counts[np.arange(h), columns].sum()
+    diff = np.abs(counts[:, -1].sum() - 2 * left)
+    way.append((x, y, diff))
+    return diff
+
+
 def calc_halfs_diff(x0: np.array, img: np.array, way: list) -> float:
     """Shape area diff.
     """
@@ -100,22 +153,42 @@ def calc_halfs_diff(x0: np.array, img: np.array, way: list) -> float:
 
 
 def div_image(
-    img: np.array, step: float = 0.01
+    img: np.array, step: float = 0.01, disp: bool = True
 ) -> typing.Tuple[np.array, np.array, list]:
     """Divide shape on image by two parts with equal area.
     """
     way = []
     res = minimize(
-        calc_halfs_diff,
+        calc_halfs_diff_prefix,
         np.array([0.5, 0.5]),
-        args=(img, way),
+        args=(row_prefix_counts(img), way),
         method="nelder-mead",
-        options={"disp": True, "xatol": step}
+        options={"disp": disp, "xatol": step}
     )
     part_left, part_right = img_halfs(img, *res.x)
     return part_left, part_right, way
 
 
+def div_images(
+    images: typing.Iterable[np.array],
+    step: float = 0.01,
+    workers: int = None
+) -> typing.List[typing.Tuple[np.array, np.array, list]]:
+    """Divide shapes of many images (as div_image) in pool of processes,
+    results are in order of images.
+    """
+    images = list(images)
+    workers = workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(
+            div_image,
+            images,
+            [step] * len(images),
+            [False] * len(images),
+            chunksize=max(1, len(images) // (workers * 4))
+        ))
+
+
 def create_gif(img: np.array, out_file: str):
     """Run research and save result image as animation.
     """
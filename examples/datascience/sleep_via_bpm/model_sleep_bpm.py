@@ -15,6 +15,8 @@ from keras.layers import LSTM
 from keras.layers import Bidirectional
 from keras.layers import TimeDistributed
 
+from sleep_groups_open import RowsDataset
+
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 os.environ["THEANO_FLAGS"] = "mode=FAST_RUN,device=gpu,floatX=float32"
 
@@ -23,7 +25,9 @@ def open_data_set(
     json_file_path: str,
     random_sort: bool = False
 ) -> typing.Tuple[int, int, np.array, np.array]:
-    """Open prepared data set from json file.
+    """Open prepared data set from json file
+    (for large data sets see sleep_groups_open.write_rows_dataset,
+    path of its directory can be used instead of json file).
     """
     data = []
     with open(json_file_path) as json_file:
@@ -81,26 +85,45 @@ try:
 except (ValueError, IndexError, TypeError):
     pass
 
-n, m, data_x, data_y = open_data_set(dataset_path)
-train_sample_n = int(n * train_sample_size / 100)
-print(f"Data set size: {n} train data set: {train_sample_n}")
-
-train_x = data_x[:train_sample_n, :]
-train_y = data_y[:train_sample_n, :]
-
-model = create_model(80, intervals_count=m)
-
-history = model.fit(
-    train_x.reshape(*(train_x.shape), 1),
-    train_y.reshape(*(train_y.shape), 1),
-    epochs=num_epochs,
-    batch_size=128,
-    callbacks=None,
-    verbose=1
-)
+batch_size = 128
+if os.path.isdir(dataset_path):
+    # shards of write_rows_dataset, rows are read from disk by batches
+    dataset = RowsDataset(dataset_path)
+    n, m = len(dataset), dataset.intervals_count
+    train_rows, test_rows = dataset.split(1 - train_sample_size / 100)
+    train_sample_n = len(train_rows)
+    print(f"Data set size: {n} train data set: {train_sample_n}")
+
+    model = create_model(80, intervals_count=m)
+    history = model.fit(
+        dataset.batches(train_rows, batch_size=batch_size),
+        steps_per_epoch=-(-train_sample_n // batch_size),
+        epochs=num_epochs,
+        callbacks=None,
+        verbose=1
+    )
+    test_x, test_y = dataset.read(np.sort(test_rows))
+else:
+    n, m, data_x, data_y = open_data_set(dataset_path)
+    train_sample_n = int(n * train_sample_size / 100)
+    print(f"Data set size: {n} train data set: {train_sample_n}")
+
+    train_x = data_x[:train_sample_n, :]
+    train_y = data_y[:train_sample_n, :]
+
+    model = create_model(80, intervals_count=m)
+
+    history = model.fit(
+        train_x.reshape(*(train_x.shape), 1),
+        train_y.reshape(*(train_y.shape), 1),
+        epochs=num_epochs,
+        batch_size=batch_size,
+        callbacks=None,
+        verbose=1
+    )
 
-test_x = data_x[train_sample_n:, :]
-test_y = data_y[train_sample_n:, :]
+    test_x = data_x[train_sample_n:, :]
+    test_y = data_y[train_sample_n:, :]
 
 answer = model.predict_classes(test_x.reshape(*(test_x.shape), 1),)
 
@@ -1,7 +1,10 @@
+import concurrent.futures
 import gc
+import io
+import json
+import mmap
 import os
 import re
-import io
 import typing
 import random
 from datetime import datetime, time, timedelta
@@ -15,37 +18,11 @@ dt_search = re.compile(
 )
 
 
-def create_data(
-    # src dir expected in work dir
-    work_dir: str,
-    out_file: str = "pulse_and_sleep.csv",
-    bad_score: int = 50,
-    providers: typing.List[str] = [],
-    min_count_in_day: int = 288
-):
-    """Preparation of the single dataset CSV file with
-    sleep interval and pulse measurements.
-    WARNING: necessary a lot of RAM (or SWAP)
-    Pulse measurements in many csv files:
-    /<work dir>/src/sleep_pulse_gr<file number>.csv
-    Format:
-    user_1;withings;integration.api;2020-04-05T12:40:33+03:00;55.0;False;False
-    user_2;withings;integration.api;2020-04-05T12:40:33+03:00;49.73;True;False
-    user_3;applehealth;com.garmin.connect.mobile;2020-02-19T00:00:00+00:00;64.0;False;True
-    user_3;applehealth;com.garmin.connect.mobile;2020-02-19T00:02:00+00:00;66.0;False;False
-    user_3;applehealth;com.garmin.connect.mobile;2020-02-19T00:04:00+00:00;66.0;False;False
-
-    All sleep data from file /<work dir>/src/sleep_groups.csv
-    intervals in format:
-    id        <user 1>  20      2020-03-08      2020-03-08 21:29:00+00  2020-03-08 23:40:00+00  0
-    id        <user 2>  80      2020-02-24      2020-02-24 12:14:00+00  2020-02-24 12:26:00+00  39600
-    id        <user 3> 10      2020-03-09      2020-03-08 22:38:00+00  2020-03-09 05:32:00+00  3600
-    id        <user 4> 40      2020-02-17      2020-02-17 05:40:00+00  2020-02-17 13:10:00+00  -21600
-    id        <user 5> 10      2020-02-26      2020-02-26 07:02:27+00  2020-02-26 17:00:04+00  -18000
-    id        <user 4> 50      2020-02-19      2020-02-19 02:40:00+00  2020-02-19 14:05:00+00  -21600
-    id        <user 4> 50      2020-02-20      2020-02-20 05:15:00+00  2020-02-20 13:15:00+00  -21600
-    Columns: id, user id, score, day date, begin datetime, end datetime, offset
-    score - is estimate of quality of current row
+def open_sleep_groups(
+    work_dir: str, bad_score: int = 50
+) -> typing.Tuple[pd.DataFrame, pd.DataFrame]:
+    """All sleep intervals from /<work dir>/src/sleep_groups.csv
+    (format in create_data) and suitable intervals.
     """
     data = pd.read_csv(
         os.path.join(work_dir, "src", "sleep_groups.csv"),
@@ -54,9 +31,9 @@ def create_data(
     )
 
     data.columns = ["id", "user_id", "score", "day", "begin", "end", "offset"]
-    data.day = data.day.astype("datetime64")
-    data.begin = data.begin.astype("datetime64")
-    data.end = data.end.astype("datetime64")
+    data.day = pd.to_datetime(data.day)
+    data.begin = pd.to_datetime(data.begin, utc=True).dt.tz_localize(None)
+    data.end = pd.to_datetime(data.end, utc=True).dt.tz_localize(None)
     data.set_index("id", inplace=True)
     data["offset_time"] = "Sec"
     data["offset"] = (
@@ -78,13 +55,12 @@ def create_data(
     )
 
     good_sleep = data[mask & (data.score < bad_score)]
-    actual_sleep_days = set()
-    one_day = pd.Timedelta("1Day")
-    for dt, user in good_sleep[["day", "user_id"]].itertuples(index=False):
-        actual_sleep_days.add((dt - one_day, user))
-        actual_sleep_days.add((dt + one_day, user))
-        actual_sleep_days.add((dt, user))
+    return data, good_sleep
 
+
+def pulse_files(work_dir: str) -> typing.List[str]:
+    """Paths of CSV files with pulse measurements in /<work dir>/src/.
+    """
     path_data = []
     path = os.path.join(work_dir, "src")
     for root, _, files in os.walk(path, topdown=False):
@@ -94,6 +70,50 @@ def create_data(
             if "sleep_pulse" in file_path and "csv" == ext:
                 path_data.append(os.path.join(root, file_path))
 
+    return path_data
+
+
+def create_data(
+    # src dir expected in work dir
+    work_dir: str,
+    out_file: str = "pulse_and_sleep.csv",
+    bad_score: int = 50,
+    providers: typing.List[str] = [],
+    min_count_in_day: int = 288
+):
+    """Preparation of the single dataset CSV file with
+    sleep interval and pulse measurements.
+    WARNING: necessary a lot of RAM (or SWAP)
+    Pulse measurements in many csv files:
+    /<work dir>/src/sleep_pulse_gr<file number>.csv
+    Format:
+    user_1;withings;integration.api;2020-04-05T12:40:33+03:00;55.0;False;False
+    user_2;withings;integration.api;2020-04-05T12:40:33+03:00;49.73;True;False
+    user_3;applehealth;com.garmin.connect.mobile;2020-02-19T00:00:00+00:00;64.0;False;True
+    user_3;applehealth;com.garmin.connect.mobile;2020-02-19T00:02:00+00:00;66.0;False;False
+    user_3;applehealth;com.garmin.connect.mobile;2020-02-19T00:04:00+00:00;66.0;False;False
+
+    All sleep data from file /<work dir>/src/sleep_groups.csv
+    intervals in format:
+    id        <user 1>  20      2020-03-08      2020-03-08 21:29:00+00  2020-03-08 23:40:00+00  0
+    id        <user 2>  80      2020-02-24      2020-02-24 12:14:00+00  2020-02-24 12:26:00+00  39600
+    id        <user 3> 10      2020-03-09      2020-03-08 22:38:00+00  2020-03-09 05:32:00+00  3600
+    id        <user 4> 40      2020-02-17      2020-02-17 05:40:00+00  2020-02-17 13:10:00+00  -21600
+    id        <user 5> 10      2020-02-26      2020-02-26 07:02:27+00  2020-02-26 17:00:04+00  -18000
+    id        <user 4> 50      2020-02-19      2020-02-19 02:40:00+00  2020-02-19 14:05:00+00  -21600
+    id        <user 4> 50      2020-02-20      2020-02-20 05:15:00+00  2020-02-20 13:15:00+00  -21600
+    Columns: id, user id, score, day date, begin datetime, end datetime, offset
+    score - is estimate of quality of current row
+    """
+    data, good_sleep = open_sleep_groups(work_dir, bad_score)
+    actual_sleep_days = set()
+    one_day = pd.Timedelta("1Day")
+    for dt, user in good_sleep[["day", "user_id"]].itertuples(index=False):
+        actual_sleep_days.add((dt - one_day, user))
+        actual_sleep_days.add((dt + one_day, user))
+        actual_sleep_days.add((dt, user))
+
+    path_data = pulse_files(work_dir)
     actual_pulse: pd.DataFrame = None
     used_providers = {provider: True for provider in providers}
 
@@ -209,6 +229,315 @@ def create_data(
     data.to_csv(os.path.join(work_dir, out_file), index=None)
 
 
+PULSE_COLUMNS = ["user", "provider", "src", "dt", "value", "sdnn", "resting"]
+PULSE_DTYPES = {
+    "user": str,
+    "provider": "category",
+    "src": "category",
+    "dt": str,
+    "value": np.float64,
+    "sdnn": bool,
+    "resting": bool,
+}
+OUT_COLUMNS = [
+    "user", "day", "provider", "is_begin", "is_end", "dt", "value", "resting"
+]
+
+
+def create_data_chunked(
+    # src dir expected in work dir
+    work_dir: str,
+    out_file: str = "pulse_and_sleep.csv",
+    users_dir: str = "pulse_and_sleep_users",
+    bad_score: int = 50,
+    providers: typing.List[str] = [],
+    min_count_in_day: int = 288,
+    chunk_size: int = 1000000,
+):
+    """Streaming version of create_data with the same source files
+    and result format (see create_data).
+    Pulse files are read by chunks and the rows are filtered by days
+    of suitable sleep and saved to a temporary file of each user, then the
+    data of each user is filtered by count of measurements in day
+    (count in all files), sorted and saved to file of user
+    /<work dir>/<users dir>/<user>.csv and appended to out file.
+    Memory is limited by chunk size and data of one user.
+    """
+    _, good_sleep = open_sleep_groups(work_dir, bad_score)
+    good_sleep = good_sleep[["user_id", "day", "begin", "end"]].copy()
+    good_sleep["user_id"] = good_sleep.user_id.astype(str)
+
+    one_day = pd.Timedelta("1Day")
+    sleep_days = pd.MultiIndex.from_frame(
+        pd.concat([
+            good_sleep[["day", "user_id"]].assign(day=good_sleep.day + delta)
+            for delta in (-one_day, pd.Timedelta(0), one_day)
+        ]).drop_duplicates()
+    )
+
+    users_path = os.path.join(work_dir, users_dir)
+    tmp_path = os.path.join(users_path, "tmp")
+    os.makedirs(tmp_path, exist_ok=True)
+    # parts of previous interrupted run
+    for name in os.listdir(tmp_path):
+        os.remove(os.path.join(tmp_path, name))
+
+    day_counts: typing.Optional[pd.Series] = None
+    for csv_path in pulse_files(work_dir):
+        chunks = pd.read_csv(
+            csv_path,
+            sep=";",
+            header=None,
+            names=PULSE_COLUMNS,
+            dtype=PULSE_DTYPES,
+            chunksize=chunk_size,
+        )
+        for pulse_part in chunks:
+            pulse_part = pulse_part[~pulse_part.sdnn]
+            if providers:
+                pulse_part = pulse_part[pulse_part.provider.isin(providers)]
+
+            pulse_part = pulse_part.assign(dt=pd.to_datetime(
+                pulse_part.dt.str.slice(0, 19),
+                format="%Y-%m-%dT%H:%M:%S",
+                errors="coerce"
+            ))
+            pulse_part = pulse_part[pulse_part.dt.notna()]
+            pulse_part.insert(1, "day", pulse_part.dt.dt.normalize())
+            with_sleep = pd.MultiIndex.from_arrays(
+                [pulse_part.day, pulse_part.user]
+            ).isin(sleep_days)
+            pulse_part = pulse_part[with_sleep]
+            if pulse_part.empty:
+                continue
+
+            counts = pulse_part.groupby(["user", "day"]).size()
+            day_counts = (
+                counts if day_counts is None
+                else day_counts.add(counts, fill_value=0)
+            )
+            pulse_part = pulse_part.assign(is_begin=0, is_end=0)[OUT_COLUMNS]
+            for user, user_part in pulse_part.groupby("user", sort=False):
+                user_part.to_csv(
+                    os.path.join(tmp_path, f"{user}.csv"),
+                    mode="a",
+                    header=False,
+                    index=None
+                )
+
+            print(f"Rows from {csv_path}: +{len(pulse_part)}")
+
+    if day_counts is None:
+        print("No suitable pulse data")
+        return
+
+    good_days = day_counts[day_counts >= min_count_in_day].reset_index()
+    good_days = good_days.groupby("user").day.apply(set)
+    sleep_by_user = dict(tuple(good_sleep.groupby("user_id")))
+    out_path = os.path.join(work_dir, out_file)
+    with open(out_path, "w") as out:
+        out.write(",".join(OUT_COLUMNS) + "\n")
+
+    for user in sorted(good_days.index):
+        user_tmp = os.path.join(tmp_path, f"{user}.csv")
+        user_df = pd.read_csv(
+            user_tmp,
+            header=None,
+            names=OUT_COLUMNS,
+            dtype={"user": str, "provider": str, "value": np.float64},
+            parse_dates=["day", "dt"],
+        )
+        os.remove(user_tmp)
+        user_df = user_df[user_df.day.isin(good_days[user])]
+        if user_df.empty:
+            continue
+
+        sleep = sleep_by_user.get(user)
+        if sleep is not None:
+            labels = pd.concat([
+                pd.DataFrame({
+                    "user": user,
+                    "day": sleep.day,
+                    "provider": "unknown",
+                    "is_begin": is_begin,
+                    "is_end": 1 - is_begin,
+                    "dt": sleep[field],
+                    "value": np.nan,
+                    "resting": False,
+                })
+                for field, is_begin in (("end", 0), ("begin", 1))
+            ])
+            user_df = pd.concat([user_df, labels[OUT_COLUMNS]])
+
+        user_df = user_df.sort_values("dt", kind="mergesort")
+        user_df.to_csv(os.path.join(users_path, f"{user}.csv"), index=None)
+        user_df.to_csv(out_path, mode="a", header=False, index=None)
+
+    for name in os.listdir(tmp_path):
+        os.remove(os.path.join(tmp_path, name))
+
+    os.rmdir(tmp_path)
+
+
+def user_rows_shifted_vec(
+    user_df: pd.DataFrame,
+    max_resting_bpm: int = 68,
+    time_quantile: int = 5,  # min
+    expected_in_quant: float = 1.5,
+    fullness_rate: float = 0.89,
+    median_limit_ratio: float = 1.7
+) -> typing.Iterable[typing.Tuple[np.array, np.array]]:
+    """Rows of one user as in user_rows_shifted (with the same random
+    windows), the stream of user is resampled once to the grid of time
+    quantiles and each window is a slice of the grid with corrections
+    of values on edges of window.
+    """
+    count_in_day: int = int((24 * 3600) / (60 * time_quantile))
+    quant = pd.Timedelta(f"{time_quantile}Min").value
+    day_half = pd.Timedelta("12H").value
+
+    if len(user_df[user_df.resting]) > 0:
+        resting = user_df[user_df.resting].value.mean()
+    else:
+        resting = user_df[(user_df.value < max_resting_bpm)].value.mean()
+
+    sleep_ends = user_df.dt[user_df.is_end > 0].unique()
+    user_df = user_df.sort_values("dt", kind="mergesort")
+    times = user_df.dt.values.astype("datetime64[ns]").astype(np.int64)
+    values = user_df.value.values.astype(float)
+    has_value = ~np.isnan(values)
+    row_index = np.arange(len(values))
+    # forward fill of values in all stream, index of source value
+    last_value = np.maximum.accumulate(np.where(has_value, row_index, -1))
+    filled = np.where(
+        last_value >= 0, values[np.maximum(last_value, 0)], np.nan
+    ) / resting
+    has_filled = ~np.isnan(filled)
+    next_value = np.minimum.accumulate(
+        np.where(has_value, row_index, len(values))[::-1]
+    )[::-1]
+    positive = np.concatenate(([0], np.cumsum(values > 0)))
+    begins = np.flatnonzero(user_df.is_begin.values > 0)
+    ends = np.flatnonzero(user_df.is_end.values > 0)
+
+    # windows can be out of stream
+    margin = day_half * 2 // quant + 2
+    bins = times // quant
+    first_bin = bins[0] - margin
+    bins -= first_bin
+    grid_size = bins[-1] + margin
+    sums = np.bincount(
+        bins, weights=np.where(has_filled, filled, 0), minlength=grid_size
+    )
+    counts = np.bincount(bins, weights=has_filled, minlength=grid_size)
+
+    def window_value(index: int, low: int) -> float:
+        """Value of row in window (forward fill only inside window).
+        """
+        if index < low or last_value[index] < low:
+            return np.nan
+
+        return filled[index]
+
+    for sleep_end in map(pd.Timestamp, sleep_ends):
+        sec_delta = random.randint(5400, 23400)
+        t_delta = pd.Timedelta(f"{sec_delta}Sec")
+        mid = random.choice((sleep_end - t_delta, sleep_end + t_delta))
+
+        begin = mid.value - day_half
+        end = mid.value + day_half
+        low = np.searchsorted(times, begin, "left")
+        high = np.searchsorted(times, end, "right")
+        win_begins = begins[(begins >= low) & (begins < high)]
+        win_ends = ends[(ends >= low) & (ends < high)]
+        if len(win_begins) + len(win_ends) < 1:
+            continue
+
+        value_count = positive[high] - positive[low]
+        if value_count < count_in_day * expected_in_quant:
+            print(f"Not enough values {value_count}")
+            continue
+
+        # two empty rows in begin (+ quant) and end of window
+        empty_times = (begin + quant, end)
+        empty_bins = [
+            empty_time // quant - first_bin for empty_time in empty_times
+        ]
+        from_bin = empty_bins[0]
+        if low < high:
+            from_bin = min(from_bin, bins[low])
+
+        to_bin = empty_bins[1]
+        win_sums = sums[from_bin:to_bin + 1].copy()
+        win_counts = counts[from_bin:to_bin + 1].copy()
+
+        # rows of edge bins out of window and rows without value
+        # in window before the first value
+        first_value = min(next_value[low], high) if low < high else high
+        out_rows = np.concatenate((
+            np.arange(np.searchsorted(bins, from_bin, "left"), first_value),
+            np.arange(high, np.searchsorted(bins, to_bin, "right")),
+        )).astype(int)
+        out_rows = out_rows[has_filled[out_rows]]
+        np.subtract.at(win_sums, bins[out_rows] - from_bin, filled[out_rows])
+        np.subtract.at(win_counts, bins[out_rows] - from_bin, 1)
+
+        for empty_time, empty_bin in zip(empty_times, empty_bins):
+            # empty row is before measurements with the same time
+            index = np.searchsorted(times, empty_time, "left") - 1
+            value = window_value(min(index, high - 1), low)
+            if not np.isnan(value):
+                win_sums[empty_bin - from_bin] += value
+                win_counts[empty_bin - from_bin] += 1
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stream = np.where(win_counts > 0, win_sums / win_counts, np.nan)
+
+        is_nan = np.isnan(stream)
+        sum_nan = is_nan.sum()
+        if fullness_rate > (1 - (sum_nan / count_in_day)):
+            continue
+
+        if sum_nan > 0:
+            positions = np.arange(len(stream))
+            stream = np.interp(
+                positions, positions[~is_nan], stream[~is_nan]
+            )
+
+        # labels: unique quants with begin or end, in order of quants
+        # (end before begin in the same quant)
+        label_bins = np.concatenate((
+            np.unique(bins[win_ends]), np.unique(bins[win_begins])
+        )) - from_bin
+        is_begin = np.concatenate((
+            np.zeros(len(np.unique(bins[win_ends])), dtype=bool),
+            np.ones(len(np.unique(bins[win_begins])), dtype=bool),
+        ))
+        order = np.lexsort((is_begin, label_bins))
+        label_bins = label_bins[order]
+        is_begin = is_begin[order]
+        prev_begin = np.maximum.accumulate(np.where(is_begin, label_bins, -1))
+        marks = np.zeros(count_in_day + 1)
+        end_bins = np.minimum(label_bins[~is_begin], count_in_day)
+        begin_bins = np.maximum(prev_begin[~is_begin], 0)
+        np.add.at(marks, np.minimum(begin_bins, end_bins), 1)
+        np.add.at(marks, end_bins, -1)
+        if is_begin[-1]:
+            marks[min(label_bins[-1], count_in_day)] += 1
+
+        intervals = (np.cumsum(marks)[:count_in_day] > 0).astype(float)
+
+        assert (stream <= 0).sum() == 0
+
+        in_sleep_stream = stream[:count_in_day][
+            intervals[:len(stream)] > 0
+        ]
+        # exclude sleep with high pulse
+        max_limit_value = np.median(in_sleep_stream) * median_limit_ratio
+        if (in_sleep_stream > max_limit_value).sum() == 0:
+            yield (stream, intervals)
+
+
 def open_days(file_path: str, sep: str = ",") -> typing.Iterable[pd.DataFrame]:
     """Open big CSV file structure with ordering by users:
     user,day,provider,is_begin,is_end,dt,value,resting
@@ -253,6 +582,175 @@ def open_days(file_path: str, sep: str = ",") -> typing.Iterable[pd.DataFrame]:
                 print(f"for user {current_user} lines: +{index}")
 
 
+def users_index_path(file_path: str) -> str:
+    return f"{file_path}.users.csv"
+
+
+def build_users_index(file_path: str, sep: str = ",") -> pd.DataFrame:
+    """Index of big CSV file ordered by users (see open_days):
+    byte offset and length of block of lines for each user.
+    The index is saved to file near CSV file.
+    """
+    sep_b = sep.encode()
+    rows = []
+    current_user: bytes = None
+    begin = offset = 0
+    with open(file_path, "rb") as csv_file:
+        offset = len(csv_file.readline())
+        for line in csv_file:
+            user, *_ = line.split(sep_b, 1)
+            if user != current_user:
+                if current_user is not None:
+                    rows.append((current_user.decode(), begin, offset - begin))
+
+                current_user = user
+                begin = offset
+
+            offset += len(line)
+
+    if current_user is not None:
+        rows.append((current_user.decode(), begin, offset - begin))
+
+    index = pd.DataFrame(rows, columns=["user", "offset", "length"])
+    index.to_csv(users_index_path(file_path), index=None)
+    return index
+
+
+def open_users_index(file_path: str, sep: str = ",") -> pd.DataFrame:
+    """Index of users in file (it is created if not exists or outdated).
+    """
+    index_path = users_index_path(file_path)
+    if (
+        os.path.exists(index_path) and
+        os.path.getmtime(index_path) >= os.path.getmtime(file_path)
+    ):
+        return pd.read_csv(index_path, dtype={"user": str})
+
+    return build_users_index(file_path, sep)
+
+
+def read_user_block(
+    data: mmap.mmap,
+    columns: typing.List[str],
+    offset: int,
+    length: int,
+    sep: str = ","
+) -> pd.DataFrame:
+    """Parse lines of one user from mapped file.
+    """
+    user_df = pd.read_csv(
+        io.BytesIO(data[offset:offset + length]),
+        sep=sep,
+        header=None,
+        names=columns
+    )
+    user_df["dt"] = pd.to_datetime(user_df.dt)
+    user_df["day"] = pd.to_datetime(user_df.day)
+    return user_df
+
+
+def open_users(
+    file_path: str, sep: str = ","
+) -> typing.Iterable[pd.DataFrame]:
+    """The same as open_days but with index of users,
+    each block of lines is parsed once from mapped file.
+    """
+    index = open_users_index(file_path, sep)
+    with open(file_path, "rb") as csv_file:
+        columns = csv_file.readline().decode().strip().split(sep)
+        if index.empty:
+            return
+
+        with mmap.mmap(
+            csv_file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            for _, offset, length in index.itertuples(index=False):
+                user_df = read_user_block(data, columns, offset, length, sep)
+                if (user_df.value > 0).sum() > 0:
+                    yield user_df
+
+
+# mapped file in process of pool
+worker_file: typing.Dict[str, typing.Any] = {}
+
+
+def init_users_worker(file_path: str, sep: str):
+    csv_file = open(file_path, "rb")
+    worker_file["columns"] = csv_file.readline().decode().strip().split(sep)
+    worker_file["data"] = mmap.mmap(
+        csv_file.fileno(), 0, access=mmap.ACCESS_READ
+    )
+    worker_file["sep"] = sep
+    # forked processes have the same state of random
+    random.seed()
+
+
+def user_block_rows(
+    offset: int, length: int, params: dict, vectorized: bool = True
+) -> list:
+    """Task of pool: rows of user for create_rows_shifted.
+    """
+    user_df = read_user_block(
+        worker_file["data"],
+        worker_file["columns"],
+        offset,
+        length,
+        worker_file["sep"]
+    )
+    if (user_df.value > 0).sum() == 0:
+        return []
+
+    user_rows = user_rows_shifted_vec if vectorized else user_rows_shifted
+    return list(user_rows(user_df, **params))
+
+
+def create_rows_shifted_parallel(
+    file_path: str,
+    sep: str = ",",
+    workers: int = None,
+    vectorized: bool = True,
+    **params
+) -> typing.Iterable[typing.Tuple[np.array, np.array]]:
+    """The same as create_rows_shifted (params of user_rows_shifted),
+    users are processed in pool of processes, the order of users
+    is not kept.
+    """
+    index = open_users_index(file_path, sep)
+    workers = workers or os.cpu_count() or 1
+    count = 0
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_users_worker,
+        initargs=(file_path, sep)
+    ) as executor:
+        blocks = index[["offset", "length"]].itertuples(index=False)
+        pending = set()
+        active = True
+        while active or pending:
+            while active and len(pending) < workers * 2:
+                block = next(blocks, None)
+                if block is None:
+                    active = False
+                else:
+                    offset, length = block
+                    pending.add(executor.submit(
+                        user_block_rows, offset, length, params, vectorized
+                    ))
+
+            if not pending:
+                continue
+
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                for row in future.result():
+                    count += 1
+                    yield row
+
+    print("Rows count:", count)
+
+
 def create_rows_const(
     file_path: str,
     sep: str = ",",
@@ -337,7 +835,8 @@ def create_rows_shifted(
     time_quantile: int = 5,  # min
     expected_in_quant: float = 1.5,
     fullness_rate: float = 0.89,
-    median_limit_ratio: float = 1.7
+    median_limit_ratio: float = 1.7,
+    vectorized: bool = True
 ) -> typing.Iterable[typing.Tuple[np.array, np.array]]:
     """Actual method to crate dataset.
     Create random intervals with suitable sleep
@@ -364,95 +863,286 @@ def create_rows_shifted(
             key=lambda _: random.random()
         )
         of.write(json.dumps(data))
+    or without loading of all rows in memory (see write_rows_dataset):
+    write_rows_dataset(gen, "/<dir>/dataset_6min_sleep_and_pulse")
     """
 
+    count = 0
+    user_rows = user_rows_shifted_vec if vectorized else user_rows_shifted
+    for user_df in open_users(file_path, sep):
+        rows = user_rows(
+            user_df,
+            max_resting_bpm=max_resting_bpm,
+            time_quantile=time_quantile,
+            expected_in_quant=expected_in_quant,
+            fullness_rate=fullness_rate,
+            median_limit_ratio=median_limit_ratio
+        )
+        for row in rows:
+            count += 1
+            yield row
+
+    print("Rows count:", count)
+
+
+def user_rows_shifted(
+    user_df: pd.DataFrame,
+    max_resting_bpm: int = 68,
+    time_quantile: int = 5,  # min
+    expected_in_quant: float = 1.5,
+    fullness_rate: float = 0.89,
+    median_limit_ratio: float = 1.7
+) -> typing.Iterable[typing.Tuple[np.array, np.array]]:
+    """Rows of one user for create_rows_shifted.
+    """
     count_in_day: int = int((24 * 3600) / (60 * time_quantile))
     day_half = pd.Timedelta("12H")
     dt_quant = pd.Timedelta(f"{time_quantile}Min")
-    records = open_days(file_path, sep)
     emp_row = {"value": None, "is_begin": 0, "is_end": 0}
-    count = 0
-    for user_df in records:
-        resting: float = 0
-        if len(user_df[user_df.resting]) > 0:
-            resting = user_df[user_df.resting].value.mean()
-        else:
-            resting = user_df[(user_df.value < max_resting_bpm)].value.mean()
 
-        user_df = user_df[["dt", "day", "value", "is_begin", "is_end"]]
-        for sleep_end in map(pd.Timestamp, user_df.dt[user_df.is_end > 0].unique()):  # noqa
-            day = pd.Timestamp(sleep_end.date())
-            sec_delta = random.randint(5400, 23400)
-            t_delta = pd.Timedelta(f"{sec_delta}Sec")
-            mid = random.choice((sleep_end - t_delta, sleep_end + t_delta))
-
-            begin = mid - day_half
-            end = mid + day_half
-            day_df = user_df[user_df.dt.between(begin, end)]
-            day_df = day_df.append([
-                {"dt": begin + dt_quant, "day": day, **emp_row},
-                {"dt": end, "day": day, **emp_row},
-            ])
-            day_df.sort_values("dt", inplace=True)
-            interval_label_count = (
-                (day_df.is_begin > 0).sum() + (day_df.is_end > 0).sum()
-            )
-            if interval_label_count < 1:
-                continue
+    resting: float = 0
+    if len(user_df[user_df.resting]) > 0:
+        resting = user_df[user_df.resting].value.mean()
+    else:
+        resting = user_df[(user_df.value < max_resting_bpm)].value.mean()
 
-            value_count = (day_df.value > 0).sum()
-            if value_count < count_in_day * expected_in_quant:
-                print(f"Not enough values {value_count}")
-                continue
+    user_df = user_df[["dt", "day", "value", "is_begin", "is_end"]]
+    for sleep_end in map(pd.Timestamp, user_df.dt[user_df.is_end > 0].unique()):  # noqa
+        day = pd.Timestamp(sleep_end.date())
+        sec_delta = random.randint(5400, 23400)
+        t_delta = pd.Timedelta(f"{sec_delta}Sec")
+        mid = random.choice((sleep_end - t_delta, sleep_end + t_delta))
 
-            day_df.loc[:, "value"] = day_df.value.fillna(
-                method="ffill"
-            ) / resting
-            day_df.set_index("dt", inplace=True)
-            row_data = day_df.resample(dt_quant).mean()
-            row_data.is_begin = day_df.is_begin.resample(dt_quant).max()
-            row_data.is_end = day_df.is_end.resample(dt_quant).max()
+        begin = mid - day_half
+        end = mid + day_half
+        day_df = user_df[user_df.dt.between(begin, end)]
+        day_df = day_df.append([
+            {"dt": begin + dt_quant, "day": day, **emp_row},
+            {"dt": end, "day": day, **emp_row},
+        ])
+        day_df.sort_values("dt", inplace=True)
+        interval_label_count = (
+            (day_df.is_begin > 0).sum() + (day_df.is_end > 0).sum()
+        )
+        if interval_label_count < 1:
+            continue
 
-            sum_nan = row_data.value.isna().sum()
-            if fullness_rate > (1 - (sum_nan / count_in_day)):
-                continue
+        value_count = (day_df.value > 0).sum()
+        if value_count < count_in_day * expected_in_quant:
+            print(f"Not enough values {value_count}")
+            continue
 
-            if sum_nan > 0:
-                row_data.value.interpolate(method="linear", inplace=True)
-                row_data.value.interpolate(method="ffill", inplace=True)
-                row_data.value.interpolate(method="bfill", inplace=True)
+        day_df.loc[:, "value"] = day_df.value.fillna(
+            method="ffill"
+        ) / resting
+        day_df.set_index("dt", inplace=True)
+        row_data = day_df.resample(dt_quant).mean()
+        row_data.is_begin = day_df.is_begin.resample(dt_quant).max()
+        row_data.is_end = day_df.is_end.resample(dt_quant).max()
 
-            row_data.is_begin.fillna(0, inplace=True)
-            row_data.is_end.fillna(0, inplace=True)
+        sum_nan = row_data.value.isna().sum()
+        if fullness_rate > (1 - (sum_nan / count_in_day)):
+            continue
 
-            indexes = []
-            intervals = np.zeros((count_in_day,))
-            rows = row_data[["is_begin", "is_end"]].itertuples(index=False)
-            for index, (is_begin, is_end) in enumerate(rows):
-                if is_begin > 0:
-                    indexes.append((index, True))
-                if is_end > 0:
-                    indexes.append((index, False))
+        if sum_nan > 0:
+            row_data.value.interpolate(method="linear", inplace=True)
+            row_data.value.interpolate(method="ffill", inplace=True)
+            row_data.value.interpolate(method="bfill", inplace=True)
 
-            indexes.sort()
-            prev_index = 0
-            for i, (index, is_begin) in enumerate(indexes):
-                if is_begin:
-                    prev_index = index
-                else:
-                    intervals[prev_index:index] = 1
+        row_data.is_begin.fillna(0, inplace=True)
+        row_data.is_end.fillna(0, inplace=True)
 
-                if i == len(indexes) - 1 and is_begin:
-                    intervals[index:] = 1
+        indexes = []
+        intervals = np.zeros((count_in_day,))
+        rows = row_data[["is_begin", "is_end"]].itertuples(index=False)
+        for index, (is_begin, is_end) in enumerate(rows):
+            if is_begin > 0:
+                indexes.append((index, True))
+            if is_end > 0:
+                indexes.append((index, False))
 
-            assert (row_data.value <= 0).sum() == 0
+        indexes.sort()
+        prev_index = 0
+        for i, (index, is_begin) in enumerate(indexes):
+            if is_begin:
+                prev_index = index
+            else:
+                intervals[prev_index:index] = 1
 
-            stream = row_data.value.values[:count_in_day]
-            in_sleep_stream = stream[intervals > 0]
-            # exclude sleep with high pulse
-            max_limit_value = np.median(in_sleep_stream) * median_limit_ratio
-            if (in_sleep_stream > max_limit_value).sum() == 0:
-                yield (row_data.value.values, intervals)
-                count += 1
+            if i == len(indexes) - 1 and is_begin:
+                intervals[index:] = 1
 
-    print("Rows count:", count)
+        assert (row_data.value <= 0).sum() == 0
+
+        stream = row_data.value.values[:count_in_day]
+        in_sleep_stream = stream[intervals > 0]
+        # exclude sleep with high pulse
+        max_limit_value = np.median(in_sleep_stream) * median_limit_ratio
+        if (in_sleep_stream > max_limit_value).sum() == 0:
+            yield (row_data.value.values, intervals)
+
+
+ROWS_INDEX_NAME = "index.json"
+
+
+def write_rows_shard(
+    out_dir: str, number: int, x_rows: list, y_rows: list
+) -> dict:
+    """Save rows as pair of float32 arrays (.npy) of new shard.
+    """
+    shard = {"x": f"x_{number:05}.npy", "y": f"y_{number:05}.npy"}
+    for name, rows in ((shard["x"], x_rows), (shard["y"], y_rows)):
+        tmp_path = os.path.join(out_dir, f"{name}.tmp")
+        with open(tmp_path, "wb") as shard_file:
+            np.save(shard_file, np.array(rows, dtype=np.float32))
+
+        os.replace(tmp_path, os.path.join(out_dir, name))
+
+    shard["rows"] = len(x_rows)
+    return shard
+
+
+def write_rows_index(out_dir: str, index: dict):
+    tmp_path = os.path.join(out_dir, f"{ROWS_INDEX_NAME}.tmp")
+    with open(tmp_path, "w") as index_file:
+        index_file.write(json.dumps(index))
+
+    os.replace(tmp_path, os.path.join(out_dir, ROWS_INDEX_NAME))
+
+
+def write_rows_dataset(
+    rows: typing.Iterable[typing.Tuple[np.array, np.array]],
+    out_dir: str,
+    shard_size: int = 4096,
+) -> dict:
+    """Save rows of create_rows_shifted (or the parallel version)
+    to shards in out_dir, rows are not kept in memory.
+    Pulse and sleep streams are cut to the length of the first row
+    (shorter rows are skipped), the index is updated after each shard.
+    How to use:
+    write_rows_dataset(
+        create_rows_shifted_parallel(csv_file_path, time_quantile=6),
+        "/<dir>/dataset_6min_sleep_and_pulse"
+    )
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    index = {"intervals_count": 0, "rows": 0, "skipped": 0, "shards": []}
+    x_rows = []
+    y_rows = []
+    for pulse, sleep in rows:
+        if not index["intervals_count"]:
+            index["intervals_count"] = len(sleep)
+
+        intervals_count = index["intervals_count"]
+        if min(len(pulse), len(sleep)) < intervals_count:
+            index["skipped"] += 1
+            continue
+
+        x_rows.append(pulse[:intervals_count])
+        y_rows.append(sleep[:intervals_count])
+        if len(x_rows) >= shard_size:
+            index["shards"].append(write_rows_shard(
+                out_dir, len(index["shards"]), x_rows, y_rows
+            ))
+            index["rows"] += len(x_rows)
+            write_rows_index(out_dir, index)
+            x_rows = []
+            y_rows = []
+
+    if x_rows:
+        index["shards"].append(write_rows_shard(
+            out_dir, len(index["shards"]), x_rows, y_rows
+        ))
+        index["rows"] += len(x_rows)
+
+    write_rows_index(out_dir, index)
+    print("Rows:", index["rows"], "skipped:", index["skipped"])
+    return index
+
+
+class RowsDataset:
+    """Memory-mapped shards of write_rows_dataset,
+    rows are addressed by global number (order of writing).
+    """
+
+    out_dir: str
+    intervals_count: int
+    shards: typing.List[typing.Tuple[np.array, np.array]]
+    offsets: np.array
+
+    def __init__(self, out_dir: str):
+        with open(os.path.join(out_dir, ROWS_INDEX_NAME)) as index_file:
+            index = json.loads(index_file.read())
+
+        self.out_dir = out_dir
+        self.intervals_count = index["intervals_count"]
+        self.shards = [
+            (
+                np.load(os.path.join(out_dir, shard["x"]), mmap_mode="r"),
+                np.load(os.path.join(out_dir, shard["y"]), mmap_mode="r"),
+            )
+            for shard in index["shards"]
+        ]
+        self.offsets = np.cumsum(
+            [0] + [shard["rows"] for shard in index["shards"]]
+        )
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def __repr__(self) -> str:
+        return (
+            f"RowsDataset {self.out_dir} rows: {len(self)} "
+            f"intervals: {self.intervals_count} shards: {len(self.shards)}"
+        )
+
+    def read(self, rows: np.array) -> typing.Tuple[np.array, np.array]:
+        """Pulse and sleep arrays of rows (in the given order),
+        only these rows are read from disk.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        x_data = np.zeros((len(rows), self.intervals_count), np.float32)
+        y_data = np.zeros((len(rows), self.intervals_count), np.float32)
+        shard_numbers = np.searchsorted(self.offsets, rows, side="right") - 1
+        for number in np.unique(shard_numbers):
+            selected = np.flatnonzero(shard_numbers == number)
+            local = rows[selected] - self.offsets[number]
+            # sorted reading of a shard is sequential on disk
+            order = np.argsort(local)
+            x_shard, y_shard = self.shards[number]
+            x_data[selected[order]] = x_shard[local[order]]
+            y_data[selected[order]] = y_shard[local[order]]
+
+        return x_data, y_data
+
+    def split(
+        self, test_rate: float = 0.02, seed: int = None
+    ) -> typing.Tuple[np.array, np.array]:
+        """Random numbers of rows for train and test.
+        """
+        rows = np.random.default_rng(seed).permutation(len(self))
+        test_count = int(len(rows) * test_rate)
+        return rows[test_count:], rows[:test_count]
+
+    def batches(
+        self,
+        rows: np.array = None,
+        batch_size: int = 128,
+        epochs: int = None,
+        seed: int = None,
+    ) -> typing.Iterable[typing.Tuple[np.array, np.array]]:
+        """Shuffled mini-batches (shape: batch, intervals, 1) for training,
+        rows are shuffled again in each epoch, without epochs limit
+        the generator is endless (as expected by Model.fit).
+        """
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        rng = np.random.default_rng(seed)
+        epoch = 0
+        while epochs is None or epoch < epochs:
+            epoch_rows = rng.permutation(rows)
+            for start in range(0, len(epoch_rows), batch_size):
+                batch_rows = epoch_rows[start:start + batch_size]
+                x_data, y_data = self.read(batch_rows)
+                yield x_data[:, :, np.newaxis], y_data[:, :, np.newaxis]
+
+            epoch += 1
@@ -4,14 +4,23 @@ try:
 except ImportError:
     torch = None
 
+import abc
 import asyncio
 import concurrent.futures
+import importlib
+import math
+import multiprocessing
 import os
+import struct
+import time
+import typing
 import uuid
+import wave
 
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 from fastapi.responses import StreamingResponse
+from pydantic import AliasChoices
 from pydantic import BaseModel
 from pydantic import Field
 from pydantic_settings.main import BaseSettings
@@ -19,31 +28,187 @@ from pydantic_settings.main import BaseSettings
 
 AUDIO_EXT = "wav"
 STOP_WORD = "quit"
+XTTS_MODEL = "tts_models/multilingual/multi-dataset/xtts_v2"
+
+
+class Synthesizer(abc.ABC):
+    """Backend of speech synthesis, one instance in each worker process
+    (model is loaded once on start of worker).
+    """
+
+    device: str
+
+    def __init__(self, device: str = "cuda", **options):
+        self.device = device
+
+    @abc.abstractmethod
+    def synthesize(
+        self, file_path: str, voice_path: str, text: str, lang: str
+    ):
+        """Speech of text with voice of sample to file (wav).
+        """
+
+    def synthesize_batch(
+        self,
+        voice_path: str,
+        lang: str,
+        items: typing.List[typing.Tuple[str, str]]
+    ) -> typing.List[str]:
+        """Texts with the same voice and language as pairs of
+        file path and text, non empty result is an error.
+        """
+        result = []
+        for file_path, text in items:
+            try:
+                self.synthesize(file_path, voice_path, text, lang)
+            except Exception as err:
+                result.append(f"Problem: {err}")
+            else:
+                result.append("")
 
+        return result
 
-def use_tts(data_dir: str, name: str, voice: str, text: str, lang: str) -> str:
-    """Non empty result is an error."""
-    try:
-        tts = TTS("tts_models/multilingual/multi-dataset/xtts_v2", gpu=True)
-        file_path = os.path.join(data_dir, name)
-        tts.tts_to_file(
+
+class XttsSynthesizer(Synthesizer):
+    def __init__(self, device: str = "cuda", **options):
+        super().__init__(device)
+        if device != "cpu" and not torch.cuda.is_available():
+            print(f"Device {device} is not available, cpu is used")
+            self.device = "cpu"
+
+        self.tts = TTS(options.get("model", XTTS_MODEL)).to(self.device)
+
+    def synthesize(
+        self, file_path: str, voice_path: str, text: str, lang: str
+    ):
+        self.tts.tts_to_file(
             text=text,
             file_path=file_path,
-            speaker_wav=[os.path.join(data_dir, f"{voice}.{AUDIO_EXT}")],
+            speaker_wav=[voice_path],
             language=lang,
             split_sentences=True
         )
-    except Exception as err:
-        return f"Problem: {err}"
 
-    return ""
+
+class StubSynthesizer(Synthesizer):
+    """Without model: a tone with duration by text length,
+    for tests of throughput and queue of server.
+    """
+
+    rate: int = 24000
+    char_duration: float = 0.06
+    char_delay: float
+
+    def __init__(self, device: str = "cpu", **options):
+        super().__init__(device)
+        # imitation of synthesis time
+        self.char_delay = float(options.get("char_delay", 0.005))
+
+    def synthesize(
+        self, file_path: str, voice_path: str, text: str, lang: str
+    ):
+        if not os.path.exists(voice_path):
+            raise FileNotFoundError(voice_path)
+
+        time.sleep(self.char_delay * len(text))
+        count = int(self.rate * self.char_duration * max(len(text), 1))
+        frames = b"".join(
+            struct.pack("<h", int(8000 * math.sin(i * 0.05)))
+            for i in range(min(count, self.rate))
+        )
+        with wave.open(file_path, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.rate)
+            for _ in range(count // self.rate):
+                wav_file.writeframes(frames)
+
+            wav_file.writeframes(frames[:count % self.rate * 2])
+
+
+SYNTHESIZERS = {
+    "xtts": XttsSynthesizer,
+    "stub": StubSynthesizer,
+}
+
+
+def create_synthesizer(backend: str, device: str, **options) -> Synthesizer:
+    """Backend by name or import path as "package.module:ClassName".
+    """
+    if backend in SYNTHESIZERS:
+        synthesizer = SYNTHESIZERS[backend]
+    else:
+        module_name, _, class_name = backend.partition(":")
+        synthesizer = getattr(importlib.import_module(module_name), class_name)
+
+    return synthesizer(device, **options)
+
+
+# synthesizer of process in pool and barrier of warm-up
+worker_synthesizer = None
+worker_barrier = None
+WARMUP_TIMEOUT = 600
+
+
+def init_worker(backend: str, device: str, options: dict, barrier=None):
+    global worker_synthesizer, worker_barrier
+    worker_synthesizer = create_synthesizer(backend, device, **options)
+    worker_barrier = barrier
+
+
+def worker_ready() -> typing.Tuple[int, str]:
+    """Waits for all workers of pool (one call in each worker).
+    """
+    if worker_barrier is not None:
+        worker_barrier.wait(WARMUP_TIMEOUT)
+    return os.getpid(), type(worker_synthesizer).__name__
+
+
+def use_tts(data_dir: str, name: str, voice: str, text: str, lang: str) -> str:
+    """Non empty result is an error."""
+    error, = use_tts_batch(data_dir, voice, lang, [(name, text)])
+    return error
+
+
+def use_tts_batch(
+    data_dir: str,
+    voice: str,
+    lang: str,
+    items: typing.List[typing.Tuple[str, str]]
+) -> typing.List[str]:
+    """Requests with the same voice and language (pairs of output name
+    and text) in one task of worker, non empty result is an error.
+    """
+    try:
+        return worker_synthesizer.synthesize_batch(
+            os.path.join(data_dir, f"{voice}.{AUDIO_EXT}"),
+            lang,
+            [(os.path.join(data_dir, name), text) for name, text in items]
+        )
+    except Exception as err:
+        return [f"Problem: {err}"] * len(items)
 
 
 class ServerSettings(BaseSettings):
-    pool_size: int = Field(env="PARALLEL_REQUESTS", default=2)
+    pool_size: int = Field(
+        validation_alias=AliasChoices("PARALLEL_REQUESTS", "pool_size"),
+        default=2
+    )
     data_dir: str = Field(env="DATA_DIR", default="/app/data/")
-    iter_chek_delay: float = Field(env="ITER_DELAY", default=1)
     wait_limit: float = Field(env="WAIT_LIMIT", default=35)
+    # xtts, stub or "package.module:ClassName" of Synthesizer
+    backend: str = Field(
+        validation_alias=AliasChoices("TTS_BACKEND", "backend"),
+        default="xtts"
+    )
+    # cuda or cpu
+    device: str = Field(
+        validation_alias=AliasChoices("TTS_DEVICE", "device"),
+        default="cuda"
+    )
+    batch_size: int = Field(env="BATCH_SIZE", default=4)
+    stub_char_delay: float = Field(env="STUB_CHAR_DELAY", default=0.005)
+    read_chunk_size: int = Field(env="READ_CHUNK_SIZE", default=1 << 16)
 
 
 app = FastAPI()
@@ -55,33 +220,64 @@ class Manager:
     queue: asyncio.Queue
     active: bool = False
     error: str
+    # results of requests by output name, value is an error
+    jobs: typing.Dict[str, asyncio.Future]
 
     def __init__(self):
         self.active = True
         self.queue = asyncio.Queue()
         self.settings = ServerSettings()
         self.error = ""
+        self.jobs = {}
 
     def add(self, output: str, voice: str, text: str, lang: str) -> int:
+        self.jobs[output] = asyncio.get_event_loop().create_future()
         self.queue.put_nowait((output, voice, text, lang))
         return self.queue.qsize()
 
-    def res_file(self, name: str):
+    def finish(self, output: str, error: str):
+        """Result of request for waiters, the job is kept wait_limit seconds.
+        """
+        if error:
+            self.error = error
+
+        job = self.jobs.get(output)
+        if job is None or job.done():
+            return
+
+        job.set_result(error)
+        asyncio.get_event_loop().call_later(
+            self.settings.wait_limit, self.jobs.pop, output, None
+        )
+
+    async def res_file(self, name: str) -> typing.AsyncIterator[bytes]:
+        loop = asyncio.get_event_loop()
         path = os.path.join(self.settings.data_dir, f"{name}.{AUDIO_EXT}")
         with open(path, mode="rb") as file:
-            yield from file
+            while True:
+                chunk = await loop.run_in_executor(
+                    None, file.read, self.settings.read_chunk_size
+                )
+                if not chunk:
+                    break
+
+                yield chunk
 
     async def wait_res_file(self, name: str) -> bool:
-        wait = 0
         path = os.path.join(self.settings.data_dir, f"{name}.{AUDIO_EXT}")
-        while wait <= self.settings.wait_limit:
-            wait += self.settings.iter_chek_delay
-            if os.path.exists(path):
-                wait = self.settings.wait_limit + 1
-            else:
-                await asyncio.sleep(self.settings.iter_chek_delay)
+        job = self.jobs.get(f"{name}.{AUDIO_EXT}")
+        if job is None:
+            # unknown request, result of previous run of server
+            return os.path.exists(path)
 
-        return os.path.exists(path)
+        try:
+            error = await asyncio.wait_for(
+                asyncio.shield(job), self.settings.wait_limit
+            )
+        except asyncio.TimeoutError:
+            return False
+
+        return not error and os.path.exists(path)
 
     def stop(self):
         self.active = False
@@ -93,25 +289,102 @@ class Manager:
         self.error = ""
         return value
 
+    def next_batch(
+        self, req: tuple
+    ) -> typing.Tuple[str, str, typing.List[typing.Tuple[str, str]]]:
+        """Voice, language and requests with them as (output, text):
+        the request and waiting requests, up to batch_size.
+        """
+        output, voice, text, lang = req
+        items = [(output, text)]
+        other = []
+        while not self.queue.empty():
+            req = self.queue.get_nowait()
+            if (
+                len(items) < self.settings.batch_size and
+                req != STOP_WORD and
+                (req[1], req[3]) == (voice, lang)
+            ):
+                items.append((req[0], req[2]))
+            else:
+                other.append(req)
+
+        # order of other requests is kept
+        for req in other:
+            self.queue.put_nowait(req)
+
+        return voice, lang, items
+
+    async def run_batch(
+        self,
+        executor: concurrent.futures.Executor,
+        slots: asyncio.Semaphore,
+        voice: str,
+        lang: str,
+        items: typing.List[typing.Tuple[str, str]]
+    ):
+        loop = asyncio.get_event_loop()
+        try:
+            result = await loop.run_in_executor(
+                executor,
+                use_tts_batch,
+                self.settings.data_dir,
+                voice,
+                lang,
+                items
+            )
+        except Exception as err:
+            result = [f"Problem: {err}"] * len(items)
+        finally:
+            slots.release()
+
+        for (output, _), error in zip(items, result):
+            self.finish(output, error)
+
     async def process(self):
-        """Waiting requests from buffer queue."""
+        """Waiting requests from buffer queue,
+        up to pool_size batches are processed at the same time.
+        """
         loop = asyncio.get_event_loop()
         pool = concurrent.futures.ProcessPoolExecutor
-        with pool(max_workers=self.settings.pool_size) as executor:
+        settings = self.settings
+        with pool(
+            max_workers=settings.pool_size,
+            initializer=init_worker,
+            initargs=(
+                settings.backend,
+                settings.device,
+                {"char_delay": settings.stub_char_delay},
+                multiprocessing.Barrier(settings.pool_size),
+            )
+        ) as executor:
+            # all workers are started and models are loaded before requests:
+            # each call of worker_ready waits for others on barrier,
+            # so the calls are in different workers
+            workers = await asyncio.gather(*(
+                loop.run_in_executor(executor, worker_ready)
+                for _ in range(settings.pool_size)
+            ))
+            print("Workers:", dict(workers))
+            slots = asyncio.Semaphore(settings.pool_size)
+            tasks = set()
             while self.active:
+                # requests are collected in batch while workers are busy
+                await slots.acquire()
                 req = await self.queue.get()
                 if req == STOP_WORD:
                     self.active = False
+                    slots.release()
                     continue
 
-                result = await loop.run_in_executor(
-                    executor,
-                    use_tts,
-                    self.settings.data_dir,
-                    *req
-                )
-                if result:
-                    self.error = result
+                task = asyncio.create_task(self.run_batch(
+                    executor, slots, *self.next_batch(req)
+                ))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
 
 
 class Request(BaseModel):
@@ -1,5 +1,8 @@
 # # pip install pytest-cov pytest-sugar
 # MPLBACKEND=Qt5Agg py.test ./recover_intervals.py
+import concurrent.futures
+import os
+import typing
 from collections.abc import Iterable
 from datetime import datetime, timedelta
 from itertools import chain
@@ -137,7 +140,8 @@ def recover_clear_intervals(
     rate_data = pd.DataFrame(
         second_values(records), columns=["rate", "seconds", "interval"]
     )
-    rate_data.sort_values("seconds", inplace=True)
+    # stable order of rows in a second (by interval) for rolling mean
+    rate_data.sort_values("seconds", inplace=True, kind="mergesort")
     rate_data.set_index(["seconds"], inplace=True)
     cross_data = rate_data.interval.groupby("seconds").count()
     cross_seconds = cross_data[cross_data > 1].index
@@ -187,6 +191,225 @@ def recover_clear_intervals(
     return result
 
 
+def interval_segments(records: list) -> Iterable:
+    """Sweep over boundaries of intervals (in seconds as second_values),
+    segments with constant set of active intervals as (
+        (begin, end, (interval, ...)), ...
+    ), seconds of segment are [begin, end).
+    """
+    events = []
+    for index, (dt_begin, dt_end, _) in enumerate(records):
+        begin = int(np.round(dt_begin.timestamp()))
+        end = int(np.round(dt_end.timestamp()))
+        if end > begin:
+            events.append((begin, 1, index))
+            events.append((end, -1, index))
+
+    events.sort()
+    active = set()
+    prev_point = None
+    for point, kind, index in events:
+        if active and point > prev_point:
+            yield (prev_point, point, tuple(sorted(active)))
+
+        if kind > 0:
+            active.add(index)
+        else:
+            active.discard(index)
+
+        prev_point = point
+
+
+def window_means(
+    segments: list, rates: np.array, window: int
+) -> typing.Tuple[np.array, np.array]:
+    """Distinct values of rolling mean (window in rows of second_values)
+    with count of each value, without expansion of segments.
+    Rates are rounded to 3 digits, so sums of windows are exact
+    in integer thousandths.
+    """
+    counts = np.array([len(active) for _, _, active in segments])
+    lengths = np.array([end - begin for begin, end, _ in segments])
+    rows = lengths * counts
+    # rates of active intervals of all segments in one array
+    flat_rates = np.array(
+        [rates[index] for _, _, active in segments for index in active]
+    )
+    flat_milli = np.round(flat_rates * 1000).astype(np.int64)
+    flat_starts = np.concatenate(([0], np.cumsum(counts)))
+    flat_cum = np.concatenate(([0], np.cumsum(flat_milli)))
+    period_sums = flat_cum[flat_starts[1:]] - flat_cum[flat_starts[:-1]]
+    row_starts = np.concatenate(([0], np.cumsum(rows)))
+    sum_starts = np.concatenate(([0], np.cumsum(lengths * period_sums)))
+    total = int(row_starts[-1])
+    if total < window:
+        return np.zeros((0,)), np.zeros((0,), dtype=int)
+
+    def window_sums(starts: np.array) -> np.array:
+        """Sums of rows in windows from starts.
+        """
+        result = np.zeros(len(starts), dtype=np.int64)
+        for sign, positions in ((1, starts + window), (-1, starts)):
+            seg = np.searchsorted(row_starts, positions, side="right") - 1
+            seg = np.minimum(seg, len(segments) - 1)
+            full, part = np.divmod(positions - row_starts[seg], counts[seg])
+            result += sign * (
+                sum_starts[seg]
+                + full * period_sums[seg]
+                + flat_cum[flat_starts[seg] + part]
+                - flat_cum[flat_starts[seg]]
+            )
+
+        return result / 1000 / window
+
+    values = []
+    value_counts = []
+    for seg, count in enumerate(counts):
+        inner = int(rows[seg]) - window + 1
+        if inner <= 0:
+            continue
+
+        seg_rates = flat_rates[flat_starts[seg]:flat_starts[seg + 1]]
+        if (seg_rates == seg_rates[0]).all():
+            # mean of equal values is exact
+            values.append(seg_rates[:1])
+            value_counts.append([inner])
+            continue
+
+        phases = np.arange(min(count, inner))
+        values.append(window_sums(row_starts[seg] + phases))
+        value_counts.append((inner - phases + count - 1) // count)
+
+    # windows with rows of few segments
+    edges = np.unique(np.concatenate([
+        np.arange(max(0, point - window + 1), min(point, total - window + 1))
+        for point in row_starts[1:-1]
+    ] + [np.zeros((0,), dtype=int)]))
+    values.append(window_sums(edges))
+    value_counts.append(np.ones(len(edges), dtype=int))
+    return np.concatenate(values), np.concatenate(value_counts)
+
+
+def weighted_quantile(
+    values: np.array, counts: np.array, q: float
+) -> float:
+    """The same as quantile (linear) of values repeated counts times.
+    """
+    if not counts.sum():
+        return np.nan
+
+    order = np.argsort(values, kind="stable")
+    values = values[order]
+    ends = np.cumsum(counts[order])
+    position = (ends[-1] - 1) * q
+    low = int(np.floor(position))
+    low_value, high_value = values[
+        np.searchsorted(ends, [low, min(low + 1, ends[-1] - 1)], side="right")
+    ]
+    return float(np.quantile([low_value, high_value], position - low))
+
+
+def compensated_mean(values: list) -> float:
+    """Mean with Kahan summation as in groupby(...).mean() of pandas,
+    equal means of different sets are grouped together.
+    """
+    total = compensation = 0.0
+    for value in values:
+        value -= compensation
+        new_total = total + value
+        compensation = new_total - total - value
+        total = new_total
+
+    return total / len(values)
+
+
+def recover_clear_intervals_sweep(
+    records: list,
+    period_min_window: int = 60,
+    filter_limit: int = 40,  # 40%
+    true_min_rate_limit: float = 0
+) -> list:
+    """The same as recover_clear_intervals, but only boundaries of
+    intervals are processed (sweep line), not each second.
+    """
+    rates = []
+    for dt_begin, dt_end, value in records:
+        begin = np.round(dt_begin.timestamp())
+        duration = np.round(dt_end.timestamp()) - begin
+        rates.append(np.round(value / duration, 3) if duration > 0 else 0)
+
+    segments = list(interval_segments(records))
+    bad_intervals = {
+        index
+        for _, _, active in segments
+        if len(active) > 1
+        for index in active
+    }
+    bad_intervals = {
+        index + shift for index in bad_intervals for shift in (-1, 0, 1)
+    }
+
+    result = []
+    if bad_intervals:
+        limit = weighted_quantile(
+            *window_means(segments, np.array(rates), period_min_window),
+            filter_limit / 100.0
+        )
+        limit = min(
+            true_min_rate_limit if true_min_rate_limit else limit, limit
+        )
+        rate_bounds = {}
+        for begin, end, active in segments:
+            selected = [
+                rates[index]
+                for index in active
+                if index in bad_intervals and rates[index] > limit
+            ]
+            if not selected:
+                continue
+
+            rate = compensated_mean(selected)
+            dt_begin, dt_end = rate_bounds.get(rate, (begin, end - 1))
+            rate_bounds[rate] = (min(dt_begin, begin), max(dt_end, end - 1))
+
+        for rate, (dt_begin, dt_end) in rate_bounds.items():
+            duration = dt_end - dt_begin
+            result.append((
+                datetime.fromtimestamp(dt_begin),
+                datetime.fromtimestamp(dt_end),
+                np.round(duration * rate),
+            ))
+
+    for index, (begin, end, val) in enumerate(records):
+        if index in bad_intervals:
+            continue
+
+        result.append((begin, end, val))
+
+    result.sort()
+    return result
+
+
+def _recover_device(item: tuple) -> tuple:
+    key, records, params = item
+    return key, recover_clear_intervals_sweep(records, **params)
+
+
+def recover_devices_intervals(
+    devices: typing.Mapping[typing.Hashable, list],
+    workers: int = None,
+    chunk_size: int = 16,
+    **params
+) -> dict:
+    """Recover intervals of many devices (records by device key)
+    in pool of processes, params of recover_clear_intervals.
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = ((key, records, params) for key, records in devices.items())
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(_recover_device, tasks, chunksize=chunk_size))
+
+
 def test_intervals_creation_1(test_data_1):
     rate_data = recover_clear_intervals(test_data_1)
     assert rate_data
@@ -261,3 +484,22 @@ def test_intervals_creation_3(test_data_3):
         "2018-03-17 22:41:40; 2018-03-17 22:52:28; 25.0",
         "2018-03-17 23:24:39; 2018-03-17 23:31:07; 10.0",
     ]
+
+
+@pytest.mark.parametrize("fixture", [
+    "test_data_1", "test_data_2", "test_data_3"
+])
+def test_sweep_intervals(fixture, request):
+    data = request.getfixturevalue(fixture)
+    assert recover_clear_intervals_sweep(data) == recover_clear_intervals(
+        data
+    )
+
+
+def test_devices_intervals(test_data_1, test_data_2, test_data_3):
+    devices = {1: test_data_1, 2: test_data_2, 3: test_data_3}
+    result = recover_devices_intervals(devices, workers=2, chunk_size=1)
+    assert result == {
+        key: recover_clear_intervals(records)
+        for key, records in devices.items()
+    }
@@ -0,0 +1,255 @@
+import codecs
+import io
+import json
+import os
+import queue
+import time
+import uuid
+from datetime import datetime
+from threading import Condition, Thread
+
+from .const import (
+    WORK_DIR, PHOTO_SERIES, IMAGE_SIZE, CAMERA_FRAMERATE, CAPTURE_QUEUE,
+    SYNC_BATCH, PRE_FRAMES, FRAME_LIMIT)
+from .log import get_logger
+from .helpers import make_photos, picamera
+
+
+class FrameRing:
+    """Rolling buffer of the last frames (JPEG) in preallocated slots.
+    """
+
+    def __init__(self, size: int=PRE_FRAMES, frame_limit: int=FRAME_LIMIT):
+        self.slots = [bytearray(frame_limit) for _ in range(size)]
+        self.lengths = [0] * size
+        self.times = [0.0] * size
+        self.position = 0
+        self.count = 0
+        self.dropped = 0
+        self._changed = Condition()
+
+    def add(self, data: bytes, at: float=None) -> bool:
+        """Copy frame to the oldest slot.
+        """
+        length = len(data)
+        if length > len(self.slots[self.position]):
+            self.dropped += 1
+            return False
+
+        with self._changed:
+            index = self.position
+            self.slots[index][:length] = data
+            self.lengths[index] = length
+            self.times[index] = time.time() if at is None else at
+            self.position = (index + 1) % len(self.slots)
+            self.count = min(self.count + 1, len(self.slots))
+            self._changed.notify_all()
+        return True
+
+    def frames(self, before: float=None, after: float=None) -> list:
+        """Frames (time, bytes) in order of time.
+        """
+        with self._changed:
+            size = len(self.slots)
+            result = []
+            for shift in range(size - self.count, size):
+                index = (self.position + shift) % size
+                at = self.times[index]
+                if before is not None and at > before:
+                    continue
+                if after is not None and at <= after:
+                    continue
+                result.append(
+                    (at, bytes(self.slots[index][:self.lengths[index]])))
+        return result
+
+    def wait_frames(
+            self, after: float, count: int, timeout: float=5.0) -> list:
+        """The first count frames after time (less by timeout).
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                result = self.frames(after=after)
+                rest = deadline - time.monotonic()
+                if len(result) >= count or rest <= 0:
+                    return result[:count]
+                self._changed.wait(rest)
+
+
+class CameraRing(Thread):
+    """Continuous capture of camera to ring of frames.
+    """
+    logger = None
+
+    def __init__(self, ring: FrameRing):
+        super().__init__(name=self.__class__.__name__, daemon=True)
+        self.logger = get_logger()
+        self.ring = ring
+        self.active = True
+
+    def run(self):
+        stream = io.BytesIO()
+        try:
+            with picamera.PiCamera(
+                    framerate=int(CAMERA_FRAMERATE or 30),
+                    resolution=IMAGE_SIZE) as cam:
+                #
+                for _ in cam.capture_continuous(
+                        stream, format="jpeg", use_video_port=True):
+                    self.ring.add(stream.getvalue())
+                    stream.seek(0)
+                    stream.truncate()
+                    if not self.active:
+                        break
+        except Exception as err:
+            self.logger.error("Camera ring error: {}".format(err))
+
+    def stop(self):
+        self.active = False
+
+
+class EventPackager(Thread):
+    """Worker of bounded queue of detections: photos and JSON file
+    of event (bundle), with one fsync for batch of events.
+    File of event appears only after fsync of its photos.
+    """
+    logger = ring = None
+
+    def __init__(
+            self,
+            ring: FrameRing=None,
+            max_queue: int=CAPTURE_QUEUE,
+            sync_batch: int=SYNC_BATCH,
+            work_dir: str=WORK_DIR):
+        super().__init__(name=self.__class__.__name__, daemon=True)
+        self.logger = get_logger()
+        self.ring = ring
+        self.sync_batch = sync_batch
+        self.work_dir = work_dir
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = self.packaged = self.syncs = 0
+        # files for fsync and events (tmp path, path)
+        self._unsynced = []
+        self._events = []
+
+    def submit(self, datet: datetime=None) -> bool:
+        """Put detection to queue without waiting (False if it is full),
+        frames of ring before detection are copied at once.
+        """
+        datet = datet or datetime.now()
+        at = time.time()
+        pre_frames = [] if self.ring is None else self.ring.frames(before=at)
+        try:
+            self.queue.put_nowait((datet, at, pre_frames))
+        except queue.Full:
+            self.dropped += 1
+            self.logger.warning(
+                "Capture queue is full, event {} dropped.".format(
+                    datet.isoformat()))
+            return False
+        return True
+
+    def write_frames(self, code: str, frames: list, prefix: str) -> list:
+        result = []
+        for index, (at, data) in enumerate(frames):
+            file_path = os.path.join(
+                self.work_dir,
+                "{}_{}{}{:02}.jpg".format(
+                    datetime.fromtimestamp(at).strftime("%d%m%y%H%M%S"),
+                    code,
+                    prefix,
+                    index))
+            with open(file_path, mode="wb") as frame_file:
+                frame_file.write(data)
+            result.append(file_path)
+        return result
+
+    def package(self, datet: datetime, at: float, pre_frames: list):
+        """Photos of event and JSON file (renamed after fsync),
+        without photos event is not recorded.
+        """
+        pre_photos = []
+        if self.ring is not None:
+            code = uuid.uuid4().hex[:6]
+            photos = self.write_frames(
+                code, self.ring.wait_frames(at, PHOTO_SERIES), "")
+        else:
+            photos, code = make_photos(logger=self.logger)
+            photos = list(photos)
+
+        if not photos:
+            self.logger.warning("Photos do not done.")
+            return
+
+        self.logger.info("Photo in: {}".format(", ".join(photos)))
+        if self.ring is not None:
+            pre_photos = self.write_frames(code, pre_frames, "p")
+
+        file_path = os.path.join(
+            self.work_dir, "{}_{}.event".format(code, int(at)))
+        tmp_path = file_path + ".tmp"
+        with codecs.open(tmp_path, mode="w") as fevent:
+            fevent.write(json.dumps({
+                "files": photos,
+                "pre_files": pre_photos,
+                "date": datet.isoformat(),
+            }))
+        self._unsynced.extend(pre_photos + photos + [tmp_path])
+        self._events.append((tmp_path, file_path))
+
+    def sync(self):
+        """Fsync of files, rename of events and fsync of directory.
+        """
+        if not self._events:
+            return
+        for file_path in self._unsynced:
+            try:
+                fd = os.open(file_path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        for tmp_path, file_path in self._events:
+            os.replace(tmp_path, file_path)
+        dir_fd = os.open(self.work_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        self.packaged += len(self._events)
+        self.syncs += 1
+        self._unsynced.clear()
+        self._events.clear()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is not None:
+                try:
+                    self.package(*item)
+                except Exception as err:
+                    self.logger.error(
+                        "Event '{}' recording error: {}".format(
+                            item[0].isoformat(), err))
+            # sync of batch or of the last events in queue
+            if item is None or (
+                    len(self._events) >= self.sync_batch
+                    or self.queue.empty()):
+                try:
+                    self.sync()
+                except Exception as err:
+                    self.logger.error("Events sync error: {}".format(err))
+            if item is None:
+                break
+
+    def stop(self):
+        """Finish after events in queue.
+        """
+        self.queue.put(None)
+        if self.is_alive():
+            self.join()
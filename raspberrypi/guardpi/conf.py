@@ -4,6 +4,7 @@ import os
 import time
 
 from .const import CONF_FILEPATH, CONF_UPDATE_TIME
+from .events import FileWatch
 from .log import get_logger
 
 
@@ -24,6 +25,9 @@ class ProcessOption:
     _sleep_method = time.sleep
     _file = CONF_FILEPATH
     _retry_limit = 100
+    # changes of file are received from event loop (see watch)
+    _watch = None
+    _notify = None
 
     def __init__(self):
         self.logger = logger = get_logger()
@@ -45,16 +49,53 @@ class ProcessOption:
             return
         need_update = value != self._state.get(field)
         self._state[field] = value
-        return need_update and self.write()
+        result = need_update and self.write()
+        if need_update and self._notify is not None:
+            self._notify({field})
+        return result
 
     def get(self, field):
         """Get value by field.
         """
-        if time.time() - self._last_sync > CONF_UPDATE_TIME:
+        if self._watch is None and (
+                time.time() - self._last_sync > CONF_UPDATE_TIME):
             self.read()
 
         return self._state.get(field)
 
+    def watch(self, loop, callback=None) -> FileWatch:
+        """Read file only after its changes (notifications in loop),
+        callback(fields) gets names of changed fields
+        (changes by set are sent to loop too).
+        """
+        def reload():
+            fields = self.reload()
+            if fields and callback is not None:
+                callback(fields)
+
+        if callback is not None:
+            self._notify = lambda fields: loop.call_soon(callback, fields)
+        self._watch = FileWatch(loop, self._file, reload, CONF_UPDATE_TIME)
+        return self._watch
+
+    def unwatch(self):
+        if self._watch is not None:
+            self._watch.cancel()
+            self._watch = None
+        self._notify = None
+
+    def reload(self) -> set:
+        """Read configuration, names of changed fields.
+        """
+        old_state = dict(self._state or {})
+        if not self.read():
+            return set()
+        return {
+            field
+            for field in set(old_state) | set(self._state)
+            if old_state.get(field) != self._state.get(field)
+        }
+
     @property
     def active_guard(self) -> bool:
         return self.get("active_guard")
@@ -35,6 +35,10 @@ LOG_LEVEL = os.environ.get("LOG_LEVEL") or "INFO"
 LOGGER_NAME = "guardpi"
 CONF_FILEPATH = os.path.join(WORK_DIR, "guardpi-conf.json")
 CONF_UPDATE_TIME = int(os.environ.get("CONF_UPDATE_TIME") or 3)
+# timer wheel of event loop: tick (sec) and count of slots
+TIMER_TICK = float(os.environ.get("TIMER_TICK") or 0.1)
+TIMER_SLOTS = int(os.environ.get("TIMER_SLOTS") or 512)
+SENSOR_BOUNCE_TIME = int(os.environ.get("SENSOR_BOUNCE_TIME") or 200)
 
 try:
     img_size = os.environ.get("IMAGE_SIZE") or "640,480"
@@ -45,5 +49,11 @@ IMAGE_SIZE = w, h
 
 PHOTO_SERIES = int(os.environ.get("PHOTO_SERIES") or 3)
 CAMERA_FRAMERATE = int(os.environ.get("CAMERA_FRAMERATE") or 30)
+# events: size of capture queue, events in one fsync,
+# frames before detection (0 - without ring of frames), size of frame slot
+CAPTURE_QUEUE = int(os.environ.get("CAPTURE_QUEUE") or 8)
+SYNC_BATCH = int(os.environ.get("SYNC_BATCH") or 8)
+PRE_FRAMES = int(os.environ.get("PRE_FRAMES") or 0)
+FRAME_LIMIT = int(os.environ.get("FRAME_LIMIT") or 512 * 1024)
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN") or ""
 TELEGRAM_ADMINS = os.environ.get("TELEGRAM_ADMINS") or ""
@@ -0,0 +1,336 @@
+import ctypes
+import ctypes.util
+import math
+import os
+import selectors
+import struct
+import threading
+import time
+from collections import deque
+
+from .const import TIMER_TICK, TIMER_SLOTS
+from .log import get_logger
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class Timer:
+    """Deadline of callback in event loop.
+    """
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+
+    def __init__(self, deadline: float, callback, args: tuple):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Hashed timer wheel: adding and cancelling of deadline without
+    sorting, expiration by slots of passed ticks.
+    """
+
+    def __init__(
+            self,
+            tick: float=TIMER_TICK,
+            slots: int=TIMER_SLOTS,
+            clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [[] for _ in range(slots)]
+        self.count = 0
+        # the first not expired tick
+        self._current = int(clock() / tick)
+
+    def add(self, delay: float, callback, *args) -> Timer:
+        """New deadline after delay (sec).
+        """
+        timer = Timer(self.clock() + max(delay, 0), callback, args)
+        tick = max(math.ceil(timer.deadline / self.tick), self._current)
+        self.slots[tick % len(self.slots)].append(timer)
+        self.count += 1
+        return timer
+
+    def next_deadline(self) -> float:
+        """Time of the next not empty slot (None without timers).
+        """
+        if not self.count:
+            return None
+
+        for shift in range(len(self.slots)):
+            tick = self._current + shift
+            if self.slots[tick % len(self.slots)]:
+                return tick * self.tick
+
+    def expire(self, now: float=None) -> list:
+        """Timers with deadline before now (without cancelled).
+        """
+        if now is None:
+            now = self.clock()
+        last = int(now / self.tick)
+        result = []
+        if last < self._current:
+            return result
+
+        size = len(self.slots)
+        ticks = range(self._current, last + 1)
+        if len(ticks) > size:
+            # full turn of wheel
+            ticks = range(self._current, self._current + size)
+
+        for tick in ticks:
+            slot = self.slots[tick % size]
+            if not slot:
+                continue
+            rest = []
+            for timer in slot:
+                if timer.cancelled:
+                    self.count -= 1
+                elif timer.deadline <= now:
+                    self.count -= 1
+                    result.append(timer)
+                else:
+                    rest.append(timer)
+            slot[:] = rest
+
+        self._current = last + 1
+        result.sort(key=lambda timer: timer.deadline)
+        return result
+
+
+class EventLoop:
+    """Single loop of callbacks (call_soon from any thread),
+    deadlines of timer wheel and readers of file descriptors.
+    Loop sleeps until the next deadline or event.
+    """
+    logger = None
+
+    def __init__(self, tick: float=TIMER_TICK, slots: int=TIMER_SLOTS):
+        self.logger = get_logger()
+        self.timers = TimerWheel(tick, slots)
+        self.selector = selectors.DefaultSelector()
+        self.wakeups = 0
+        self._ready = deque()
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread_id = None
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self.add_reader(self._wake_read, self._read_wakeup)
+
+    def _wakeup(self):
+        if threading.get_ident() == self._thread_id:
+            return
+        try:
+            os.write(self._wake_write, b"\0")
+        except (BlockingIOError, OSError):
+            # loop is already woken up or closed
+            pass
+
+    def _read_wakeup(self):
+        try:
+            while os.read(self._wake_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def call_soon(self, callback, *args):
+        """Callback in the next iteration of loop (thread-safe).
+        """
+        with self._lock:
+            self._ready.append((callback, args))
+        self._wakeup()
+
+    def call_later(self, delay: float, callback, *args) -> Timer:
+        """Callback after delay (sec), thread-safe.
+        """
+        with self._lock:
+            timer = self.timers.add(delay, callback, *args)
+        self._wakeup()
+        return timer
+
+    def call_every(self, interval: float, callback, *args) -> Timer:
+        """Callback with interval (sec) until cancel of result.
+        """
+        handle = Timer(0, callback, args)
+
+        def repeat():
+            if not handle.cancelled:
+                callback(*args)
+                self.call_later(interval, repeat)
+
+        self.call_later(interval, repeat)
+        return handle
+
+    def add_reader(self, fd: int, callback):
+        """Callback() when fd is ready for reading.
+        """
+        self.selector.register(fd, selectors.EVENT_READ, callback)
+        self._wakeup()
+
+    def remove_reader(self, fd: int):
+        try:
+            self.selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+
+    def _call(self, callback, args: tuple):
+        try:
+            callback(*args)
+        except Exception as err:
+            self.logger.error(
+                "Callback {}: {}".format(
+                    getattr(callback, "__qualname__", callback), err))
+
+    def run_once(self):
+        """Wait for the next event or deadline and run callbacks.
+        """
+        with self._lock:
+            timeout = None
+            if self._ready:
+                timeout = 0
+            else:
+                deadline = self.timers.next_deadline()
+                if deadline is not None:
+                    timeout = max(deadline - self.timers.clock(), 0)
+
+        events = self.selector.select(timeout)
+        self.wakeups += 1
+        for key, _ in events:
+            self._call(key.data, ())
+
+        with self._lock:
+            callbacks = list(self._ready)
+            self._ready.clear()
+            callbacks.extend(
+                (timer.callback, timer.args)
+                for timer in self.timers.expire())
+
+        for callback, args in callbacks:
+            self._call(callback, args)
+
+    def run(self):
+        """Run loop until stop.
+        """
+        self._thread_id = threading.get_ident()
+        self._running = True
+        try:
+            while self._running:
+                self.run_once()
+        finally:
+            self._thread_id = None
+
+    def _stop(self):
+        self._running = False
+
+    def stop(self):
+        """Finish loop after current callbacks (thread-safe).
+        """
+        self.call_soon(self._stop)
+
+    def close(self):
+        self.selector.close()
+        os.close(self._wake_read)
+        os.close(self._wake_write)
+
+
+def inotify_fd(dir_path: str) -> int:
+    """Non-blocking inotify descriptor for writes and moves of files
+    in directory (None if inotify is not available).
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError, TypeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(
+            fd, os.fsencode(dir_path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def inotify_names(data: bytes) -> set:
+    """Names of files in inotify events.
+    """
+    result = set()
+    offset = 0
+    while offset + INOTIFY_EVENT.size <= len(data):
+        _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+        offset += INOTIFY_EVENT.size
+        result.add(data[offset:offset + length].rstrip(b"\0"))
+        offset += length
+    return result
+
+
+def stat_signature(path: str) -> tuple:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class FileWatch:
+    """Notifications about changes of file in event loop:
+    by inotify or by stat of file with interval.
+    """
+
+    def __init__(
+            self,
+            loop: EventLoop,
+            path: str,
+            callback,
+            interval: float=1.0):
+        self.loop = loop
+        self.path = path
+        self.callback = callback
+        self._timer = None
+        self._name = os.fsencode(os.path.basename(path))
+        self._signature = stat_signature(path)
+        self._fd = inotify_fd(os.path.dirname(os.path.abspath(path)))
+        if self._fd is None:
+            self._timer = loop.call_every(interval, self.check)
+        else:
+            loop.add_reader(self._fd, self.read_events)
+
+    @property
+    def mode(self) -> str:
+        return "stat" if self._fd is None else "inotify"
+
+    def check(self):
+        signature = stat_signature(self.path)
+        if signature != self._signature:
+            self._signature = signature
+            self.callback()
+
+    def read_events(self):
+        names = set()
+        try:
+            while True:
+                data = os.read(self._fd, 4096)
+                if not data:
+                    break
+                names |= inotify_names(data)
+        except BlockingIOError:
+            pass
+        if self._name in names:
+            self.callback()
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._fd is not None:
+            self.loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
@@ -8,7 +8,8 @@ from datetime import datetime
 from os.path import join as path_join
 
 from .const import (
-    WORK_DIR, PHOTO_SERIES, IMAGE_SIZE, CAMERA_FRAMERATE, SENSOR_PIN)
+    WORK_DIR, PHOTO_SERIES, IMAGE_SIZE, CAMERA_FRAMERATE, SENSOR_PIN,
+    SENSOR_BOUNCE_TIME)
 from .log import get_logger
 try:
     import picamera
@@ -42,6 +43,39 @@ def pin_send(pin: int, value: bool):
         print("fake pin ", pin, " to: ", value)
 
 
+# callbacks of edges without gpio (see fake_edge)
+fake_edge_callbacks = {}
+
+
+def add_edge_callback(
+        pin: int, callback, bouncetime: int=SENSOR_BOUNCE_TIME):
+    """Call callback(pin) on rising edge of input pin
+    (in thread of RPi.GPIO), without gpio callbacks are called by fake_edge.
+    """
+    if gpio:
+        if gpio.getmode() is None:
+            gpio.setmode(gpio.BOARD)
+        gpio.setup(pin, gpio.IN)
+        gpio.add_event_detect(
+            pin, gpio.RISING, callback=callback, bouncetime=bouncetime)
+    else:
+        fake_edge_callbacks.setdefault(pin, []).append(callback)
+
+
+def remove_edge_callback(pin: int):
+    if gpio:
+        gpio.remove_event_detect(pin)
+    else:
+        fake_edge_callbacks.pop(pin, None)
+
+
+def fake_edge(pin: int):
+    """Simulation of rising edge of pin.
+    """
+    for callback in fake_edge_callbacks.get(pin, ()):
+        callback(pin)
+
+
 def find_images(current_dir: str="./", exts=("jpg", "png", "jpeg", "gif")):
     """Images files in dir.
     """
@@ -73,7 +107,7 @@ def make_photos(
     call_code = uuid.uuid4().hex[:6]
     result = []
     if picamera is None:
-        logger.warning()
+        logger.warning("Camera is not available.")
         return result, call_code
     result.extend((
         os.path.join(WORK_DIR, "{}_{}{:02}.jpg".format(
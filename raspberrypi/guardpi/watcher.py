@@ -1,15 +1,17 @@
-import time
 from datetime import datetime
 from enum import Enum
-from threading import Thread
+from threading import Thread, current_thread
 
+from .capture import CameraRing, EventPackager, FrameRing
 from .conf import ProcessOption
 from .const import (
     CAMERA_FRAMERATE, LIGHT_PIN, SENSOR_PIN, SIREN_PIN,
-    LIGHT_AUTO_OFF)
+    LIGHT_AUTO_OFF, PRE_FRAMES)
+from .events import EventLoop
 from .log import get_logger
 from .helpers import (
-    pin_on, pin_off, pin_send, check_move, make_photos, record_event)
+    gpio, picamera, pin_on, pin_off, pin_send, check_move,
+    add_edge_callback, remove_edge_callback, fake_edge)
 
 
 class EquipmentThread(Thread):
@@ -66,25 +68,38 @@ class DeviceState(Enum):
     NOT_ACTIVE = 3
 
 
-class AutoOffDevice(EquipmentThread):
-    """Devices with state and auto off mode.
+class AutoOffDevice:
+    """Device with state and auto off deadline in event loop.
     """
     state = DeviceState.OFF
-    next_state = DeviceState.ON
     pin = 0
     dev_active_option_name = None
     auto_off_time = 1800
-    _last_change = 0
+    logger = loop = option = None
+    _deadline = None
+
+    def __init__(self, loop: EventLoop, option: ProcessOption):
+        self.logger = get_logger()
+        self.loop = loop
+        self.option = option
+        if self.read_global_state() == DeviceState.NOT_ACTIVE:
+            self.state = DeviceState.NOT_ACTIVE
+
+    def __str__(self):
+        return self.__class__.__name__
 
     def turn_on(self):
-        """Turn on siren.
+        """Turn on device (if it is active).
         """
-        self.next_state = DeviceState.ON
+        self.update_global_state()
+        if self.state != DeviceState.NOT_ACTIVE:
+            self.change_state(DeviceState.ON)
 
     def turn_off(self):
-        """Turn off siren.
+        """Turn off device.
         """
-        self.next_state = DeviceState.OFF
+        if self.state == DeviceState.ON:
+            self.change_state(DeviceState.OFF)
 
     def read_global_state(self):
         """Check option.
@@ -95,83 +110,91 @@ class AutoOffDevice(EquipmentThread):
             value = self.option.get(self.dev_active_option_name)
             return DeviceState.ON if value else DeviceState.NOT_ACTIVE
 
-    def change_state(self, update_time: bool=True) -> bool:
-        """Change state.
+    def update_global_state(self):
+        """Apply option after change of configuration.
+        """
+        if self.read_global_state() == DeviceState.NOT_ACTIVE:
+            self.change_state(DeviceState.NOT_ACTIVE)
+        elif self.state == DeviceState.NOT_ACTIVE:
+            self.state = DeviceState.OFF
+
+    def change_state(self, next_state: DeviceState) -> bool:
+        """Change state, auto off deadline from turning on.
         """
-        if self.state == self.next_state:
+        if self.state == next_state:
             return False
 
         try:
-            pin_send(self.pin, self.next_state == DeviceState.ON)
+            pin_send(self.pin, next_state == DeviceState.ON)
         except Exception as err:
             self.logger.error(
                 "Problem with pin {}: {}".format(self.pin, err))
-        else:
-            self.state = self.next_state
-            if update_time:
-                self._last_change = time.time()
+            return False
 
-    def check_timeout(self) -> bool:
-        """Check auto turn off.
+        last_state, self.state = self.state, next_state
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+        if next_state == DeviceState.ON:
+            self._deadline = self.loop.call_later(
+                self.auto_off_time, self.timeout)
+            self.started()
+        elif last_state == DeviceState.ON:
+            self.stopped()
+        return True
+
+    def timeout(self):
+        """Auto turn off.
         """
-        if self._last_change:
-            return self.auto_off_time < time.time() - self._last_change
-        else:
-            return False
+        self._deadline = None
+        self.logger.warning("Timeout in {}".format(self))
+        self.turn_off()
 
-    def action(self):
-        """Advanced action.
+    def started(self):
+        """Advanced action after turning on.
         """
         pass
 
-    def stop(self):
-        self.turn_off()
-        # wait action
-        time.time(self.iter_delay + 0.1)
-        return super().stop()
-
-    def run(self):
-        run_action = False
-        while self.is_alive():
-            run_action = False
-            global_state = self.read_global_state()
-            if global_state == DeviceState.NOT_ACTIVE:
-                self.next_state = global_state
-            elif self.check_timeout():
-                self.logger.warning(
-                    "Timeout in {}".format(self))
-                self.turn_off()
-            else:
-                run_action = True
-
-            self.change_state()
-            run_action and self.action()
-            time.sleep(self.iter_delay)
+    def stopped(self):
+        """Advanced action after turning off.
+        """
+        pass
 
 
 class SirenControl(AutoOffDevice):
-    """Siren control thread.
+    """Siren control.
     """
     pin = SIREN_PIN
     dev_active_option_name = "active_siren"
     auto_off_time = 10 * 60
     sound_pause = 1.0
+    _pulse = None
+    _sound = False
 
-    def action(self):
+    def started(self):
         """Sound with pauses.
         """
-        time.sleep(self.sound_pause)
-        self.turn_off()
-        self.change_state(update_time=False)
-        time.sleep(self.sound_pause)
-        self.turn_on()
-        self.change_state(update_time=False)
+        self._sound = True
+        self._pulse = self.loop.call_every(self.sound_pause, self.pulse)
+
+    def pulse(self):
+        self._sound = not self._sound
+        try:
+            pin_send(self.pin, self._sound)
+        except Exception as err:
+            self.logger.error(
+                "Problem with pin {}: {}".format(self.pin, err))
+
+    def stopped(self):
+        if self._pulse is not None:
+            self._pulse.cancel()
+            self._pulse = None
+        self._sound = False
 
 
 class LightControl(AutoOffDevice):
-    """Light control thread.
+    """Light control.
     """
-    iter_delay = 2.5
     pin = LIGHT_PIN
     dev_active_option_name = "active_light"
     auto_off_time = 15
@@ -185,42 +208,80 @@ class MoveWatcher(EquipmentThread):
         - recording photo series with a camera
         - turn on of a siren
         - prepare packages for sending
+    Edges of sensor, deadlines of devices and changes of configuration
+    are processed in one event loop of this thread,
+    photos and packages are made by worker of EventPackager.
     """
 
-    light_control = siren_control = None
-    iter_delay = 1
+    light_control = siren_control = loop = None
+    devices = packager = camera_ring = None
+    # check of fake sensor (without gpio)
+    fake_sensor_delay = 1
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.siren_control = SirenControl(option=self.option)
-        self.light_control = LightControl(option=self.option)
-        self.sub_threads.append(self.siren_control)
-        self.sub_threads.append(self.light_control)
-
-    def make_package(self, datet: datetime, photos: list, code: str) -> None:
-        """Record JSON file with this event.
+        self.loop = EventLoop()
+        self.siren_control = SirenControl(self.loop, self.option)
+        self.light_control = LightControl(self.loop, self.option)
+        self.devices = [self.siren_control, self.light_control]
+        ring = None
+        if PRE_FRAMES and picamera is not None:
+            # camera is used by ring of frames
+            ring = FrameRing(PRE_FRAMES)
+            self.camera_ring = CameraRing(ring)
+        self.packager = EventPackager(ring)
+
+    def edge(self, pin: int):
+        """Callback of sensor pin (thread of RPi.GPIO).
         """
-        try:
-            record_event(code, {"files": photos, "date": datet.isoformat()})
-        except Exception as err:
-            self.logger.error(
-                "Event '{}' recording error: {}".format(code, err))
-
-    def run(self):
-        while self.is_alive():
-            if self.option.active_guard and check_move():
-                self.logger.info("Detected!")
-                now = datetime.now()
-                self.light_control.turn_on()
-                photos, event_code = make_photos(
-                    logger=self.logger)
-                if photos:
-                    self.logger.info(
-                        "Photo in: {}".format(", ".join(photos)))
-                    make_photos(now, photos, event_code)
-                else:
-                    self.logger.warning("Photos do not done.")
+        self.loop.call_soon(self.detected)
+
+    def detected(self):
+        if not self.option.active_guard:
+            return
+
+        self.logger.info("Detected!")
+        now = datetime.now()
+        self.light_control.turn_on()
+        self.packager.submit(now)
+        self.siren_control.turn_on()
+
+    def option_changed(self, fields: set):
+        self.logger.info(
+            "Configuration changed: {}".format(", ".join(sorted(fields))))
+        for device in self.devices:
+            device.update_global_state()
+
+    def fake_sensor(self):
+        if check_move():
+            fake_edge(SENSOR_PIN)
+
+    def shutdown(self):
+        """Turn off devices and finish loop (in loop).
+        """
+        for device in self.devices:
+            device.turn_off()
+        self.loop.stop()
 
-                self.siren_control.turn_on()
+    def stop(self):
+        self.loop.call_soon(self.shutdown)
+        if self.is_alive() and current_thread() is not self:
+            self.join()
+        self.logger.info("{} finished..".format(self))
 
-            time.sleep(self.iter_delay)
+    def run(self):
+        self.packager.start()
+        if self.camera_ring is not None:
+            self.camera_ring.start()
+        self.option.watch(self.loop, self.option_changed)
+        add_edge_callback(SENSOR_PIN, self.edge)
+        if gpio is None:
+            self.loop.call_every(self.fake_sensor_delay, self.fake_sensor)
+        try:
+            self.loop.run()
+        finally:
+            remove_edge_callback(SENSOR_PIN)
+            self.option.unwatch()
+            if self.camera_ring is not None:
+                self.camera_ring.stop()
+            self.packager.stop()
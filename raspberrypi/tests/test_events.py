@@ -0,0 +1,53 @@
+from guardpi.events import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_timer_wheel_expire():
+    """Deadlines in order of time, cancelled timers are dropped.
+    """
+    clock = FakeClock()
+    wheel = TimerWheel(tick=1, slots=8, clock=clock)
+    late = wheel.add(3, "late")
+    early = wheel.add(2.5, "early")
+    wheel.add(3, "cancelled").cancel()
+    assert wheel.next_deadline() == 3
+
+    clock.now = 2
+    assert wheel.expire() == []
+    clock.now = 3
+    assert wheel.expire() == [early, late]
+    assert wheel.count == 0
+    assert wheel.next_deadline() is None
+
+
+def test_timer_wheel_full_turn():
+    """Deadline after full turn of wheel stays in slot until its time,
+    expiration after long pause checks each slot once.
+    """
+    clock = FakeClock()
+    wheel = TimerWheel(tick=1, slots=8, clock=clock)
+    near = wheel.add(3, "near")
+    # the same slot as 4 and 12
+    far = wheel.add(20, "far")
+
+    clock.now = 5
+    assert wheel.expire() == [near]
+    assert wheel.count == 1
+
+    clock.now = 12
+    assert wheel.expire() == []
+    assert wheel.count == 1
+
+    # more than full turn from the last expiration
+    clock.now = 30
+    late = wheel.add(0, "late")
+    assert wheel.expire() == [far, late]
+    assert wheel.count == 0
+    assert all(not slot for slot in wheel.slots)
@@ -0,0 +1,102 @@
+import functools
+import json
+import logging
+import time
+
+import pytest
+
+from guardpi import helpers, init_logger, watcher
+from guardpi.conf import ProcessOption
+from guardpi.const import LIGHT_PIN, SENSOR_PIN, SIREN_PIN
+from guardpi.events import EventLoop
+from guardpi.watcher import DeviceState
+
+pytestmark = pytest.mark.skipif(
+    helpers.gpio is not None, reason="edges of fake gpio only"
+)
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def pin_values(monkeypatch) -> list:
+    """Values (pin, value) sent to output pins.
+    """
+    values = []
+    monkeypatch.setattr(
+        watcher, "pin_send", lambda pin, value: values.append((pin, value))
+    )
+    return values
+
+
+@pytest.fixture
+def move_watcher(tmp_path, monkeypatch, pin_values):
+    """Started watcher with short deadlines and configuration in tmp_path.
+    """
+    init_logger(logging.getLogger("guardpi-test"))
+    monkeypatch.setattr(ProcessOption, "_file", str(tmp_path / "conf.json"))
+    monkeypatch.setattr(
+        watcher, "EventLoop", functools.partial(EventLoop, tick=0.01)
+    )
+    monkeypatch.setattr(watcher.LightControl, "auto_off_time", 0.2)
+    monkeypatch.setattr(watcher.SirenControl, "sound_pause", 0.02)
+    # without random moves of fake sensor
+    monkeypatch.setattr(watcher.MoveWatcher, "fake_sensor_delay", 1000)
+    move_watcher = watcher.MoveWatcher()
+    move_watcher.start()
+    assert wait_for(lambda: SENSOR_PIN in helpers.fake_edge_callbacks)
+    yield move_watcher
+    move_watcher.stop()
+    assert not move_watcher.is_alive()
+
+
+def test_fake_edge_detection(move_watcher, pin_values: list):
+    """Edge of sensor turns on light and siren, light is turned off
+    by deadline, siren is stopped by change of configuration file.
+    """
+    light = move_watcher.light_control
+    siren = move_watcher.siren_control
+    helpers.fake_edge(SENSOR_PIN)
+    assert wait_for(
+        lambda: light.state == siren.state == DeviceState.ON
+    )
+    assert (LIGHT_PIN, True) in pin_values
+
+    # sound with pauses
+    assert wait_for(
+        lambda: pin_values.count((SIREN_PIN, False)) >= 2
+    )
+
+    assert wait_for(lambda: light.state == DeviceState.OFF)
+    assert pin_values.count((LIGHT_PIN, False)) == 1
+    assert siren.state == DeviceState.ON
+
+    with open(ProcessOption._file) as conf_file:
+        state = json.load(conf_file)
+    state["active_siren"] = False
+    with open(ProcessOption._file, "w") as conf_file:
+        conf_file.write(json.dumps(state))
+
+    assert wait_for(lambda: siren.state == DeviceState.NOT_ACTIVE)
+    count = len(pin_values)
+    time.sleep(0.1)
+    assert pin_values[-1] == (SIREN_PIN, False)
+    assert len(pin_values) == count
+
+
+def test_fake_edge_without_guard(move_watcher, pin_values: list):
+    """Without active guard edges are ignored.
+    """
+    move_watcher.option.active_guard = False
+    helpers.fake_edge(SENSOR_PIN)
+    time.sleep(0.1)
+    assert move_watcher.light_control.state == DeviceState.OFF
+    assert move_watcher.siren_control.state == DeviceState.OFF
+    assert not pin_values
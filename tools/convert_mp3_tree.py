@@ -1,28 +1,18 @@
 # run as:
 # python convert_mp3_tree.py media/music/Iron\ Maiden/ media/music/all_files
 # python convert_mp3_tree.py media/music/Nightwish/ media/music/all_files 20
+# python convert_mp3_tree.py media/music/ media/music/all_files --jobs 4
+# (finished files are listed in manifest of result directory,
+# up-to-date results are skipped after restart)
 
+import argparse
+import json
 import os
-import sys
 import re
+import subprocess
+import time
 import typing
-
-
-def clear_path(
-    path: str,
-    replace_parts: typing.List[typing.Tuple[str, str]] = [
-        (" ", "\\ "),
-        ("(", "\\("),
-        (")", "\\)"),
-    ]
-) -> str:
-    """Format to cli file path.
-    """
-    for item in replace_parts:
-        path = path.replace(*item)
-
-    return path
-
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 bitrate_class = 5
 # lame option	Average kbit/s	Bitrate range kbit/s	ffmpeg option
@@ -40,65 +30,264 @@ bitrate_class = 5
 
 nums_rx = re.compile(r"\d+")
 bad_ch_rx = re.compile(r"[)('`]+")
-_, src_path, res_path, *other = sys.argv
 
 input_formats = [
     "m4a", "mp3", "flac", "aac", "alac"
 ]
-
-cmd_tmp = "ffmpeg -i {} -codec:a libmp3lame -qscale:a {} {}"  # -ar 44100
 input_formats = set(map(".{}".format, input_formats))
-albums = {}
-
-albums_index = count = res_file_size = src_file_size = 0
-if other:
-    start_index, *_ = other
-    albums_index = int(start_index) - 1
-
-all_tree = sorted(
-    (root, name)
-    for root, _, files in os.walk(src_path, topdown=False)
-    for name in files
-    if any(ext in name for ext in input_formats)
-)
-
-for root, name in all_tree:
-    if root in albums:
-        index, prefix = albums[root]
-    else:
-        albums_index += 1
-        index = albums_index
-        sub_path = root.replace(src_path, "")
-        nums = " ".join(nums_rx.findall(sub_path))
-        prefix = f"{index:0>3} {nums}"
-        albums[root] = index, prefix
-
-    new_name = " ".join(name.lower().split(" "))
-    *parts, _ = new_name.split(".")
-    new_name = " ".join(parts)
-    new_name = f"{prefix}_{new_name}"
-    new_name = "_".join(bad_ch_rx.split(new_name))
-    new_name = f"{new_name}.mp3".replace("  ", " ")
-    res_file = os.path.join(res_path, f"{prefix}_{new_name}")
-    src = os.path.join(root, name)
-    cmd = cmd_tmp.format(
-        clear_path(src), bitrate_class, clear_path(res_file)
+
+MANIFEST_NAME = ".convert_manifest.jsonl"
+MB = 1048576
+
+
+class Job(typing.NamedTuple):
+    src: str
+    res_file: str
+    name: str
+    new_name: str
+
+
+def convert_cmd(src: str, res_file: str) -> typing.List[str]:
+    """Arguments of ffmpeg (without shell), result is written as mp3
+    to res_file.
+    """
+    return [
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", src,
+        "-codec:a", "libmp3lame", "-qscale:a", str(bitrate_class),  # -ar 44100
+        "-f", "mp3", res_file,
+    ]
+
+
+def tree_jobs(
+    src_path: str, res_path: str, albums_index: int = 0
+) -> typing.Tuple[typing.List[Job], typing.Dict[str, tuple]]:
+    """Jobs for all files of tree and albums (index, prefix),
+    names of results do not depend on done files, sources with the same
+    result name (song.flac and song.mp3) get suffix " (2)", " (3)", ...
+    """
+    albums = {}
+    res_files = set()
+    all_tree = sorted(
+        (root, name)
+        for root, _, files in os.walk(src_path, topdown=False)
+        for name in files
+        if any(ext in name for ext in input_formats)
     )
-    print("---------------------------------\n", name, "->", new_name)
-    os.system(cmd)
-    count += 1
-    src_file_size += int(os.path.getsize(src) or 0)
+    jobs = []
+    for root, name in all_tree:
+        if root in albums:
+            index, prefix = albums[root]
+        else:
+            albums_index += 1
+            index = albums_index
+            sub_path = root.replace(src_path, "")
+            nums = " ".join(nums_rx.findall(sub_path))
+            prefix = f"{index:0>3} {nums}"
+            albums[root] = index, prefix
+
+        new_name = " ".join(name.lower().split(" "))
+        *parts, _ = new_name.split(".")
+        new_name = " ".join(parts)
+        new_name = f"{prefix}_{new_name}"
+        new_name = "_".join(bad_ch_rx.split(new_name))
+        new_name = f"{new_name}.mp3".replace("  ", " ")
+        res_file = os.path.join(res_path, f"{prefix}_{new_name}")
+        if res_file in res_files:
+            base_name, ext = os.path.splitext(new_name)
+            number = 2
+            while res_file in res_files:
+                new_name = f"{base_name} ({number}){ext}"
+                res_file = os.path.join(res_path, f"{prefix}_{new_name}")
+                number += 1
+
+        res_files.add(res_file)
+        jobs.append(Job(os.path.join(root, name), res_file, name, new_name))
+
+    return jobs, albums
+
+
+def read_manifest(res_path: str) -> typing.Dict[str, dict]:
+    """The last records of converted files by source path.
+    """
+    path = os.path.join(res_path, MANIFEST_NAME)
+    result = {}
+    if not os.path.exists(path):
+        return result
+
+    with open(path) as manifest:
+        for line in manifest:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # a line from interrupted writing
+                continue
+            result[item["src"]] = item
+
+    return result
+
+
+def is_done(job: Job, record: typing.Optional[dict]) -> bool:
+    """Result is up to date: it is not older than source and
+    sizes are the same as in manifest (without record - result is not empty).
+    """
     try:
-        res_file_size += int(os.path.getsize(res_file) or 0)
-    except Exception:
-        continue
-
-print(
-    f"files count: {count}\n"
-    f"source files size: {src_file_size / 1048576:.2f} mb\n"
-    f"result files size: {res_file_size / 1048576:.2f} mb\n"
-    "albums (max index {}):\n{}\n".format(
-        albums_index,
-        "\n".join(map(" {}".format, albums))
+        src_stat = os.stat(job.src)
+        res_stat = os.stat(job.res_file)
+    except OSError:
+        return False
+
+    if res_stat.st_mtime < src_stat.st_mtime or not res_stat.st_size:
+        return False
+
+    if record is None:
+        return True
+
+    return (
+        record["res_file"] == job.res_file
+        and record["src_size"] == src_stat.st_size
+        and record["src_mtime"] == src_stat.st_mtime
+        and record["res_size"] == res_stat.st_size
+    )
+
+
+def convert(job: Job) -> dict:
+    """Transcode to temporary file and rename it to result.
+    """
+    start_time = time.monotonic()
+    src_stat = os.stat(job.src)
+    tmp_file = f"{job.res_file}.part"
+    proc = subprocess.run(
+        convert_cmd(job.src, tmp_file),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    result = {
+        "src": job.src,
+        "res_file": job.res_file,
+        "src_size": src_stat.st_size,
+        "src_mtime": src_stat.st_mtime,
+        "res_size": 0,
+        "code": proc.returncode,
+        "error": proc.stderr.decode(errors="replace").strip(),
+        "time": time.monotonic() - start_time,
+    }
+    if proc.returncode == 0 and os.path.exists(tmp_file):
+        os.replace(tmp_file, job.res_file)
+        result["res_size"] = os.path.getsize(job.res_file)
+    elif os.path.exists(tmp_file):
+        os.remove(tmp_file)
+
+    return result
+
+
+def run_jobs(
+    jobs: typing.List[Job], res_path: str, workers: int = None
+) -> typing.Dict[str, int]:
+    """Transcode files by workers processes of ffmpeg at the same time,
+    up-to-date results are skipped, finished files are added to manifest.
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(res_path, exist_ok=True)
+    done = read_manifest(res_path)
+    todo = []
+    stat = {
+        "count": 0, "skipped": 0, "errors": 0,
+        "src_size": 0, "res_size": 0,
+    }
+    for job in jobs:
+        if is_done(job, done.get(job.src)):
+            stat["skipped"] += 1
+        else:
+            todo.append(job)
+
+    print(f"files: {len(jobs)} skipped: {stat['skipped']} jobs: {workers}")
+    start_time = time.monotonic()
+    manifest_path = os.path.join(res_path, MANIFEST_NAME)
+
+    def record(job: Job, future):
+        try:
+            item = future.result()
+        except Exception as err:
+            stat["errors"] += 1
+            print("Error", err, "in", job.src)
+            return
+
+        if item["code"] or not item["res_size"]:
+            stat["errors"] += 1
+            print("Error", item["code"], "in", job.src, item["error"])
+            return
+
+        manifest.write(json.dumps(item) + "\n")
+        manifest.flush()
+        stat["count"] += 1
+        stat["src_size"] += item["src_size"]
+        stat["res_size"] += item["res_size"]
+        spent = time.monotonic() - start_time
+        print(
+            f"[{stat['count'] + stat['errors']}/{len(todo)}]",
+            job.name, "->", job.new_name,
+            f"{stat['src_size'] / MB / spent:.2f} mb/s" if spent else "",
+        )
+
+    with ThreadPoolExecutor(
+        max_workers=workers
+    ) as executor, open(manifest_path, "a") as manifest:
+        futures = {executor.submit(convert, job): job for job in todo}
+        try:
+            for future in as_completed(futures):
+                record(futures.pop(future), future)
+        except KeyboardInterrupt:
+            # queued jobs are cancelled, running ones are finished
+            # and recorded to manifest (next run continues)
+            print("Interrupted, waiting for running jobs")
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, job in futures.items():
+                if not future.cancelled():
+                    record(job, future)
+
+    stat["time"] = time.monotonic() - start_time
+    return stat
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Convert audio files of tree to mp3 files in directory"
+    )
+    parser.add_argument("src_path")
+    parser.add_argument("res_path")
+    parser.add_argument(
+        "start_index", nargs="?", type=int, default=1,
+        help="index of the first album"
     )
-)
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="ffmpeg processes at the same time"
+    )
+    args = parser.parse_args()
+
+    jobs, albums = tree_jobs(
+        args.src_path, args.res_path, args.start_index - 1
+    )
+    stat = run_jobs(jobs, args.res_path, args.jobs)
+    spent = stat["time"]
+    albums_index = max(
+        (index for index, _ in albums.values()), default=args.start_index - 1
+    )
+    print(
+        f"files count: {stat['count']}\n"
+        f"skipped files: {stat['skipped']}\n"
+        f"errors: {stat['errors']}\n"
+        f"source files size: {stat['src_size'] / MB:.2f} mb\n"
+        f"result files size: {stat['res_size'] / MB:.2f} mb\n"
+        f"time: {spent:.2f} sec "
+        f"({stat['src_size'] / MB / spent if spent else 0:.2f} mb/s)\n"
+        "albums (max index {}):\n{}\n".format(
+            albums_index,
+            "\n".join(map(" {}".format, albums))
+        )
+    )
+
+
+if __name__ == "__main__":
+    run()